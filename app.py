@@ -2,12 +2,34 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from scipy.optimize import linear_sum_assignment
+import joblib
+from joblib import Parallel, delayed
 from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from io import BytesIO
+from openpyxl import Workbook
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.csv as pacsv
+import gzip
+import zipfile
+import tempfile
 import urllib.parse
+import hashlib
+import json
+import os
+import time
+import re
+import string
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import uuid
+from difflib import SequenceMatcher
 
 # ============================================================
 # KONFIGURASI HALAMAN
@@ -850,87 +872,1683 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# ============================================================
+# FUNGSI BACA FILE (STREAMING PER CHUNK & CACHE UPLOAD)
+# ============================================================
+
+STREAM_CHUNK_SIZE = 100000
+
+# Folder data lokal (cache, penyimpanan, model) - bisa diganti lewat environment
+DATA_DIR = os.environ.get('ANTY_DATA_DIR', '.anty_data')
+UPLOAD_CACHE_DIR = os.path.join(DATA_DIR, 'upload_cache')
+UPLOAD_CACHE_MAX_BYTES = int(os.environ.get('ANTY_UPLOAD_CACHE_MB', '500')) * 1024 * 1024
+# Naikkan jika cara read_upload mem-parse file berubah (entri cache lama otomatis tidak dipakai)
+UPLOAD_PARSE_VERSION = 1
+
+
+def read_header(source, file_name):
+    """Membaca baris header saja (tanpa memuat isi file)"""
+    if file_name.endswith('.csv'):
+        header = list(pd.read_csv(source, nrows=0).columns)
+    elif file_name.endswith('.xls'):
+        header = list(pd.read_excel(source, nrows=0).columns)
+    else:
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            header = list(next(workbook.active.iter_rows(max_row=1, values_only=True), ()))
+        finally:
+            workbook.close()
+    
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return header
+
+
+def resolve_upload_columns(source, file_name):
+    """Menentukan kolom yang perlu dibaca dari header saja (aturan find_column yang sama)
+
+    Return (daftar kolom, dtype) atau (None, None) jika kolom wajib tidak ditemukan,
+    sehingga file dibaca utuh dan pesan error tetap muncul di load_and_clean_data.
+    """
+    col_mapping = AntyLaundryKMeans().match_columns(read_header(source, file_name))
+    required = [target for target, _, _, _, is_required in COLUMN_RULES if is_required]
+    if not set(required) <= set(col_mapping.values()):
+        return None, None
+    
+    dtypes = {col: str for col, target in col_mapping.items() if target in TEXT_COLUMNS}
+    return list(col_mapping), dtypes
+
+
+def iter_file_chunks(source, file_name, chunksize=STREAM_CHUNK_SIZE, columns=None, max_rows=None):
+    """Membaca file Excel/CSV per potongan (chunk) berukuran tetap
+    
+    `columns` membatasi kolom yang dibaca, `max_rows` membatasi jumlah baris (untuk preview).
+    """
+    if file_name.endswith('.csv'):
+        # dtype=str agar tipe kolom konsisten antar chunk (mis. No Nota angka/teks)
+        for chunk in pd.read_csv(source, chunksize=chunksize, dtype=str, usecols=columns, nrows=max_rows):
+            yield chunk
+        return
+    
+    if file_name.endswith('.xls'):
+        # Format .xls lama tidak didukung openpyxl, terpaksa dibaca utuh
+        df = pd.read_excel(source, usecols=columns, nrows=max_rows)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+    
+    from openpyxl import load_workbook
+    
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        
+        if columns is None:
+            indices = list(range(len(header)))
+        else:
+            indices = [header.index(col) for col in columns]
+        names = [header[i] for i in indices]
+        
+        buffer = []
+        read = 0
+        for row in rows:
+            if max_rows is not None and read >= max_rows:
+                break
+            buffer.append([row[i] if i < len(row) else None for i in indices])
+            read += 1
+            if len(buffer) >= chunksize:
+                yield pd.DataFrame(buffer, columns=names)
+                buffer = []
+        
+        if buffer:
+            yield pd.DataFrame(buffer, columns=names)
+    finally:
+        workbook.close()
+
+
+def read_preview(source, file_name, n_rows=10):
+    """Membaca N baris pertama saja untuk preview"""
+    if file_name.endswith('.csv'):
+        preview = pd.read_csv(source, nrows=n_rows)
+    elif file_name.endswith('.xls'):
+        preview = pd.read_excel(source, nrows=n_rows)
+    else:
+        preview = next(iter_file_chunks(source, file_name, chunksize=n_rows, max_rows=n_rows), pd.DataFrame())
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return preview
+
+
+def read_upload(source, file_name):
+    """Membaca file upload (Excel/CSV) ke DataFrame, hanya kolom yang dibutuhkan
+
+    Kolom ditentukan dari header saja; .xlsx dibaca dengan mode read-only (streaming).
+    """
+    columns, dtypes = resolve_upload_columns(source, file_name)
+    
+    if file_name.endswith('.csv'):
+        return pd.read_csv(source, usecols=columns, dtype=dtypes)
+    if file_name.endswith('.xls') or columns is None:
+        return pd.read_excel(source, usecols=columns, dtype=dtypes)
+    
+    chunks = list(iter_file_chunks(source, file_name, columns=columns))
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(chunks, ignore_index=True)
+    for col in dtypes:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+
+def file_fingerprint(data):
+    """Hash isi file (bytes) sebagai kunci cache"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def upload_cache_key(data):
+    """Kunci cache upload = hash isi file + hash aturan kolom & setelan parse
+
+    read_upload hanya membaca kolom yang cocok dengan COLUMN_RULES (bertipe teks sesuai
+    TEXT_COLUMNS), jadi entri cache dari aturan lama tidak boleh dipakai lagi.
+    """
+    schema = repr((COLUMN_RULES, TEXT_COLUMNS, UPLOAD_PARSE_VERSION)).encode('utf-8')
+    return f"{file_fingerprint(data)}-{file_fingerprint(schema)[:8]}"
+
+
+def _evict_upload_cache(max_bytes=UPLOAD_CACHE_MAX_BYTES):
+    """Hapus file cache yang paling lama tidak dipakai sampai ukuran total di bawah batas"""
+    entries = []
+    for name in os.listdir(UPLOAD_CACHE_DIR):
+        path = os.path.join(UPLOAD_CACHE_DIR, name)
+        stat = os.stat(path)
+        entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+
+def read_upload_cached(uploaded_file):
+    """Membaca file upload dengan cache Parquet berdasarkan hash isi file (LRU)
+
+    Return (DataFrame, from_cache). File yang isinya sama (dengan aturan kolom yang sama)
+    tidak di-parse ulang.
+    """
+    key = upload_cache_key(uploaded_file.getvalue())
+    os.makedirs(UPLOAD_CACHE_DIR, exist_ok=True)
+    
+    for ext, reader in (('.parquet', pd.read_parquet), ('.pkl', pd.read_pickle)):
+        path = os.path.join(UPLOAD_CACHE_DIR, key + ext)
+        if os.path.exists(path):
+            os.utime(path)  # tandai baru dipakai (untuk LRU)
+            return reader(path), True
+    
+    df = read_upload(uploaded_file, uploaded_file.name)
+    
+    path = os.path.join(UPLOAD_CACHE_DIR, key + '.parquet')
+    try:
+        df.to_parquet(path, index=False)
+    except Exception:
+        # Kolom campuran (angka + teks) tidak bisa disimpan sebagai Parquet
+        if os.path.exists(path):
+            os.remove(path)
+        df.to_pickle(os.path.join(UPLOAD_CACHE_DIR, key + '.pkl'))
+    
+    _evict_upload_cache()
+    return df, False
+
+
+# ============================================================
+# PENYIMPANAN TRANSAKSI LOKAL (PARTISI PER BULAN)
+# ============================================================
+
+STORE_DIR = os.path.join(DATA_DIR, 'transactions')
+STORE_COLUMNS = ['Tanggal', 'Konsumen', 'Total_Harga', 'No_Invoice', 'Status_Order', 'Tanggal_Order', 'Telepon']
+# Kolom kunci dedup baris (Telepon tidak ikut agar kunci baris lama yang sudah tersimpan tetap sama)
+ROW_KEY_COLUMNS = ['Tanggal', 'Konsumen', 'Total_Harga', 'No_Invoice', 'Status_Order', 'Tanggal_Order']
+
+
+class RowOccurrences:
+    """Jumlah kemunculan tiap hash baris selama satu impor, dibawa antar chunk
+
+    Baris kembar dalam satu nota yang terpotong batas chunk tetap mendapat urutan
+    kemunculan lanjutan, sehingga kuncinya sama dengan saat file dibaca sekaligus.
+    Disimpan sebagai array hash terurut + jumlah (16 byte per hash unik).
+    """
+    
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+    
+    def _find(self, hashes):
+        """Posisi tiap hash di array terurut + penanda apakah sudah tercatat"""
+        if not len(self.hashes):
+            return np.zeros(len(hashes), dtype=np.int64), np.zeros(len(hashes), dtype=bool)
+        pos = np.minimum(np.searchsorted(self.hashes, hashes), len(self.hashes) - 1)
+        return pos, self.hashes[pos] == hashes
+    
+    def number(self, row_hash):
+        """Urutan kemunculan tiap baris (lanjutan dari chunk sebelumnya), lalu catat jumlahnya"""
+        occurrence = pd.Series(row_hash).groupby(row_hash).cumcount().to_numpy(copy=True)
+        pos, found = self._find(row_hash)
+        occurrence[found] += self.counts[pos[found]]
+        
+        hashes, counts = np.unique(row_hash, return_counts=True)
+        pos, known = self._find(hashes)
+        self.counts[pos[known]] += counts[known]
+        merged = np.concatenate([self.hashes, hashes[~known]])
+        order = np.argsort(merged, kind='stable')
+        self.hashes = merged[order]
+        self.counts = np.concatenate([self.counts, counts[~known]])[order]
+        return occurrence
+
+
+def row_keys(df, occurrences=None):
+    """Kunci dedup per baris = hash isi baris (bentuk kanonik) + urutan kemunculan
+
+    Hash bergantung pada tipe data (int64 vs float64, resolusi tanggal), jadi harga
+    diseragamkan ke float64 dan tanggal ke datetime64[ns]: baris yang sama selalu
+    mendapat kunci yang sama walau chunk lain berisi harga kosong. Baris kembar dalam
+    satu nota tetap dihitung lewat urutan kemunculannya; `occurrences` (RowOccurrences)
+    melanjutkan hitungan dari chunk sebelumnya pada impor yang sama.
+    """
+    canonical = df[ROW_KEY_COLUMNS].assign(
+        Tanggal=df['Tanggal'].astype('datetime64[ns]'),
+        Tanggal_Order=pd.to_datetime(df['Tanggal_Order']).astype('datetime64[ns]'),
+        Total_Harga=df['Total_Harga'].astype('float64')
+    )
+    row_hash = pd.util.hash_pandas_object(canonical, index=False)
+    if occurrences is None:
+        occurrence = row_hash.groupby(row_hash).cumcount().values
+    else:
+        occurrence = occurrences.number(row_hash.values)
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({'hash': row_hash.values, 'n': occurrence}), index=False
+    ).values
+
+
+class TransactionStore:
+    """Penyimpanan transaksi lokal, satu file Parquet per bulan (berdasarkan Tanggal)"""
+    
+    def __init__(self, path=STORE_DIR):
+        self.path = path
+    
+    def _partition_path(self, month):
+        return os.path.join(self.path, f"{month}.parquet")
+    
+    def months(self):
+        """Daftar partisi bulan yang tersimpan (format YYYY-MM), urut naik"""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[:-len('.parquet')] for name in os.listdir(self.path) if name.endswith('.parquet'))
+    
+    def _read(self, months):
+        frames = [pd.read_parquet(self._partition_path(month)) for month in months]
+        if not frames:
+            return pd.DataFrame(columns=STORE_COLUMNS)
+        df = pd.concat(frames, ignore_index=True).drop(columns=['_row_key'])
+        # Kolom opsional yang tidak pernah ada di file export tidak ikut dikembalikan
+        return df.dropna(axis=1, how='all')
+    
+    def append(self, df, occurrences=None, date_formats=None):
+        """Menambahkan transaksi (kolom sudah distandarkan) dengan dedup per No_Invoice + isi baris
+
+        Impor per chunk: berikan RowOccurrences yang sama untuk semua chunk satu file, agar
+        baris kembar yang terpotong batas chunk tidak dianggap duplikat, dan `date_formats`
+        yang sama agar format tanggal hanya dideteksi sekali (lihat parse_dates).
+        Return (baris baru yang benar-benar ditambahkan, jumlah duplikat).
+        """
+        df = df[[col for col in STORE_COLUMNS if col in df.columns]].copy()
+        
+        # Normalisasi tipe agar konsisten antar file export
+        df['Tanggal'] = parse_dates(df['Tanggal'], date_formats)[0]
+        if 'Tanggal_Order' in df.columns:
+            df['Tanggal_Order'] = parse_dates(df['Tanggal_Order'], date_formats)[0]
+            df['Tanggal'] = df['Tanggal'].fillna(df['Tanggal_Order'])
+        df = df.dropna(subset=['Tanggal'])
+        
+        df['Total_Harga'] = pd.to_numeric(df['Total_Harga'], errors='coerce')
+        for col in ['Konsumen', 'No_Invoice', 'Status_Order', 'Telepon']:
+            if col in df.columns:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str)).astype(object)
+        
+        for col in STORE_COLUMNS:
+            if col not in df.columns:
+                df[col] = pd.NaT if col == 'Tanggal_Order' else None
+        df = df[STORE_COLUMNS]
+        
+        df['_row_key'] = row_keys(df, occurrences)
+        
+        os.makedirs(self.path, exist_ok=True)
+        new_parts = []
+        for month, part in df.groupby(df['Tanggal'].dt.strftime('%Y-%m')):
+            path = self._partition_path(month)
+            if os.path.exists(path):
+                existing = pd.read_parquet(path)
+                # Kunci partisi lama dihitung ulang (partisi dari versi sebelumnya memakai hash yang bergantung tipe)
+                existing['_row_key'] = row_keys(existing)
+                part = part[~part['_row_key'].isin(existing['_row_key'])]
+                if part.empty:
+                    continue
+                combined = pd.concat([existing, part], ignore_index=True)
+            else:
+                combined = part
+            new_parts.append(part)
+            
+            tmp_path = path + '.tmp'
+            combined.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+        
+        if not new_parts:
+            return df.iloc[:0].drop(columns=['_row_key']), len(df)
+        new_rows = pd.concat(new_parts).drop(columns=['_row_key'])
+        return new_rows, len(df) - len(new_rows)
+    
+    def max_date(self):
+        """Tanggal transaksi terakhir yang tidak BATAL"""
+        for month in reversed(self.months()):
+            part = self._read([month])
+            if 'Status_Order' in part.columns:
+                part = part[~part['Status_Order'].astype(str).str.lower().str.contains('batal', na=False)]
+            if not part.empty:
+                return part['Tanggal'].max()
+        return None
+    
+    def load_window(self, months_back=1):
+        """Hanya membaca partisi bulan yang masuk periode filter"""
+        max_date = self.max_date()
+        if max_date is None:
+            return pd.DataFrame(columns=STORE_COLUMNS)
+        
+        cutoff_month = (max_date - timedelta(days=30 * months_back)).strftime('%Y-%m')
+        return self._read([month for month in self.months() if month >= cutoff_month])
+    
+    def summary(self):
+        """Ringkasan isi penyimpanan per bulan"""
+        rows = []
+        for month in self.months():
+            part = pd.read_parquet(self._partition_path(month), columns=['No_Invoice'])
+            rows.append({'Bulan': month, 'Baris': len(part), 'Nota': part['No_Invoice'].nunique()})
+        return pd.DataFrame(rows, columns=['Bulan', 'Baris', 'Nota'])
+
+
+# ============================================================
+# AGREGAT RFM INKREMENTAL (PER PELANGGAN)
+# ============================================================
+
+RFM_STATE_DIR = os.path.join(DATA_DIR, 'rfm_state')
+RFM_AGGREGATIONS = {'First_Visit': 'min', 'Last_Visit': 'max', 'Invoices': 'sum', 'Monetary': 'sum'}
+
+
+def merge_customer_runs(*runs):
+    """Gabungkan beberapa agregat pelanggan (index Konsumen) menjadi satu"""
+    dtypes = runs[0].dtypes.to_dict()
+    return pd.concat(runs).groupby(level=0, sort=False).agg(RFM_AGGREGATIONS).astype(dtypes).rename_axis('Konsumen')
+
+
+def merge_key_runs(*runs):
+    """Gabungkan beberapa array hash nota terurut menjadi satu array terurut"""
+    return np.sort(np.concatenate(runs), kind='stable')
+
+
+class RFMState:
+    """Agregat per pelanggan (kunjungan pertama/terakhir, jumlah nota, total belanja)
+
+    Diperbarui hanya dari transaksi baru. R/F/M untuk tanggal referensi apa pun
+    diturunkan dari agregat ini, hasilnya sama dengan menghitung ulang seluruh riwayat.
+
+    Agregat pelanggan dan hash (Konsumen, No_Invoice) yang sudah dihitung disimpan sebagai
+    run append-only (gaya LSM): tiap batch menambah satu run kecil, dan run yang ukurannya
+    mirip digabung (size-tiered), sehingga update & save ∝ ukuran batch (amortisasi log n)
+    dan tidak pernah menulis ulang seluruh state. manifest.json (diganti atomik) mencatat
+    run yang aktif; file state format lama dibaca sebagai run tertua.
+    """
+    
+    def __init__(self, path=RFM_STATE_DIR):
+        self.path = path
+        self.manifest_path = os.path.join(path, 'manifest.json')
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest:
+                self.manifest = json.load(manifest)
+        else:
+            legacy = {'customers': 'customers.parquet', 'invoice_keys': 'invoice_keys.npy'}
+            self.manifest = {
+                name: [file_name] if os.path.exists(os.path.join(path, file_name)) else []
+                for name, file_name in legacy.items()
+            }
+        # Run dimuat saat pertama dibutuhkan: [nama file atau None (belum disimpan), data]
+        self._runs = {}
+        self._obsolete = []
+        self._customers = None
+    
+    def _load_runs(self, name):
+        if name not in self._runs:
+            reader = pd.read_parquet if name == 'customers' else np.load
+            self._runs[name] = [[file_name, reader(os.path.join(self.path, file_name))] for file_name in self.manifest[name]]
+        return self._runs[name]
+    
+    def _add_run(self, name, data, merge):
+        """Tambah run baru, lalu gabung run terakhir selama run sebelumnya ≤ 2x ukurannya"""
+        runs = self._load_runs(name)
+        runs.append([None, data])
+        while len(runs) > 1 and len(runs[-2][1]) <= 2 * len(runs[-1][1]):
+            (old_file, older), (new_file, newer) = runs[-2], runs[-1]
+            self._obsolete += [file_name for file_name in (old_file, new_file) if file_name]
+            runs[-2:] = [[None, merge(older, newer)]]
+    
+    @property
+    def customers(self):
+        """Agregat per pelanggan (semua run digabung saat dibaca)"""
+        if self._customers is None:
+            runs = [data for _, data in self._load_runs('customers')]
+            if runs:
+                self._customers = runs[0] if len(runs) == 1 else merge_customer_runs(*runs)
+            else:
+                self._customers = pd.DataFrame(
+                    {'First_Visit': pd.Series(dtype='datetime64[ns]'), 'Last_Visit': pd.Series(dtype='datetime64[ns]'),
+                     'Invoices': pd.Series(dtype='int64'), 'Monetary': pd.Series(dtype='float64')},
+                    index=pd.Index([], name='Konsumen', dtype=object)
+                )
+        return self._customers
+    
+    def update(self, df, engine=None):
+        """Memperbarui agregat dari transaksi baru (kolom standar). Waktu ∝ ukuran batch."""
+        engine = engine or AntyLaundryKMeans()
+        df, _ = engine.clean_rows(df)
+        if df.empty:
+            return 0
+        
+        # Nota baru = belum ada di run mana pun (pencarian biner per run) & kemunculan pertama di batch ini.
+        # Export tanpa kolom nota (di penyimpanan terisi None semua): tiap baris = satu transaksi, seperti rfm_kernel
+        if 'No_Invoice' in df.columns and df['No_Invoice'].notna().any():
+            has_invoice = df['No_Invoice'].notna().to_numpy()
+            keys = pd.util.hash_pandas_object(
+                df.loc[has_invoice, ['Konsumen', 'No_Invoice']].astype(str), index=False
+            ).to_numpy()
+            seen = np.zeros(len(keys), dtype=bool)
+            for _, run in self._load_runs('invoice_keys'):
+                if len(run) == 0:
+                    continue
+                pos = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+                seen |= run[pos] == keys
+            is_new = ~seen & ~pd.Series(keys).duplicated().to_numpy()
+            
+            new_invoice = np.zeros(len(df), dtype=np.int64)
+            new_invoice[has_invoice] = is_new
+            if is_new.any():
+                self._add_run('invoice_keys', np.sort(keys[is_new]), merge_key_runs)
+        else:
+            new_invoice = np.ones(len(df), dtype=np.int64)
+        
+        batch = df.assign(New_Invoice=new_invoice).groupby('Konsumen', observed=True).agg(
+            First_Visit=('Tanggal', 'min'),
+            Last_Visit=('Tanggal', 'max'),
+            Invoices=('New_Invoice', 'sum'),
+            Monetary=('Total_Harga', 'sum')
+        )
+        batch.index = batch.index.astype(object)
+        batch = batch.astype({'First_Visit': 'datetime64[ns]', 'Last_Visit': 'datetime64[ns]',
+                              'Invoices': 'int64', 'Monetary': 'float64'})
+        
+        self._add_run('customers', batch, merge_customer_runs)
+        self._customers = None
+        return len(df)
+    
+    def rfm(self, reference_date=None, resolver=None):
+        """R/F/M per pelanggan dari agregat (tanpa membaca transaksi)
+        
+        `reference_date` default = kunjungan terakhir; harus ≥ transaksi terakhir yang tersimpan.
+        """
+        customers = self.customers
+        if resolver is not None:
+            customers = customers.groupby(resolver.resolve(customers.index.to_series()).values).agg(RFM_AGGREGATIONS)
+        
+        if reference_date is None:
+            reference_date = customers['Last_Visit'].max()
+        
+        return pd.DataFrame({
+            'Konsumen': customers.index,
+            'Recency': (reference_date - customers['Last_Visit']).dt.days.to_numpy(),
+            'Frequency': customers['Invoices'].to_numpy(),
+            'Monetary': customers['Monetary'].to_numpy(),
+        })
+    
+    def save(self):
+        """Tulis hanya run baru/hasil gabung, ganti manifest secara atomik, lalu hapus run lama"""
+        os.makedirs(self.path, exist_ok=True)
+        sequence = 1 + max([int(re.sub(r'\D', '', file_name) or 0) for files in self.manifest.values() for file_name in files] + [0])
+        
+        for name, runs in self._runs.items():
+            for run in runs:
+                if run[0] is not None:
+                    continue
+                run[0] = f"{name}_{sequence:06d}" + ('.parquet' if name == 'customers' else '.npy')
+                sequence += 1
+                file_path = os.path.join(self.path, run[0])
+                with open(file_path + '.tmp', 'wb') as output:
+                    if name == 'customers':
+                        run[1].to_parquet(output)
+                    else:
+                        np.save(output, run[1])
+                os.replace(file_path + '.tmp', file_path)
+            self.manifest[name] = [file_name for file_name, _ in runs]
+        
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest:
+            json.dump(self.manifest, manifest)
+        os.replace(tmp_path, self.manifest_path)
+        
+        for file_name in self._obsolete:
+            if os.path.exists(os.path.join(self.path, file_name)):
+                os.remove(os.path.join(self.path, file_name))
+        self._obsolete = []
+
+
+# ============================================================
+# RESOLUSI IDENTITAS PELANGGAN (NAMA MIRIP DIGABUNG)
+# ============================================================
+
+IDENTITY_PATH = os.path.join(DATA_DIR, 'customer_identity.parquet')
+
+# Sapaan yang ditulis berbeda-beda diseragamkan (tidak dihapus: "Pak Budi" ≠ "Bu Budi")
+HONORIFICS = {
+    'ibu': 'bu', 'bu': 'bu', 'bapak': 'pak', 'bpk': 'pak', 'pak': 'pak',
+    'mbak': 'mba', 'mba': 'mba', 'mas': 'mas', 'kakak': 'kak', 'kak': 'kak',
+}
+
+# Ejaan lama/variasi bunyi yang sama (untuk kunci fonetik)
+PHONETIC_RULES = [
+    ('dj', 'j'), ('tj', 'c'), ('sj', 'sy'), ('oe', 'u'), ('ph', 'f'), ('kh', 'k'),
+    ('q', 'k'), ('x', 'ks'), ('z', 's'), ('v', 'f'), ('y', 'i'), ('w', 'u'),
+]
+
+NAME_SIMILARITY = 0.88
+MAX_BLOCK_SIZE = 50
+NEIGHBOR_WINDOW = 5
+
+
+class CustomerResolver:
+    """Menggabungkan nama pelanggan yang sama/mirip menjadi satu identitas
+
+    Kandidat pasangan hanya dicari di dalam blok (kunci fonetik & urutan kata), sehingga
+    tidak perlu membandingkan semua pasangan nama. Keputusan disimpan ke disk agar run
+    berikutnya hanya memproses nama baru.
+    """
+    
+    def __init__(self, path=IDENTITY_PATH):
+        self.path = path
+        if os.path.exists(path):
+            self.table = pd.read_parquet(path)
+        else:
+            self.table = pd.DataFrame(columns=['key', 'canonical', 'display', 'phonetic', 'tokens'])
+    
+    @staticmethod
+    def normalize(names):
+        """Nama → kunci normal: huruf kecil, tanpa tanda baca, spasi tunggal, sapaan seragam"""
+        key = names.astype(str).str.lower().str.replace(r'[^\w\s]', ' ', regex=True)
+        key = key.str.replace(r'\s+', ' ', regex=True).str.strip()
+        honorific_pattern = r'\b(' + '|'.join(HONORIFICS) + r')\b'
+        return key.str.replace(honorific_pattern, lambda m: HONORIFICS[m.group(1)], regex=True)
+    
+    @staticmethod
+    def phonetic_key(keys):
+        """Kunci blok fonetik: ejaan diseragamkan, vokal (kecuali huruf awal kata) dibuang"""
+        key = keys
+        for old, new in PHONETIC_RULES:
+            key = key.str.replace(old, new, regex=False)
+        key = key.str.replace(r'\B[aiueo]', '', regex=True)
+        key = key.str.replace(r'(\w)\1+', r'\1', regex=True)
+        return key.str.replace(' ', '', regex=False)
+    
+    @staticmethod
+    def _similar(a, b):
+        # Angka harus sama persis ("Pelanggan 12" ≠ "Pelanggan 13")
+        if re.findall(r'\d+', a) != re.findall(r'\d+', b):
+            return False
+        return SequenceMatcher(None, a, b).ratio() >= NAME_SIMILARITY
+    
+    def resolve(self, names):
+        """Mengembalikan nama kanonik untuk setiap nama (Series dengan index yang sama)"""
+        names = pd.Series(names)
+        raw_unique = pd.Series(names.dropna().unique())
+        keys = self.normalize(raw_unique)
+        
+        # Nama tampilan: variasi yang paling sering muncul
+        display = (
+            pd.DataFrame({'raw': raw_unique.values, 'key': keys.values})
+            .merge(names.value_counts().rename('n').rename_axis('raw').reset_index(), on='raw')
+            .sort_values('n', ascending=False)
+            .drop_duplicates('key')
+            .set_index('key')['raw']
+        )
+        
+        known = set(self.table['key'])
+        new_keys = pd.Series(sorted(set(keys) - known), dtype=object)
+        
+        if len(new_keys) > 0:
+            self._merge_new_keys(new_keys, display)
+            self.save()
+        
+        canonical = self.table.set_index('key')['canonical']
+        display_name = self.table.drop_duplicates('canonical').set_index('canonical')['display']
+        key_to_name = canonical.map(display_name)
+        mapping = pd.Series(key_to_name.reindex(keys).values, index=raw_unique.values)
+        return names.map(mapping)
+    
+    def _merge_new_keys(self, new_keys, display):
+        new_rows = pd.DataFrame({
+            'key': new_keys.values,
+            'phonetic': self.phonetic_key(new_keys).values,
+            'tokens': new_keys.str.split(' ').map(lambda tokens: ' '.join(sorted(tokens))).values,
+        })
+        new_rows['canonical'] = new_rows['key']
+        new_rows['display'] = new_rows['key'].map(display).fillna(new_rows['key'])
+        table = pd.concat([self.table, new_rows[self.table.columns]], ignore_index=True)
+        
+        # Union-find: parent per kunci, kunci lama tetap memakai kanonik lamanya
+        parent = dict(zip(table['key'], table['canonical']))
+        
+        def find(key):
+            root = key
+            while parent[root] != root:
+                root = parent[root]
+            while parent[key] != root:
+                parent[key], key = root, parent[key]
+            return root
+        
+        def union(a, b):
+            root_a, root_b = find(a), find(b)
+            # Dua identitas lama tidak digabung ulang (keputusan lama tetap berlaku)
+            if root_a != root_b and not (root_a in known_roots and root_b in known_roots):
+                # Identitas lama menang agar nama kanonik tetap stabil antar run
+                if root_b in known_roots and root_a not in known_roots:
+                    root_a, root_b = root_b, root_a
+                parent[root_b] = root_a
+        
+        known_roots = set(self.table['canonical'])
+        new_set = set(new_rows['key'])
+        
+        for block_col in ['tokens', 'phonetic']:
+            for _, block in table.groupby(block_col)['key']:
+                members = block.tolist()
+                if len(members) < 2 or not new_set.intersection(members):
+                    continue
+                if block_col == 'tokens':
+                    # Kata sama, hanya urutan berbeda ("Santoso Budi" = "Budi Santoso")
+                    for member in members[1:]:
+                        union(members[0], member)
+                    continue
+                if len(members) > MAX_BLOCK_SIZE:
+                    # Blok besar: bandingkan hanya dengan tetangga terdekat (urut alfabet)
+                    members = sorted(members)
+                    pairs = ((members[i], members[j]) for i in range(len(members))
+                             for j in range(i + 1, min(i + 1 + NEIGHBOR_WINDOW, len(members))))
+                else:
+                    pairs = ((a, b) for i, a in enumerate(members) for b in members[i + 1:])
+                for a, b in pairs:
+                    if (a in new_set or b in new_set) and self._similar(a, b):
+                        union(a, b)
+        
+        table['canonical'] = table['key'].map(find)
+        self.table = table
+    
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        self.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================
+# PARSING TANGGAL (DETEKSI FORMAT SEKALI PER KOLOM)
+# ============================================================
+
+# Urutan penting: format hari-dulu (Indonesia) dicoba sebelum bulan-dulu
+DATE_FORMATS = [
+    date_fmt + time_fmt
+    for date_fmt in ['%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d %m %Y', '%Y-%m-%d', '%Y/%m/%d',
+                     '%d/%m/%y', '%d-%m-%y', '%d.%m.%y', '%m/%d/%Y', '%m-%d-%Y']
+    for time_fmt in ['', ' %H:%M:%S', ' %H:%M', 'T%H:%M:%S']
+]
+
+# Nama bulan Indonesia/Inggris → angka bulan (mis. "5 Agustus 2024" → "5 08 2024")
+MONTH_NAMES = {
+    'januari': '01', 'jan': '01', 'februari': '02', 'feb': '02', 'maret': '03', 'mar': '03',
+    'april': '04', 'apr': '04', 'mei': '05', 'may': '05', 'juni': '06', 'jun': '06',
+    'juli': '07', 'jul': '07', 'agustus': '08', 'agu': '08', 'agt': '08', 'aug': '08',
+    'september': '09', 'sep': '09', 'oktober': '10', 'okt': '10', 'oct': '10',
+    'november': '11', 'nov': '11', 'desember': '12', 'des': '12', 'dec': '12',
+}
+MONTH_PATTERN = r'(?i)\b(' + '|'.join(sorted(MONTH_NAMES, key=len, reverse=True)) + r')\b'
+
+DATE_SAMPLE_SIZE = 500
+
+
+def detect_date_format(values):
+    """Mendeteksi format tanggal dari sampel nilai (string): format yang cocok untuk paling banyak nilai
+
+    Tidak di-cache secara global: urutan hari-bulan bisa berbeda antar file walau bentuk
+    nilainya sama. Cache per kolom untuk satu file ada di parse_dates (`formats`).
+    """
+    if len(values) == 0:
+        return None
+    
+    sample = pd.Series(values[:DATE_SAMPLE_SIZE])
+    best_format, best_count = None, 0
+    for fmt in DATE_FORMATS:
+        count = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(sample):
+                break
+    
+    return best_format
+
+
+# Lebar karakter tiap komponen format numerik (untuk parsing cepat lebar-tetap)
+FIXED_WIDTH_FIELDS = {'%d': ('day', 2), '%m': ('month', 2), '%Y': ('year', 4), '%y': ('year', 2),
+                      '%H': ('hour', 2), '%M': ('minute', 2), '%S': ('second', 2)}
+
+
+def _parse_fixed_width(text, fmt):
+    """Parsing vektor untuk format numerik lebar-tetap (mis. 05/08/2024 13:45)
+
+    Digit dibaca langsung dari array byte tanpa strptime per nilai. Nilai yang panjang
+    atau pemisahnya tidak cocok menjadi NaT (akan dicoba ulang oleh pemanggil).
+    """
+    fields = []
+    literals = []
+    pos = 0
+    i = 0
+    while i < len(fmt):
+        token = fmt[i:i + 2]
+        if token in FIXED_WIDTH_FIELDS:
+            name, width = FIXED_WIDTH_FIELDS[token]
+            fields.append((name, pos, width))
+            pos += width
+            i += 2
+        elif fmt[i] == '%':
+            return None
+        else:
+            literals.append((pos, ord(fmt[i])))
+            pos += 1
+            i += 1
+    
+    values = text.to_numpy(dtype=object)
+    ok = (text.str.len() == pos).to_numpy(copy=True)
+    raw = np.zeros(len(values), dtype=f'U{pos}')
+    raw[ok] = values[ok].astype(f'U{pos}')
+    chars = raw.view(np.uint32).reshape(len(values), pos).astype(np.int64)
+    
+    for offset, char in literals:
+        ok &= chars[:, offset] == char
+    
+    parts = {}
+    for name, offset, width in fields:
+        digits = chars[:, offset:offset + width] - ord('0')
+        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        parts[name] = (digits * 10 ** np.arange(width - 1, -1, -1)).sum(axis=1)
+    
+    if fmt.count('%y'):
+        parts['year'] = parts['year'] + np.where(parts['year'] < 69, 2000, 1900)
+    
+    components = pd.DataFrame({name: np.where(ok, value, 1) for name, value in parts.items()})
+    parsed = pd.to_datetime(components, errors='coerce')
+    return pd.Series(np.where(ok, parsed.to_numpy(), np.datetime64('NaT')), index=text.index)
+
+
+def _parse_with_format(text, fmt):
+    """Parsing seluruh nilai teks dengan satu format (jalur cepat jika lebar-tetap)"""
+    parsed = _parse_fixed_width(text, fmt)
+    if parsed is None:
+        return pd.to_datetime(text, format=fmt, errors='coerce')
+    
+    # Nilai yang tidak lolos jalur cepat (mis. tanpa nol di depan) diparsing biasa
+    missed = parsed.isna()
+    if missed.any():
+        parsed[missed] = pd.to_datetime(text[missed], format=fmt, errors='coerce')
+    return parsed
+
+
+def _normalize_date_text(text):
+    """Ganti nama bulan dengan angka dan rapikan spasi"""
+    text = text.str.replace(MONTH_PATTERN, lambda m: MONTH_NAMES[m.group(1).lower()], regex=True)
+    return text.str.replace(r'\s+', ' ', regex=True)
+
+
+def parse_dates(values, formats=None):
+    """Parsing kolom tanggal dengan format yang dideteksi sekali dari sampel
+
+    Setiap nilai unik hanya di-parse satu kali. Nilai yang tidak cocok dengan format utama
+    dicoba dengan format lain lalu parser bebas hari-dulu (dihitung sebagai 'campuran'),
+    sisanya dihitung 'tidak valid'. `formats` (dict nama kolom → format, dibuat per file)
+    menyimpan format hasil deteksi, sehingga chunk berikutnya dari kolom yang sama tidak
+    menguji sampel lagi.
+    Return (Series datetime, dict statistik).
+    """
+    values = pd.Series(values)
+    stats = {'format': None, 'mixed': 0, 'invalid': 0}
+    
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, stats
+    
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+    if pd.api.types.infer_dtype(uniques, skipna=True) == 'string':
+        is_text = pd.Series(True, index=uniques.index)
+    else:
+        # Nilai yang sudah berupa tanggal (mis. dari openpyxl) tidak perlu di-parse
+        is_text = uniques.map(lambda v: isinstance(v, str))
+        parsed[~is_text] = pd.to_datetime(uniques[~is_text], errors='coerce')
+    
+    text = uniques[is_text].str.strip()
+    text = text[text != '']
+    if len(text) > 0:
+        sample = text.iloc[:DATE_SAMPLE_SIZE]
+        if sample.str.contains(r'[^\W\d_]', regex=True).any():
+            text = _normalize_date_text(text)
+        
+        if formats is not None and formats.get(values.name):
+            stats['format'] = formats[values.name]
+        else:
+            stats['format'] = detect_date_format(text.tolist()[:DATE_SAMPLE_SIZE])
+            if formats is not None and stats['format'] is not None:
+                formats[values.name] = stats['format']
+        if stats['format'] is not None:
+            parsed[text.index] = _parse_with_format(text, stats['format'])
+        
+        # Format campuran: coba format lain hanya untuk sisa nilai yang gagal
+        failed = text[parsed[text.index].isna()]
+        remaining = _normalize_date_text(failed)
+        for fmt in DATE_FORMATS:
+            if remaining.empty:
+                break
+            attempt = pd.to_datetime(remaining, format=fmt, errors='coerce').dropna()
+            parsed[attempt.index] = attempt
+            remaining = remaining.drop(attempt.index)
+        
+        # Sisa yang tidak cocok dengan format mana pun: parser bebas (hari-dulu) pada teks asli
+        # (nama bulan tidak diganti angka agar "Aug 7" tidak terbaca 8 Juli)
+        if not remaining.empty:
+            original = uniques[remaining.index].str.strip()
+            attempt = pd.to_datetime(original, format='mixed', dayfirst=True, errors='coerce').dropna()
+            parsed[attempt.index] = attempt
+            remaining = remaining.drop(attempt.index)
+        
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        stats['invalid'] = int(counts[remaining.index].sum())
+        stats['mixed'] = int(counts[failed.index].sum()) - stats['invalid']
+    
+    result = parsed.to_numpy().take(np.where(codes >= 0, codes, 0))
+    result[codes < 0] = np.datetime64('NaT')
+    return pd.Series(result, index=values.index), stats
+
+
+def merge_date_stats(total, stats):
+    """Menjumlahkan statistik parsing tanggal antar chunk"""
+    if total is None:
+        return dict(stats)
+    return {
+        'format': total['format'] or stats['format'],
+        'mixed': total['mixed'] + stats['mixed'],
+        'invalid': total['invalid'] + stats['invalid'],
+    }
+
+
+def report_date_stats(label, stats):
+    """Tampilkan hasil parsing tanggal (format, jumlah nilai campuran & tidak valid)"""
+    if stats['format']:
+        st.info(f"📅 Format {label} terdeteksi: {stats['format']}")
+    if stats['mixed'] > 0:
+        st.warning(f"⚠️ {stats['mixed']} nilai {label} memakai format berbeda (tetap dibaca)")
+    if stats['invalid'] > 0:
+        st.warning(f"⚠️ {stats['invalid']} nilai {label} tidak dapat dibaca sebagai tanggal")
+
+
+# ============================================================
+# KERNEL RFM (SORT & REDUCE, SATU PASS)
+# ============================================================
+
+DAY_NS = 24 * 60 * 60 * 10**9
+
+# Fitur perilaku tambahan yang dihitung bersama R/F/M
+RFM_EXTRA_FEATURES = ['Tenure', 'Avg_Basket', 'Avg_Interval', 'Interval_Var']
+
+
+def rfm_windows(df, reference_date, cutoffs):
+    """Hitung R, F, M + fitur perilaku untuk beberapa periode sekaligus
+
+    `cutoffs` berisi {kunci: tanggal batas}; periode memuat transaksi dengan tanggal > batas
+    (None = semua transaksi). Transaksi diurutkan sekali per (pelanggan, tanggal) sehingga
+    transaksi dalam periode selalu berupa ekor tiap grup; nilai tiap periode diambil dari batas
+    grup dengan operasi numpy (tanpa lambda per pelanggan). Return {kunci: DataFrame RFM}.
+    """
+    codes, customers = pd.factorize(df['Konsumen'], sort=True)
+    valid = codes >= 0
+    codes = codes[valid].astype(np.int64)
+    dates = df['Tanggal'].to_numpy(dtype='datetime64[ns]').view(np.int64)[valid]
+    price = df['Total_Harga'].to_numpy()[valid]
+    price = price.astype(np.int64) if np.issubdtype(price.dtype, np.integer) else price.astype(np.float64)
+    
+    order = np.lexsort((dates, codes))
+    codes_s, dates_s, price_s = codes[order], dates[order], price[order]
+    
+    n_rows = len(codes_s)
+    starts = np.flatnonzero(np.r_[True, codes_s[1:] != codes_s[:-1]][:n_rows])
+    ends = np.r_[starts[1:], n_rows][:len(starts)].astype(np.int64)
+    group_codes = codes_s[starts]
+    last = dates_s[ends - 1]
+    n_customers = len(customers)
+    
+    # Frequency: nota unik (nunique, NaN tidak dihitung). Nota masuk periode jika
+    # kemunculan terakhirnya (tanggal terbesar) masuk periode
+    pair_codes = None
+    if 'No_Invoice' in df.columns:
+        invoice_codes = pd.factorize(df['No_Invoice'])[0][valid].astype(np.int64)[order]
+        base = invoice_codes.max() + 2 if len(invoice_codes) else 1
+        last_pair = ~pd.Series(codes_s * base + invoice_codes + 1).duplicated(keep='last').to_numpy()
+        last_pair &= invoice_codes >= 0
+        pair_codes, pair_dates = codes_s[last_pair], dates_s[last_pair]
+    
+    # Jarak antar kunjungan (hari berbeda); jarak masuk periode jika kunjungan sebelumnya masuk
+    days = dates_s // DAY_NS
+    new_visit = np.r_[True, (codes_s[1:] != codes_s[:-1]) | (days[1:] != days[:-1])][:n_rows]
+    visit_codes, visit_days = codes_s[new_visit], days[new_visit]
+    visit_last = dates_s[np.r_[new_visit[1:], True][:n_rows]]
+    same = visit_codes[1:] == visit_codes[:-1]
+    gaps = np.diff(visit_days)[same].astype(np.float64)
+    gap_codes = visit_codes[1:][same]
+    gap_dates = visit_last[:-1][same]
+    
+    reference_ns = pd.Timestamp(reference_date).as_unit('ns').value
+    results = {}
+    for key, cutoff in cutoffs.items():
+        cutoff_ns = np.iinfo(np.int64).min if cutoff is None else pd.Timestamp(cutoff).as_unit('ns').value
+        in_window = dates_s > cutoff_ns
+        counts = np.add.reduceat(in_window.astype(np.int64), starts) if len(starts) else starts
+        present = counts > 0
+        selected = group_codes[present]
+        
+        first = dates_s[(ends - counts)[present]]
+        last_w = last[present]
+        monetary = np.add.reduceat(np.where(in_window, price_s, 0), starts)[present] if len(starts) else price_s[:0]
+        
+        if pair_codes is not None:
+            frequency = np.bincount(pair_codes[pair_dates > cutoff_ns], minlength=n_customers)[selected]
+        else:
+            frequency = counts[present]
+        
+        gap_in = gap_dates > cutoff_ns
+        n_gaps = np.bincount(gap_codes[gap_in], minlength=n_customers)[selected]
+        sum_gaps = np.bincount(gap_codes[gap_in], weights=gaps[gap_in], minlength=n_customers)[selected]
+        sum_sq = np.bincount(gap_codes[gap_in], weights=gaps[gap_in] ** 2, minlength=n_customers)[selected]
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_interval = np.where(n_gaps > 0, sum_gaps / n_gaps, np.nan)
+            interval_var = np.where(n_gaps > 0, sum_sq / n_gaps - avg_interval ** 2, np.nan)
+            avg_basket = np.where(frequency > 0, monetary / frequency, np.nan)
+        
+        results[key] = pd.DataFrame({
+            'Konsumen': customers.take(selected),
+            'Recency': (reference_ns - last_w) // DAY_NS,
+            'Frequency': frequency.astype(np.int64),
+            'Monetary': monetary,
+            'Tenure': (last_w - first) // DAY_NS,
+            'Avg_Basket': avg_basket,
+            'Avg_Interval': avg_interval,
+            'Interval_Var': np.maximum(interval_var, 0),
+        })
+    
+    return results
+
+
+def unique_pairs(codes, hashes):
+    """Pasangan (kode pelanggan, hash nota) unik, lewat pengurutan array numpy (tanpa hash table)"""
+    order = np.lexsort((hashes, codes))
+    codes, hashes = codes[order], hashes[order]
+    first = np.r_[True, (codes[1:] != codes[:-1]) | (hashes[1:] != hashes[:-1])][:len(codes)]
+    return codes[first], hashes[first]
+
+
+def rfm_kernel(df, reference_date):
+    """Hitung R, F, M + tenure, rata-rata belanja per nota, rata-rata & varians jarak kunjungan
+
+    Urutan & nilai R/F/M sama persis dengan groupby lama. Kunjungan = hari berbeda;
+    jarak kunjungan dalam hari.
+    """
+    return rfm_windows(df, reference_date, {None: None})[None]
+
+
+def rfm_snapshots(df, snapshot_dates):
+    """RFM kumulatif (as-of) per pelanggan untuk setiap tanggal snapshot
+
+    Snapshot T memuat semua transaksi sampai akhir hari T dan Recency dihitung dalam hari dari T.
+    Tiap transaksi masuk sekali ke snapshot pertama yang memuatnya; nilai per (pelanggan, snapshot)
+    lalu dijumlahkan kumulatif antar snapshot, tanpa menghitung ulang RFM per snapshot.
+    Return DataFrame panjang: Snapshot, Konsumen, Recency, Frequency, Monetary.
+    """
+    snapshot_dates = pd.DatetimeIndex(snapshot_dates).normalize().sort_values()
+    snapshot_days = snapshot_dates.as_unit('ns').asi8 // DAY_NS
+    n_snapshots = len(snapshot_days)
+    
+    codes, customers = pd.factorize(df['Konsumen'], sort=True)
+    days = df['Tanggal'].to_numpy(dtype='datetime64[ns]').view(np.int64) // DAY_NS
+    price = df['Total_Harga'].to_numpy(dtype=np.float64)
+    bucket = np.searchsorted(snapshot_days, days, side='left')
+    keep = (codes >= 0) & (bucket < n_snapshots)
+    codes, days, price, bucket = codes[keep].astype(np.int64), days[keep], price[keep], bucket[keep]
+    
+    n_customers = len(customers)
+    shape = (n_customers, n_snapshots)
+    cell = codes * n_snapshots + bucket
+    
+    rows = np.bincount(cell, minlength=n_customers * n_snapshots).reshape(shape).cumsum(axis=1)
+    monetary = np.bincount(cell, weights=price, minlength=n_customers * n_snapshots).reshape(shape).cumsum(axis=1)
+    last_day = np.full(n_customers * n_snapshots, np.iinfo(np.int64).min)
+    np.maximum.at(last_day, cell, days)
+    last_day = np.maximum.accumulate(last_day.reshape(shape), axis=1)
+    
+    # Frequency: nota unik dihitung di snapshot kemunculan pertamanya
+    if 'No_Invoice' in df.columns:
+        invoice_codes = pd.factorize(df['No_Invoice'])[0][keep].astype(np.int64)
+        base = invoice_codes.max() + 2 if len(invoice_codes) else 1
+        order = np.argsort(days, kind='stable')
+        first_pair = ~pd.Series((codes * base + invoice_codes + 1)[order]).duplicated().to_numpy()
+        first_pair &= invoice_codes[order] >= 0
+        frequency = np.bincount(cell[order][first_pair], minlength=n_customers * n_snapshots).reshape(shape).cumsum(axis=1)
+    else:
+        frequency = rows
+    
+    snapshot_idx, customer_idx = np.nonzero(rows.T > 0)
+    monetary = monetary[customer_idx, snapshot_idx]
+    if np.issubdtype(df['Total_Harga'].dtype, np.integer):
+        monetary = np.rint(monetary).astype(np.int64)
+    
+    return pd.DataFrame({
+        'Snapshot': snapshot_dates.take(snapshot_idx),
+        'Konsumen': customers.take(customer_idx),
+        'Recency': snapshot_days[snapshot_idx] - last_day[customer_idx, snapshot_idx],
+        'Frequency': frequency[customer_idx, snapshot_idx].astype(np.int64),
+        'Monetary': monetary,
+    })
+
+
+# ============================================================
+# CENTROID RUN SEBELUMNYA (WARM START & ID CLUSTER STABIL)
+# ============================================================
+
+CENTROIDS_PATH = os.path.join(DATA_DIR, 'centroids.parquet')
+
+
+class CentroidMemory:
+    """Centroid (satuan asli R/F/M) dan nama segmen hasil run terakhir, per periode analisis
+
+    Dipakai sebagai inisialisasi K-Means run berikutnya (warm start) dan untuk mencocokkan
+    cluster baru ke cluster lama sehingga ID cluster tetap sama antar run. Waktu & iterasi
+    cold start terakhir ikut disimpan sebagai pembanding.
+    """
+    
+    def __init__(self, path=CENTROIDS_PATH):
+        self.path = path
+        if os.path.exists(path):
+            self.table = pd.read_parquet(path)
+        else:
+            self.table = pd.DataFrame(columns=['key', 'Cluster', 'Recency', 'Frequency', 'Monetary', 'Segment',
+                                               'Cold_Seconds', 'Cold_Iter'])
+    
+    def get(self, key):
+        """Centroid run sebelumnya untuk periode `key` (urut ID cluster), None jika belum ada"""
+        rows = self.table[self.table['key'] == str(key)]
+        return rows.sort_values('Cluster').reset_index(drop=True) if len(rows) else None
+    
+    def put(self, key, engine, cluster_labels):
+        """Simpan centroid model terakhir `engine` beserta nama segmen per cluster"""
+        centers = engine.scaler.inverse_transform(engine.model.cluster_centers_)
+        stats = engine.fit_stats
+        if stats and not stats['warm']:
+            cold = (stats['seconds'], stats['n_iter'])
+        elif stats and engine.previous is not None:
+            cold = (engine.previous['Cold_Seconds'].iloc[0], engine.previous['Cold_Iter'].iloc[0])
+        else:
+            cold = (np.nan, np.nan)
+        
+        rows = pd.DataFrame({
+            'key': str(key),
+            'Cluster': np.arange(len(centers)),
+            'Recency': centers[:, 0],
+            'Frequency': centers[:, 1],
+            'Monetary': centers[:, 2],
+            'Segment': [cluster_labels[cluster]['name'] if cluster in cluster_labels else None for cluster in range(len(centers))],
+            'Cold_Seconds': float(cold[0]),
+            'Cold_Iter': float(cold[1]),
+        })
+        self.table = pd.concat([self.table[self.table['key'] != str(key)], rows], ignore_index=True)
+    
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        self.table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+
+# ============================================================
+# MODEL TERSIMPAN (SCALER + CENTROID + LABEL, BERVERSI)
+# ============================================================
+
+MODEL_DIR = os.path.join(DATA_DIR, 'models')
+
+
+class ModelRegistry:
+    """Artefak model berversi (model_v{N}.joblib) untuk mode assign tanpa latih ulang
+
+    Artefak berisi scaler & model yang sudah dilatih beserta tabel label segmen, sehingga
+    pelanggan baru bisa langsung ditempatkan ke segmen yang sudah ada.
+    """
+    
+    def __init__(self, path=MODEL_DIR):
+        self.path = path
+    
+    def versions(self):
+        """Daftar nomor versi yang tersimpan (urut naik)"""
+        if not os.path.isdir(self.path):
+            return []
+        found = (re.fullmatch(r'model_v(\d+)\.joblib', name) for name in os.listdir(self.path))
+        return sorted(int(match.group(1)) for match in found if match)
+    
+    def load(self, version=None):
+        """Muat artefak versi tertentu (default versi terbaru)"""
+        if version is None:
+            version = self.versions()[-1]
+        return joblib.load(os.path.join(self.path, f'model_v{version}.joblib'))
+    
+    def save(self, artifact):
+        """Simpan artefak sebagai versi baru, return nomor versinya"""
+        os.makedirs(self.path, exist_ok=True)
+        version = (self.versions() or [0])[-1] + 1
+        artifact = dict(artifact, version=version)
+        tmp_path = os.path.join(self.path, f'model_v{version}.joblib.tmp')
+        joblib.dump(artifact, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, f'model_v{version}.joblib'))
+        return version
+    
+    def assign(self, rfm_df, version=None):
+        """Entry point batch: tempatkan pelanggan (tabel RFM) ke segmen model tersimpan"""
+        return AntyLaundryKMeans().assign_clusters(rfm_df, self.load(version))
+
+
+# ============================================================
+# ANTRIAN JOB LAPORAN (WORKER DI LATAR BELAKANG)
+# ============================================================
+
+REPORT_DIR = os.path.join(DATA_DIR, 'reports')
+REPORT_WORKERS = int(os.environ.get('ANTY_REPORT_WORKERS', '2'))
+
+
+class ReportQueue:
+    """Job laporan berat (Excel, paket data, file pesan) dijalankan di thread pool
+
+    `submit` langsung kembali; job menulis hasilnya ke REPORT_DIR/{id}_{nama file} dan
+    melaporkan progres lewat callback `progress(fraksi)`. UI cukup membaca `jobs()` tiap
+    rerun (tidak menunggu job selesai). Jumlah job paralel = `workers` (ANTY_REPORT_WORKERS).
+    """
+    
+    def __init__(self, path=REPORT_DIR, workers=REPORT_WORKERS):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='anty-report')
+        self.lock = threading.Lock()
+        self._jobs = {}
+    
+    def submit(self, title, file_name, build, owner=None):
+        """Antrikan `build(file, progress)` yang menulis laporan ke `file`; return ID job"""
+        os.makedirs(self.path, exist_ok=True)
+        job_id = uuid.uuid4().hex[:12]
+        with self.lock:
+            self._jobs[job_id] = {
+                'id': job_id, 'title': title, 'file_name': file_name, 'owner': owner,
+                'path': os.path.join(self.path, f'{job_id}_{file_name}'),
+                'status': 'antri', 'progress': 0.0, 'error': None,
+                'created': time.time(), 'started': None, 'finished': None,
+            }
+        self.executor.submit(self._run, job_id, build)
+        return job_id
+    
+    def _update(self, job_id, **values):
+        with self.lock:
+            self._jobs[job_id].update(values)
+    
+    def _run(self, job_id, build):
+        job = self._jobs[job_id]
+        self._update(job_id, status='berjalan', started=time.time())
+        tmp_path = job['path'] + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as output:
+                build(output, lambda fraction: self._update(job_id, progress=min(float(fraction), 1.0)))
+            os.replace(tmp_path, job['path'])
+            self._update(job_id, status='selesai', progress=1.0, finished=time.time())
+        except Exception as error:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._update(job_id, status='gagal', error=str(error), finished=time.time())
+    
+    def pending(self, owner=None):
+        """Apakah masih ada job yang antri/berjalan (opsional hanya milik `owner`)"""
+        return any(job['status'] in ('antri', 'berjalan') for job in self.jobs(owner))
+    
+    def jobs(self, owner=None):
+        """Salinan status job (terbaru dulu), opsional hanya milik `owner`"""
+        with self.lock:
+            jobs = [dict(job) for job in self._jobs.values() if owner is None or job['owner'] == owner]
+        return sorted(jobs, key=lambda job: job['created'], reverse=True)
+    
+    def remove(self, job_id):
+        """Hapus job yang sudah selesai/gagal beserta file hasilnya"""
+        with self.lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] in ('antri', 'berjalan'):
+                return
+            del self._jobs[job_id]
+        if os.path.exists(job['path']):
+            os.remove(job['path'])
+
+
+@st.cache_resource
+def get_report_queue():
+    """Satu ReportQueue per proses server (bertahan antar rerun & dipakai semua sesi)"""
+    return ReportQueue()
+
+
 # ============================================================
 # FUNGSI UTAMA: PROSES DATA & CLUSTERING
 # ============================================================
 
+# (kolom standar, label, nama di pesan error, keyword pencarian, wajib?)
+COLUMN_RULES = [
+    ('Tanggal', 'Tanggal', 'Tanggal Ambil', ['tanggal ar', 'tanggal ambil', 'tgl ambil', 'tanggalambil'], True),
+    ('Konsumen', 'Konsumen', 'Konsumen', ['konsumer', 'konsumen', 'customer', 'pelanggan'], True),
+    ('Total_Harga', 'Total Harga', 'Total Harga', ['total harg', 'total harga', 'totalharga'], True),
+    ('No_Invoice', 'No Invoice', 'No Invoice', ['nota', 'invoice', 'no nota', 'nonota', 'no.nota'], False),
+    ('Status_Order', 'Status Order', 'Status Order', ['status order', 'statusorder', 'status'], False),
+    ('Tanggal_Order', 'Tanggal Order', 'Tanggal Order', ['tanggal order', 'tanggalorder', 'tgl order'], False),
+    ('Telepon', 'Telepon', 'No HP', ['telepon', 'telp', 'no hp', 'nohp', 'handphone', 'whatsapp', 'no wa', 'phone'], False),
+]
+
+# Kolom teks dibaca sebagai string agar tipe konsisten (tidak ditebak per nilai)
+TEXT_COLUMNS = ['Konsumen', 'No_Invoice', 'Status_Order', 'Telepon']
+
+# Pilihan periode (bulan terakhir) di sidebar; RFM semua periode dihitung sekaligus
+PERIOD_OPTIONS = [1, 2, 3, 6, 12]
+
+# Jumlah akhir bulan terakhir untuk riwayat segmen & matriks migrasi
+SNAPSHOT_MONTHS = 24
+
+# Di atas jumlah pelanggan ini mode clustering otomatis memakai MiniBatchKMeans
+MINIBATCH_THRESHOLD = int(os.environ.get('ANTY_MINIBATCH_THRESHOLD', '100000'))
+MINIBATCH_SIZE = 4096
+MINIBATCH_EPOCHS = 3
+
+# Definisi segmen default. priority = urutan dari terbaik (1) ke terburuk; min_k = segmen mulai dipakai
+# saat jumlah cluster ≥ min_k (0 = tidak dipakai). Placeholder teks: rank, k, score, recency, frequency, monetary
+DEFAULT_SEGMENTS = {
+    'VIP Customer': {
+        'priority': 1,
+        'min_k': 2,
+        'icon': '🏆',
+        'discount': 10,
+        'description': 'Pelanggan VIP dengan transaksi sangat tinggi dan sangat aktif. RFM Score tertinggi ({score:.2f}/3.0). Rata-rata belanja Rp{monetary:,.0f}, transaksi {frequency:.1f}x, terakhir {recency:.0f} hari lalu.',
+        'criteria': '✓ Ranking #{rank} dari {k} cluster\n✓ RFM Score: {score:.2f} (tertinggi)\n✓ Recency: {recency:.0f} hari (sangat aktif)\n✓ Frequency: {frequency:.1f}x (sangat tinggi)\n✓ Monetary: Rp{monetary:,.0f} (sangat tinggi)'
+    },
+    'Top Spender': {
+        'priority': 2,
+        'min_k': 4,
+        'icon': '💎',
+        'discount': 10,
+        'description': 'Pelanggan dengan nilai belanja tertinggi. RFM Score tinggi ({score:.2f}/3.0). Rata-rata belanja Rp{monetary:,.0f}, transaksi {frequency:.1f}x.',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f} (tinggi)'
+    },
+    'Pelanggan Setia': {
+        'priority': 3,
+        'min_k': 8,
+        'icon': '🤝',
+        'discount': 10,
+        'description': 'Pelanggan yang rutin kembali dengan belanja di atas rata-rata. RFM Score tinggi ({score:.2f}/3.0). Transaksi {frequency:.1f}x, terakhir {recency:.0f} hari lalu.',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+    'High Value Customer': {
+        'priority': 4,
+        'min_k': 5,
+        'icon': '💚',
+        'discount': 10,
+        'description': 'Pelanggan bernilai tinggi dengan potensi berkembang. RFM Score menengah-tinggi ({score:.2f}/3.0).',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+    'Pelanggan Potensial': {
+        'priority': 5,
+        'min_k': 7,
+        'icon': '🌱',
+        'discount': 10,
+        'description': 'Pelanggan yang masih aktif namun belanjanya belum besar. RFM Score menengah ({score:.2f}/3.0). Cocok untuk promo peningkatan transaksi.',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+    'Pelanggan Reguler': {
+        'priority': 6,
+        'min_k': 3,
+        'icon': '⚠️',
+        'discount': 10,
+        'description': 'Pelanggan dengan transaksi rutin namun nilai sedang. RFM Score menengah ({score:.2f}/3.0).',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+    'Pelanggan Berisiko': {
+        'priority': 7,
+        'min_k': 6,
+        'icon': '📉',
+        'discount': 10,
+        'description': 'Pelanggan yang mulai jarang datang. RFM Score rendah ({score:.2f}/3.0). Terakhir transaksi {recency:.0f} hari lalu, perlu diingatkan sebelum tidak aktif.',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari (mulai jarang)\n✓ Frequency: {frequency:.1f}x\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+    'Pelanggan Tidak Aktif': {
+        'priority': 8,
+        'min_k': 2,
+        'icon': '😴',
+        'discount': 10,
+        'description': 'Pelanggan yang sudah lama tidak bertransaksi. RFM Score terendah ({score:.2f}/3.0). Perlu strategi re-engagement.',
+        'criteria': '✓ Ranking #{rank}\n✓ RFM Score: {score:.2f}\n✓ Recency: {recency:.0f} hari (tidak aktif)\n✓ Frequency: {frequency:.1f}x (rendah)\n✓ Monetary: Rp{monetary:,.0f}'
+    },
+}
+
+SEGMENT_CATALOG_PATH = os.environ.get('ANTY_SEGMENT_CATALOG')
+
+
+def load_segment_catalog(path=SEGMENT_CATALOG_PATH):
+    """Katalog segmen: satu tabel (index nama; kolom priority, min_k, icon, discount, description, criteria)
+
+    Tanpa `path` dipakai DEFAULT_SEGMENTS. File CSV/JSON (kolom 'name' + kolom yang mau diganti)
+    menimpa nilai default per segmen, kolom yang tidak ada tetap memakai default. Segmen baru
+    tanpa priority/min_k ditaruh paling akhir dan dipakai mulai k berikutnya; mengganti nama
+    segmen = tambah baris nama baru dan set min_k segmen lama ke 0. Urut menurut priority.
+    """
+    catalog = pd.DataFrame.from_dict(DEFAULT_SEGMENTS, orient='index').rename_axis('name')
+    if path:
+        config = pd.read_json(path) if path.endswith('.json') else pd.read_csv(path)
+        config = config.set_index('name')
+        catalog = config.combine_first(catalog).loc[list(catalog.index) + [name for name in config.index if name not in catalog.index]]
+        for column in ['priority', 'min_k']:
+            missing = catalog[column].isna()
+            catalog.loc[missing, column] = catalog[column].max() + np.arange(1, missing.sum() + 1)
+    
+    catalog = catalog.astype({'priority': 'int64', 'min_k': 'int64'})
+    return catalog.sort_values('priority', kind='stable')
+
+
+def segment_tiers(catalog):
+    """Segmen untuk setiap jumlah cluster k (urut ranking RFM Score), diturunkan dari katalog
+
+    Untuk k cluster dipakai k segmen aktif dengan min_k terkecil (seri: priority), lalu diurutkan
+    menurut priority. k tersedia dari 2 sampai jumlah segmen aktif.
+    """
+    active = catalog[catalog['min_k'] > 0].sort_values(['min_k', 'priority'], kind='stable')
+    return {
+        k: list(active.iloc[:k].sort_values('priority', kind='stable').index)
+        for k in range(2, len(active) + 1)
+    }
+
+
+SEGMENT_CATALOG = load_segment_catalog()
+
+
+def segment_codes(clusters, cluster_labels):
+    """Kolom Segment kategorikal yang kodenya = ID cluster (nama segmen tidak disalin per baris)"""
+    n_clusters = max(int(cluster) for cluster in cluster_labels) + 1
+    names = [cluster_labels[cluster]['name'] if cluster in cluster_labels else f'Cluster {cluster}' for cluster in range(n_clusters)]
+    return pd.Categorical.from_codes(np.asarray(clusters), categories=names)
+
+
+def segment_attribute(rfm_df, cluster_labels, key):
+    """Atribut segmen (mis. 'discount') per pelanggan, di-join lewat kode cluster"""
+    values = np.array([cluster_labels[cluster][key] if cluster in cluster_labels else None
+                       for cluster in range(max(int(cluster) for cluster in cluster_labels) + 1)])
+    return pd.Series(values[rfm_df['Cluster'].to_numpy()], index=rfm_df.index, name=key.capitalize())
+
+# Segmen yang dipakai untuk setiap jumlah cluster k (urut ranking RFM Score)
+SEGMENT_TIERS = segment_tiers(SEGMENT_CATALOG)
+
+# Rentang k untuk pemilihan jumlah cluster otomatis (harus ada di SEGMENT_TIERS)
+AUTO_K_RANGE = range(3, min(8, max(SEGMENT_TIERS)) + 1)
+SILHOUETTE_SAMPLE = 5000
+
+# Jumlah proses worker untuk auto-k & bootstrap (-1 = semua core)
+PARALLEL_JOBS = int(os.environ.get('ANTY_JOBS', '-1'))
+
+# Uji stabilitas: jumlah resample bootstrap default & batas Jaccard cluster stabil
+BOOTSTRAP_RUNS = 30
+STABLE_JACCARD = 0.75
+
+# Pilihan mode clustering di sidebar
+CLUSTER_BACKENDS = {'Otomatis': 'auto', 'K-Means Penuh': 'full', 'Mini-Batch': 'minibatch'}
+
+# Scatter 3D: batas titik yang dikirim ke browser, minimal titik per segmen & jumlah bin per sumbu (mode kepadatan)
+SCATTER_POINT_BUDGET = int(os.environ.get('ANTY_SCATTER_POINTS', '20000'))
+SCATTER_MIN_PER_SEGMENT = 500
+SCATTER_BINS = 16
+SCATTER_MODES = {'points': 'Titik (sampel per segmen)', 'density': 'Kepadatan (bin 3D)'}
+
+# Pemilihan pelanggan kampanye: kunci ranking & urutan prioritas segmen pengisi sisa slot
+CAMPAIGN_SIZE = 10
+RANKING_KEYS = {'Monetary': 'Total Belanja', 'Frequency': 'Jumlah Transaksi', 'RFM_Score': 'Skor RFM Gabungan'}
+CAMPAIGN_TIERS = [['VIP Customer', 'Top Spender'], ['High Value Customer'], None]  # None = semua pelanggan
+
+
+def stratified_sample(labels, size, seed=42, minimum=2):
+    """Indeks sampel bertingkat: tiap cluster diambil proporsional (minimal `minimum` titik per cluster)
+
+    `size` adalah batas keras: minimum per cluster dibatasi size // jumlah cluster, dan kelebihan
+    akibat pembulatan/minimum diambil dari kuota cluster terbesar.
+    """
+    if len(labels) <= size:
+        return np.arange(len(labels))
+    
+    rng = np.random.default_rng(seed)
+    clusters, counts = np.unique(labels, return_counts=True)
+    minimum = min(minimum, size // len(clusters))
+    quotas = np.minimum(counts, np.maximum(minimum, np.round(counts / len(labels) * size).astype(int)))
+    
+    floor = np.minimum(counts, minimum)
+    excess = quotas.sum() - size
+    for i in np.argsort(-quotas, kind='stable'):
+        if excess <= 0:
+            break
+        cut = min(excess, quotas[i] - floor[i])
+        quotas[i] -= cut
+        excess -= cut
+    
+    return np.concatenate([
+        rng.choice(np.flatnonzero(labels == cluster), quota, replace=False)
+        for cluster, quota in zip(clusters, quotas)
+    ])
+
+
+def find_elbow(k_values, inertias):
+    """Titik elbow: k dengan jarak terjauh dari garis lurus kurva inertia (dinormalisasi)"""
+    if len(k_values) < 3:
+        return int(k_values[0])
+    x = (k_values - k_values[0]) / (k_values[-1] - k_values[0])
+    y = (inertias - inertias[-1]) / max(inertias[0] - inertias[-1], 1e-12)
+    return int(k_values[np.argmax(1 - x - y)])
+
+
+def fit_k(X, k, backend):
+    """Latih satu nilai k dan hitung silhouette sampel (dijalankan di proses worker)"""
+    engine = AntyLaundryKMeans(backend=backend)
+    engine.n_clusters = k
+    labels, inertia, used_backend = engine.fit_clusters(X)
+    
+    sample = stratified_sample(labels, SILHOUETTE_SAMPLE)
+    silhouette = silhouette_score(X[sample], labels[sample]) if len(np.unique(labels[sample])) > 1 else -1.0
+    
+    return {'model': engine.model, 'labels': labels, 'inertia': inertia, 'silhouette': silhouette,
+            'backend': used_backend, 'stats': engine.fit_stats}
+
+
+def fit_bootstrap(X, reference_labels, centers, seed, backend):
+    """Satu resample bootstrap: latih ulang dari centroid acuan, return label semua pelanggan
+    & Jaccard tiap cluster acuan (dijalankan di proses worker)
+
+    Jaccard dihitung pada pelanggan yang ikut di resample: untuk cluster acuan C diambil
+    nilai maksimum |C ∩ D| / |C ∪ D| atas semua cluster D hasil resample.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, len(X), len(X))
+    k = len(centers)
+    
+    engine = AntyLaundryKMeans(backend=backend)
+    engine.n_clusters = k
+    if engine.resolve_backend(len(X)) == 'minibatch':
+        engine.model = engine.fit_minibatch(X[sample], init=centers)
+    else:
+        engine.model = KMeans(n_clusters=k, init=centers, n_init=1, max_iter=300).fit(X[sample])
+    labels = engine.align_clusters(engine.model.predict(X), reference=centers)
+    
+    in_sample = np.unique(sample)
+    ref, boot = reference_labels[in_sample], labels[in_sample]
+    both = np.bincount(ref * k + boot, minlength=k * k).reshape(k, k)
+    union = np.bincount(ref, minlength=k)[:, None] + np.bincount(boot, minlength=k)[None, :] - both
+    with np.errstate(invalid='ignore', divide='ignore'):
+        jaccard = np.where(union > 0, both / union, 0).max(axis=1)
+    
+    return labels.astype(np.int16), jaccard
+
+
+def ranking_score(rfm_df, rank_by='Monetary'):
+    """Skor ranking per pelanggan (semakin tinggi semakin baik); 'RFM_Score' = skor gabungan 0-3"""
+    if rank_by != 'RFM_Score':
+        return rfm_df[rank_by].to_numpy(dtype=float)
+    
+    recency, frequency, monetary = (rfm_df[column].to_numpy(dtype=float) for column in ['Recency', 'Frequency', 'Monetary'])
+    max_recency = max(recency.max(), 1)
+    return (max_recency - recency) / max_recency + frequency / max(frequency.max(), 1) + monetary / max(monetary.max(), 1)
+
+
+def top_positions(score, candidates, n):
+    """Posisi n skor tertinggi di antara `candidates` (mask), urut skor turun
+
+    Partial selection (np.argpartition) tanpa sort penuh; nilai kembar di batas diambil
+    dari posisi terdepan, sama seperti DataFrame.nlargest(keep='first').
+    """
+    positions = np.flatnonzero(candidates)
+    if n <= 0 or len(positions) == 0:
+        return positions[:0]
+    
+    values = score[positions]
+    if n < len(positions):
+        threshold = values[np.argpartition(values, len(values) - n)[len(values) - n]]
+        above = np.flatnonzero(values > threshold)
+        tied = np.flatnonzero(values == threshold)[:n - len(above)]
+        keep = np.concatenate([above, tied])
+        positions, values = positions[keep], values[keep]
+    return positions[np.lexsort((positions, -values))]
+
+
+def segment_mask(segment, names):
+    """Mask pelanggan yang segmennya ada di `names`; kolom kategorikal cukup lookup per kode"""
+    if not isinstance(segment.dtype, pd.CategoricalDtype):
+        return segment.isin(names).to_numpy()
+    lookup = np.append(segment.cat.categories.isin(names), False)  # kode -1 (kosong) → False
+    return lookup[segment.cat.codes.to_numpy()]
+
+
+def select_campaign(rfm_df, cluster_labels, n=CAMPAIGN_SIZE, quotas=None, rank_by='Monetary', tiers=CAMPAIGN_TIERS):
+    """Pilih pelanggan kampanye diskon: kuota per segmen dulu, sisa slot diisi per tier prioritas
+
+    `quotas` = {segmen: jumlah slot}; segmen berkuota hanya mendapat slot kuotanya. Jika total
+    kuota melebihi `n`, kuota diperkecil proporsional (sisa pembulatan terbesar) sehingga totalnya
+    tepat `n`. Sisa slot (n - total kuota) diisi dari `tiers` berurutan, masing-masing pelanggan
+    terbaik menurut `rank_by` ('Monetary', 'Frequency' atau 'RFM_Score'). Hasil maksimal `n` baris
+    (baris rfm_df + kolom Discount).
+    """
+    quotas = {segment: count for segment, count in (quotas or {}).items() if count > 0}
+    score = ranking_score(rfm_df, rank_by)
+    segment = rfm_df['Segment']
+    available = ~segment_mask(segment, list(quotas))
+    
+    if sum(quotas.values()) > n:
+        shares = np.array(list(quotas.values()), dtype=np.float64) * n / sum(quotas.values())
+        counts = np.floor(shares).astype(int)
+        counts[np.argsort(counts - shares, kind='stable')[:n - counts.sum()]] += 1
+        quotas = dict(zip(quotas, counts.tolist()))
+    
+    picks = [top_positions(score, segment_mask(segment, [name]), count) for name, count in quotas.items()]
+    remaining = n - sum(len(pick) for pick in picks)
+    for tier in tiers:
+        if remaining <= 0:
+            break
+        candidates = available if tier is None else available & segment_mask(segment, tier)
+        pick = top_positions(score, candidates, remaining)
+        available[pick] = False
+        remaining -= len(pick)
+        picks.append(pick)
+    
+    campaign = rfm_df.iloc[np.concatenate(picks) if picks else []]
+    return campaign.assign(Discount=segment_attribute(campaign, cluster_labels, 'discount'))
+
+
 class AntyLaundryKMeans:
     """Engine untuk K-Means Clustering dengan RFM Analysis"""
     
-    def __init__(self):
+    def __init__(self, backend='auto', auto_k=False):
         self.n_clusters = 5
+        self.backend = backend
+        self.auto_k = auto_k
+        self.previous = None  # centroid run sebelumnya (CentroidMemory.get) untuk warm start
+        self.fit_stats = {}
         self.model = None
         self.scaler = StandardScaler()
+        self.max_date = None
+        self.labels = {}  # label segmen per cluster dari label_clusters/assign_clusters
+        self.date_formats = {}  # format tanggal per kolom yang sudah dideteksi (satu engine = satu file)
         
     def find_column(self, df, keywords):
         """Mencari kolom berdasarkan keyword - prioritas exact match"""
+        columns = df.columns if hasattr(df, 'columns') else list(df)
+        
         for keyword in keywords:
-            for col in df.columns:
+            for col in columns:
                 if str(col).lower().strip() == keyword.lower():
                     return col
         
         for keyword in keywords:
             keyword_clean = keyword.lower().replace(' ', '').replace('_', '')
-            for col in df.columns:
+            for col in columns:
                 col_clean = str(col).lower().strip().replace(' ', '').replace('_', '')
                 if keyword_clean == col_clean:
                     return col
         
         for keyword in keywords:
             keyword_clean = keyword.lower().replace(' ', '').replace('_', '')
-            for col in df.columns:
+            for col in columns:
                 col_clean = str(col).lower().strip().replace(' ', '').replace('_', '')
                 if keyword_clean in col_clean:
                     return col
         
         return None
     
-    def load_and_clean_data(self, df, months_back=1):
-        """Membersihkan dan memvalidasi data - DENGAN FILTER PERIODE"""
-        df = df.copy()
-        
+    def match_columns(self, df):
+        """Pemetaan kolom file → kolom standar tanpa menampilkan pesan"""
+        col_mapping = {}
+        for target, label, missing_label, keywords, required in COLUMN_RULES:
+            col = self.find_column(df, keywords)
+            if col:
+                col_mapping[col] = target
+        return col_mapping
+    
+    def resolve_columns(self, df):
+        """Mencocokkan kolom file dengan kolom standar (Tanggal, Konsumen, dst.)"""
         st.info("🔍 Mencari kolom yang dibutuhkan...")
         
         col_mapping = {}
         
-        tanggal_col = self.find_column(df, ['tanggal ar', 'tanggal ambil', 'tgl ambil', 'tanggalambil'])
-        if tanggal_col:
-            col_mapping[tanggal_col] = 'Tanggal'
-            st.success(f"✅ Tanggal: **{tanggal_col}** → Tanggal")
-        else:
-            st.error("❌ Kolom 'Tanggal Ambil' tidak ditemukan!")
-            return None
+        for target, label, missing_label, keywords, required in COLUMN_RULES:
+            col = self.find_column(df, keywords)
+            if col:
+                col_mapping[col] = target
+                st.success(f"✅ {label}: **{col}** → {target}")
+            elif required:
+                st.error(f"❌ Kolom '{missing_label}' tidak ditemukan!")
+                return None
         
-        konsumen_col = self.find_column(df, ['konsumer', 'konsumen', 'customer', 'pelanggan'])
-        if konsumen_col:
-            col_mapping[konsumen_col] = 'Konsumen'
-            st.success(f"✅ Konsumen: **{konsumen_col}** → Konsumen")
-        else:
-            st.error("❌ Kolom 'Konsumen' tidak ditemukan!")
-            return None
+        return col_mapping
+    
+    def load_and_clean_data(self, df, months_back=1, store=None, resolver=None, store_months=None):
+        """Membersihkan dan memvalidasi data - DENGAN FILTER PERIODE
         
-        harga_col = self.find_column(df, ['total harg', 'total harga', 'totalharga'])
-        if harga_col:
-            col_mapping[harga_col] = 'Total_Harga'
-            st.success(f"✅ Total Harga: **{harga_col}** → Total_Harga")
+        Jika `store` (TransactionStore) diberikan, data dibaca dari penyimpanan lokal
+        dan hanya partisi bulan dalam periode filter yang dimuat. Jika `resolver`
+        (CustomerResolver) diberikan, variasi nama pelanggan yang sama digabung.
+        `months_back=None` melewati filter periode (semua periode dihitung kemudian
+        oleh calculate_rfm_windows dari tanggal maksimal yang disimpan di self.max_date);
+        partisi store yang dibaca lalu = `store_months` (default periode terpanjang).
+        """
+        if store is not None:
+            df = store.load_window(months_back or store_months or max(PERIOD_OPTIONS))
+            if df.empty:
+                st.error("❌ Penyimpanan lokal masih kosong!")
+                return None
+            st.info(f"💾 {len(df)} baris dibaca dari penyimpanan lokal (hanya partisi periode terpilih)")
+            col_mapping = {}
         else:
-            st.error("❌ Kolom 'Total Harga' tidak ditemukan!")
-            return None
-        
-        invoice_col = self.find_column(df, ['nota', 'invoice', 'no nota', 'nonota', 'no.nota'])
-        if invoice_col:
-            col_mapping[invoice_col] = 'No_Invoice'
-            st.success(f"✅ No Invoice: **{invoice_col}** → No_Invoice")
-        
-        status_col = self.find_column(df, ['status order', 'statusorder', 'status'])
-        if status_col:
-            col_mapping[status_col] = 'Status_Order'
-            st.success(f"✅ Status Order: **{status_col}** → Status_Order")
-        
-        tanggal_order_col = self.find_column(df, ['tanggal order', 'tanggalorder', 'tgl order'])
-        if tanggal_order_col:
-            col_mapping[tanggal_order_col] = 'Tanggal_Order'
-            st.success(f"✅ Tanggal Order: **{tanggal_order_col}** → Tanggal_Order")
+            df = df.copy()
+            
+            col_mapping = self.resolve_columns(df)
+            if col_mapping is None:
+                return None
         
         df = df.rename(columns=col_mapping)
         
@@ -944,10 +2562,12 @@ class AntyLaundryKMeans:
         
         # Parse tanggal
         try:
-            df['Tanggal'] = pd.to_datetime(df['Tanggal'], errors='coerce')
+            df['Tanggal'], tanggal_stats = parse_dates(df['Tanggal'], self.date_formats)
+            report_date_stats('Tanggal', tanggal_stats)
             
             if 'Tanggal_Order' in df.columns:
-                df['Tanggal_Order'] = pd.to_datetime(df['Tanggal_Order'], errors='coerce')
+                df['Tanggal_Order'], order_stats = parse_dates(df['Tanggal_Order'], self.date_formats)
+                report_date_stats('Tanggal Order', order_stats)
                 df['Tanggal'] = df['Tanggal'].fillna(df['Tanggal_Order'])
             
             df = df.dropna(subset=['Tanggal'])
@@ -957,17 +2577,19 @@ class AntyLaundryKMeans:
         
         # Filter periode
         max_date = df['Tanggal'].max()
-        cutoff_date = max_date - timedelta(days=30 * months_back)
-        
+        self.max_date = max_date
         st.info(f"📅 Tanggal maksimal: {max_date.strftime('%d/%m/%Y')}")
-        st.info(f"📅 Filter dari: {cutoff_date.strftime('%d/%m/%Y')}")
         
-        df_before_filter = len(df)
-        df = df[df['Tanggal'] > cutoff_date]
-        df_after_filter = len(df)
-        
-        st.success(f"✅ Data difilter: {df_after_filter} transaksi dari {df_before_filter} (periode {months_back} bulan)")
-        st.success(f"✅ Periode: {df['Tanggal'].min().strftime('%d/%m/%Y')} - {df['Tanggal'].max().strftime('%d/%m/%Y')}")
+        if months_back is not None:
+            cutoff_date = max_date - timedelta(days=30 * months_back)
+            st.info(f"📅 Filter dari: {cutoff_date.strftime('%d/%m/%Y')}")
+            
+            df_before_filter = len(df)
+            df = df[df['Tanggal'] > cutoff_date]
+            df_after_filter = len(df)
+            
+            st.success(f"✅ Data difilter: {df_after_filter} transaksi dari {df_before_filter} (periode {months_back} bulan)")
+            st.success(f"✅ Periode: {df['Tanggal'].min().strftime('%d/%m/%Y')} - {df['Tanggal'].max().strftime('%d/%m/%Y')}")
         
         # Filter Total Harga > 0
         if 'Total_Harga' in df.columns:
@@ -981,38 +2603,349 @@ class AntyLaundryKMeans:
         df['Konsumen'] = df['Konsumen'].astype(str).str.strip()
         df = df.dropna(subset=['Total_Harga', 'Konsumen'])
         
+        if resolver is not None:
+            n_names = df['Konsumen'].nunique()
+            df['Konsumen'] = resolver.resolve(df['Konsumen'])
+            merged = n_names - df['Konsumen'].nunique()
+            if merged > 0:
+                st.info(f"🧑 {merged} variasi nama digabung ke pelanggan yang sama (mis. 'Bu Rina' = 'BU RINA')")
+        
         st.success(f"✅ Total {len(df)} transaksi valid dari {len(df['Konsumen'].unique())} pelanggan unik")
         
         return df
     
+    def compact_data(self, df):
+        """Mengubah data transaksi bersih ke tipe data hemat memori
+        
+        Hanya kolom standar yang disimpan. Konsumen/Status_Order/No_Invoice/Telepon → kategori,
+        Total_Harga → integer rupiah, Tanggal → resolusi hari.
+        Return (DataFrame ringkas, laporan memori per kolom).
+        """
+        before = df.memory_usage(deep=True)
+        df = df[[col for col in STORE_COLUMNS if col in df.columns]].reset_index(drop=True)
+        
+        for col in ['Konsumen', 'Status_Order', 'No_Invoice', 'Telepon']:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        
+        harga = df['Total_Harga']
+        if (harga == harga.round()).all():
+            int_type = np.int32 if harga.abs().max() < np.iinfo(np.int32).max else np.int64
+            df['Total_Harga'] = harga.astype(int_type)
+        
+        for col in ['Tanggal', 'Tanggal_Order']:
+            if col in df.columns:
+                df[col] = df[col].dt.normalize().astype('datetime64[s]')
+        
+        after = df.memory_usage(deep=True)
+        report = pd.DataFrame({'Sebelum (KB)': before / 1024, 'Sesudah (KB)': after / 1024}).fillna(0)
+        report.loc['TOTAL'] = report.sum()
+        report['Hemat (%)'] = (1 - report['Sesudah (KB)'] / report['Sebelum (KB)'].where(report['Sebelum (KB)'] > 0)) * 100
+        
+        return df, report.round(1)
+    
     def calculate_rfm(self, df, reference_date=None):
-        """Menghitung nilai RFM"""
+        """Menghitung nilai RFM (+ fitur perilaku) dalam satu pass vektor"""
         
         if reference_date is None:
             reference_date = df['Tanggal'].max()
         
         st.info(f"📊 Tanggal referensi RFM: {reference_date.strftime('%d/%m/%Y')}")
         
-        if 'No_Invoice' in df.columns:
-            rfm = df.groupby('Konsumen').agg({
-                'Tanggal': lambda x: (reference_date - x.max()).days,
-                'No_Invoice': 'nunique',
-                'Total_Harga': 'sum'
-            }).reset_index()
+        rfm = rfm_kernel(df, reference_date)
+        
+        st.success(f"✅ RFM dihitung untuk {len(rfm)} pelanggan")
+        
+        st.info(f"📊 Recency: {rfm['Recency'].min():.0f} - {rfm['Recency'].max():.0f} hari")
+        st.info(f"📊 Frequency: {rfm['Frequency'].min():.0f} - {rfm['Frequency'].max():.0f} transaksi")
+        st.info(f"📊 Monetary: Rp {rfm['Monetary'].min():,.0f} - Rp {rfm['Monetary'].max():,.0f}")
+        
+        return rfm
+    
+    def calculate_rfm_windows(self, df, periods=PERIOD_OPTIONS):
+        """Menghitung RFM untuk semua pilihan periode dalam satu kali pengurutan
+        
+        `df` adalah data bersih tanpa filter periode (load_and_clean_data dengan
+        months_back=None). Batas tiap periode sama seperti filter periode biasa:
+        tanggal maksimal - 30 hari x bulan. Return {bulan: (rfm, ringkasan data)}.
+        """
+        reference_date = df['Tanggal'].max()
+        max_date = self.max_date if self.max_date is not None else reference_date
+        cutoffs = {months: max_date - timedelta(days=30 * months) for months in periods}
+        
+        st.info(f"📊 Tanggal referensi RFM: {reference_date.strftime('%d/%m/%Y')}")
+        
+        rfms = rfm_windows(df, reference_date, cutoffs)
+        sorted_dates = np.sort(df['Tanggal'].to_numpy(dtype='datetime64[ns]'))
+        
+        windows = {}
+        for months, cutoff in cutoffs.items():
+            start = np.searchsorted(sorted_dates, np.datetime64(cutoff, 'ns'), side='right')
+            windows[months] = (rfms[months], {
+                'n_transactions': len(sorted_dates) - int(start),
+                'date_min': pd.Timestamp(sorted_dates[start]) if start < len(sorted_dates) else None,
+                'date_max': reference_date,
+            })
+        
+        overview = pd.DataFrame({
+            'Periode': [f"{months} bulan" for months in windows],
+            'Transaksi': [summary['n_transactions'] for _, summary in windows.values()],
+            'Pelanggan': [len(rfm) for rfm, _ in windows.values()],
+        })
+        st.success(f"✅ RFM dihitung untuk {len(windows)} pilihan periode sekaligus")
+        st.dataframe(overview, use_container_width=True, hide_index=True)
+        
+        return windows
+    
+    def segment_history(self, df, n_months=SNAPSHOT_MONTHS):
+        """RFM & segmen per pelanggan di setiap akhir bulan (n_months terakhir)
+        
+        RFM tiap akhir bulan dihitung kumulatif oleh rfm_snapshots. Scaler & K-Means dilatih
+        sekali pada snapshot terakhir lalu dipakai untuk semua snapshot, sehingga segmen
+        antar bulan bisa dibandingkan. Return (DataFrame snapshot, urutan nama segmen).
+        """
+        month_ends = pd.date_range(end=df['Tanggal'].max().normalize(), periods=n_months, freq='ME')
+        series = rfm_snapshots(df, month_ends)
+        
+        if series.empty:
+            st.error("❌ Belum ada akhir bulan yang tercakup data transaksi!")
+            return None, None
+        
+        latest = series[series['Snapshot'] == series['Snapshot'].max()].reset_index(drop=True)
+        if len(latest) < self.n_clusters:
+            st.error(f"❌ Minimal {self.n_clusters} pelanggan dibutuhkan untuk clustering!")
+            return None, None
+        
+        st.info(f"📅 {series['Snapshot'].nunique()} snapshot akhir bulan: {series['Snapshot'].min().strftime('%m/%Y')} - {series['Snapshot'].max().strftime('%m/%Y')}")
+        
+        latest = self.run_kmeans(self.normalize_data(latest))
+        _, labels = self.label_clusters(latest)
+        
+        features = ['Recency', 'Frequency', 'Monetary']
+        clusters = self.model.predict(self.scaler.transform(series[features]))
+        names = {cluster: label['name'] for cluster, label in labels.items()}
+        segment_order = [label['name'] for label in sorted(labels.values(), key=lambda label: label['priority'])]
+        series['Segment'] = pd.Categorical(pd.Series(clusters).map(names), categories=segment_order)
+        
+        st.success(f"✅ Segmen dihitung untuk {len(series)} baris pelanggan x bulan")
+        
+        return series, segment_order
+    
+    def segment_migration(self, series, snapshot=None):
+        """Matriks migrasi segmen bulan ke bulan (baris: bulan sebelumnya, kolom: bulan ini)
+        
+        Tanpa `snapshot` semua pasangan bulan berurutan dijumlahkan. Pelanggan yang belum
+        punya transaksi di bulan sebelumnya dihitung sebagai 'Pelanggan Baru'.
+        """
+        segments = list(series['Segment'].cat.categories)
+        n_segments = len(segments)
+        snapshots = np.sort(series['Snapshot'].unique())
+        
+        customer_codes, customers = pd.factorize(series['Konsumen'])
+        snapshot_codes = np.searchsorted(snapshots, series['Snapshot'].to_numpy())
+        wide = np.full((len(customers), len(snapshots)), -1, dtype=np.int64)
+        wide[customer_codes, snapshot_codes] = series['Segment'].cat.codes.to_numpy()
+        
+        if snapshot is None:
+            before, after = wide[:, :-1].ravel(), wide[:, 1:].ravel()
         else:
-            rfm = df.groupby('Konsumen').agg({
-                'Tanggal': [lambda x: (reference_date - x.max()).days, 'count'],
-                'Total_Harga': 'sum'
-            }).reset_index()
-            rfm.columns = ['Konsumen', 'Recency', 'Frequency', 'Monetary']
-            return rfm
+            k = int(np.searchsorted(snapshots, np.datetime64(snapshot, 'ns')))
+            before = wide[:, k - 1] if k > 0 else np.full(len(customers), -1)
+            after = wide[:, k]
+        
+        present = after >= 0
+        before = np.where(before[present] >= 0, before[present], n_segments)
+        counts = np.bincount(before * n_segments + after[present], minlength=(n_segments + 1) * n_segments)
+        
+        return pd.DataFrame(
+            counts.reshape(n_segments + 1, n_segments),
+            index=pd.Index(segments + ['Pelanggan Baru'], name='Dari'),
+            columns=pd.Index(segments, name='Ke')
+        )
+    
+    def filter_dated(self, df):
+        """Filter BATAL & parse tanggal (tanpa filter harga/periode)
+
+        `df` sudah memakai nama kolom standar. Return (DataFrame bertanggal, info) dengan
+        info: batal, dated (baris bertanggal), max_date (sama seperti load_and_clean_data), date_stats.
+        """
+        info = {'batal': 0, 'dated': 0, 'max_date': None, 'date_stats': None}
+        df = df.copy()
         
-        rfm.columns = ['Konsumen', 'Recency', 'Frequency', 'Monetary']
+        # Filter BATAL
+        if 'Status_Order' in df.columns:
+            is_batal = df['Status_Order'].astype(str).str.lower().str.contains('batal', na=False)
+            info['batal'] = int(is_batal.sum())
+            df = df[~is_batal]
         
-        rfm['Recency'] = pd.to_numeric(rfm['Recency'], errors='coerce')
-        rfm['Frequency'] = pd.to_numeric(rfm['Frequency'], errors='coerce')
-        rfm['Monetary'] = pd.to_numeric(rfm['Monetary'], errors='coerce')
-        rfm = rfm.dropna()
+        # Parse tanggal
+        df['Tanggal'], info['date_stats'] = parse_dates(df['Tanggal'], self.date_formats)
+        if 'Tanggal_Order' in df.columns:
+            df['Tanggal'] = df['Tanggal'].fillna(parse_dates(df['Tanggal_Order'], self.date_formats)[0])
+        df = df.dropna(subset=['Tanggal'])
+        
+        if not df.empty:
+            info['dated'] = len(df)
+            info['max_date'] = df['Tanggal'].max()
+        return df, info
+    
+    def clean_rows(self, df):
+        """Filter per baris (BATAL, tanggal, harga > 0, nama) tanpa filter periode
+        
+        Dipakai mode streaming dan agregat inkremental; `df` sudah memakai nama kolom standar.
+        Return (DataFrame bersih, info) seperti filter_dated.
+        """
+        df, info = self.filter_dated(df)
+        if df.empty:
+            return df, info
+        
+        # Filter Total Harga > 0 & bersihkan nama konsumen
+        df['Total_Harga'] = pd.to_numeric(df['Total_Harga'], errors='coerce')
+        df = df[df['Total_Harga'] > 0]
+        df['Konsumen'] = df['Konsumen'].astype(str).str.strip()
+        df = df.dropna(subset=['Total_Harga', 'Konsumen'])
+        
+        return df, info
+    
+    def stream_rfm(self, read_chunks, months_back=1, resolver=None):
+        """Menghitung RFM langsung dari file besar per chunk (mode streaming)
+
+        `read_chunks` = fungsi tanpa argumen yang mengembalikan iterator chunk baru; file dibaca
+        dua kali. Pass pertama hanya memfilter BATAL & mem-parse tanggal untuk tanggal maksimal
+        (batas periode). Pass kedua membersihkan tiap chunk dengan aturan yang sama seperti
+        load_and_clean_data, membuang transaksi di luar periode, lalu melipatnya ke akumulator
+        per pelanggan (kunjungan terakhir, total belanja, jumlah baris) dan himpunan nota unik
+        (kode pelanggan + hash nota). Memori ∝ pelanggan + nota dalam periode, bukan baris.
+        """
+        col_mapping = None
+        max_date = None
+        
+        for chunk in read_chunks():
+            if col_mapping is None:
+                col_mapping = self.resolve_columns(chunk)
+                if col_mapping is None:
+                    return None, None
+                date_columns = [col for col, target in col_mapping.items() if target in ('Tanggal', 'Tanggal_Order', 'Status_Order')]
+            
+            _, info = self.filter_dated(chunk[date_columns].rename(columns=col_mapping))
+            if info['max_date'] is not None:
+                max_date = info['max_date'] if max_date is None else max(max_date, info['max_date'])
+        
+        if col_mapping is None or max_date is None:
+            st.error("❌ Tidak ada data transaksi yang valid!")
+            return None, None
+        
+        cutoff_date = max_date - timedelta(days=30 * months_back)
+        st.info(f"📅 Tanggal maksimal: {max_date.strftime('%d/%m/%Y')}")
+        st.info(f"📅 Filter dari: {cutoff_date.strftime('%d/%m/%Y')}")
+        
+        has_invoice = 'No_Invoice' in col_mapping.values()
+        customers = pd.Index([], dtype=object)
+        last = np.array([], dtype=np.int64)
+        monetary = np.array([], dtype=np.float64)
+        rows = np.array([], dtype=np.int64)
+        integral = True
+        first_ns = None
+        invoice_codes, invoice_hashes = [], []
+        invoice_rows = 0
+        total_batal = 0
+        total_dated = 0
+        date_stats = None
+        
+        for chunk in read_chunks():
+            chunk, info = self.clean_rows(chunk[list(col_mapping)].rename(columns=col_mapping))
+            total_batal += info['batal']
+            total_dated += info['dated']
+            date_stats = merge_date_stats(date_stats, info['date_stats'])
+            
+            chunk = chunk[chunk['Tanggal'] > cutoff_date] if not chunk.empty else chunk
+            if chunk.empty:
+                continue
+            
+            # Nama baru mendapat kode berikutnya; akumulator diperpanjang sesuai jumlah pelanggan
+            new_names = pd.Index(chunk['Konsumen'].unique()).difference(customers)
+            if len(new_names):
+                customers = customers.append(new_names)
+                grow = len(customers) - len(last)
+                last = np.r_[last, np.full(grow, np.iinfo(np.int64).min)]
+                monetary = np.r_[monetary, np.zeros(grow)]
+                rows = np.r_[rows, np.zeros(grow, dtype=np.int64)]
+            codes = customers.get_indexer(chunk['Konsumen'])
+            
+            dates = chunk['Tanggal'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+            np.maximum.at(last, codes, dates)
+            first_ns = dates.min() if first_ns is None else min(first_ns, dates.min())
+            monetary += np.bincount(codes, weights=chunk['Total_Harga'].to_numpy(dtype=np.float64), minlength=len(customers))
+            rows += np.bincount(codes, minlength=len(customers))
+            integral &= pd.api.types.is_integer_dtype(chunk['Total_Harga'])
+            
+            if has_invoice:
+                invoice = chunk['No_Invoice'].notna().to_numpy()
+                pair_codes, pair_hashes = unique_pairs(
+                    codes[invoice].astype(np.int64),
+                    pd.util.hash_pandas_object(chunk.loc[invoice, 'No_Invoice'].astype(str), index=False).to_numpy()
+                )
+                invoice_codes.append(pair_codes)
+                invoice_hashes.append(pair_hashes)
+                invoice_rows += len(pair_codes)
+                
+                # Gabungkan himpunan nota secara berkala agar memori tetap terbatas
+                if invoice_rows > 4 * STREAM_CHUNK_SIZE and len(invoice_codes) > 1:
+                    pair_codes, pair_hashes = unique_pairs(np.concatenate(invoice_codes), np.concatenate(invoice_hashes))
+                    invoice_codes, invoice_hashes = [pair_codes], [pair_hashes]
+                    invoice_rows = len(pair_codes)
+        
+        if total_batal > 0:
+            st.warning(f"⚠️ {total_batal} transaksi BATAL dihapus")
+        report_date_stats('Tanggal', date_stats)
+        
+        if customers.empty:
+            st.error("❌ Tidak ada transaksi valid pada periode ini!")
+            return None, None
+        
+        # Penggabungan nama dilakukan sekali di akhir, pada daftar pelanggan (bukan per baris)
+        names = pd.Series(customers.to_numpy(dtype=object))
+        if resolver is not None:
+            names = resolver.resolve(names)
+            merged = len(customers) - names.nunique()
+            if merged > 0:
+                st.info(f"🧑 {merged} variasi nama digabung ke pelanggan yang sama (mis. 'Bu Rina' = 'BU RINA')")
+        group, konsumen = pd.factorize(names, sort=True)
+        n_groups = len(konsumen)
+        
+        group_last = np.full(n_groups, np.iinfo(np.int64).min)
+        np.maximum.at(group_last, group, last)
+        group_rows = np.bincount(group, weights=rows, minlength=n_groups).astype(np.int64)
+        group_monetary = np.bincount(group, weights=monetary, minlength=n_groups)
+        if integral:
+            group_monetary = np.rint(group_monetary).astype(np.int64)
+        
+        if has_invoice:
+            pair_codes = np.concatenate(invoice_codes) if invoice_codes else np.array([], dtype=np.int64)
+            pair_hashes = np.concatenate(invoice_hashes) if invoice_hashes else np.array([], dtype=np.uint64)
+            pair_groups, _ = unique_pairs(group[pair_codes].astype(np.int64), pair_hashes)
+            frequency = np.bincount(pair_groups, minlength=n_groups)
+        else:
+            frequency = group_rows
+        
+        reference_ns = group_last.max()
+        reference_date = pd.Timestamp(reference_ns)
+        summary = {
+            'n_transactions': int(rows.sum()),
+            'date_min': pd.Timestamp(first_ns),
+            'date_max': reference_date,
+        }
+        
+        st.success(f"✅ Data difilter: {summary['n_transactions']} transaksi valid dari {total_dated} (periode {months_back} bulan)")
+        st.success(f"✅ Periode: {summary['date_min'].strftime('%d/%m/%Y')} - {reference_date.strftime('%d/%m/%Y')}")
+        st.info(f"📊 Tanggal referensi RFM: {reference_date.strftime('%d/%m/%Y')}")
+        
+        rfm = pd.DataFrame({
+            'Konsumen': konsumen,
+            'Recency': (reference_ns - group_last) // DAY_NS,
+            'Frequency': frequency.astype(np.int64),
+            'Monetary': group_monetary,
+        })
         
         st.success(f"✅ RFM dihitung untuk {len(rfm)} pelanggan")
         
@@ -1020,7 +2953,7 @@ class AntyLaundryKMeans:
         st.info(f"📊 Frequency: {rfm['Frequency'].min():.0f} - {rfm['Frequency'].max():.0f} transaksi")
         st.info(f"📊 Monetary: Rp {rfm['Monetary'].min():,.0f} - Rp {rfm['Monetary'].max():,.0f}")
         
-        return rfm
+        return rfm, summary
     
     def normalize_data(self, rfm_df):
         """Normalisasi data RFM"""
@@ -1031,25 +2964,164 @@ class AntyLaundryKMeans:
         rfm_df['Frequency_scaled'] = rfm_scaled[:, 1]
         rfm_df['Monetary_scaled'] = rfm_scaled[:, 2]
         
-        return rfm_df
+        return rfm_df
+    
+    def run_kmeans(self, rfm_df):
+        """Jalankan K-Means Clustering
+        
+        Backend 'auto' memakai MiniBatchKMeans jika jumlah pelanggan di atas
+        MINIBATCH_THRESHOLD, selain itu K-Means penuh. Return None jika pelanggan terlalu
+        sedikit untuk pemilihan k otomatis (lihat select_k).
+        """
+        X = rfm_df[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].values
+        
+        if self.auto_k:
+            fit = self.select_k(X)
+            if fit is None:
+                return None
+            labels, inertia, backend = fit
+        else:
+            labels, inertia, backend = self.fit_clusters(X)
+        
+        if self.previous is not None and len(self.previous) == self.n_clusters:
+            labels = self.align_clusters(labels)
+        
+        rfm_df['Cluster'] = labels
+        
+        if backend == 'minibatch':
+            st.success(f"✅ Mini-Batch K-Means selesai dengan {self.n_clusters} cluster ({len(X)} pelanggan, batch {MINIBATCH_SIZE})")
+        else:
+            st.success(f"✅ K-Means clustering selesai dengan {self.n_clusters} cluster")
+        st.info(f"📊 Inertia (WCSS): {inertia:.2f}")
+        
+        stats = self.fit_stats
+        if stats.get('warm'):
+            cold_seconds, cold_iter = self.previous['Cold_Seconds'].iloc[0], self.previous['Cold_Iter'].iloc[0]
+            cold = f"{cold_seconds:.2f} detik, {cold_iter:.0f} iterasi" if pd.notna(cold_seconds) else "belum ada"
+            st.info(f"♻️ Warm start dari centroid run sebelumnya: {stats['seconds']:.2f} detik, {stats['n_iter']} iterasi (cold start terakhir: {cold})")
+        elif stats:
+            st.info(f"🧊 Cold start: {stats['seconds']:.2f} detik, {stats['n_iter']} iterasi")
+        
+        return rfm_df
+    
+    def fit_clusters(self, X):
+        """Latih model untuk self.n_clusters (tanpa pesan), return (label, inertia, backend)
+        
+        Jika ada centroid run sebelumnya dengan k yang sama, centroid tersebut (diskalakan
+        dengan scaler saat ini) menjadi inisialisasi tunggal (warm start) menggantikan
+        10 kali restart k-means++. Waktu & iterasi dicatat di self.fit_stats.
+        """
+        backend = self.resolve_backend(len(X))
+        
+        init = None
+        if self.previous is not None and len(self.previous) == self.n_clusters:
+            init = self.scaler.transform(self.previous[['Recency', 'Frequency', 'Monetary']])
+        
+        start = time.perf_counter()
+        if backend == 'minibatch':
+            self.model = self.fit_minibatch(X, init=init)
+            labels, inertia = self.model.predict(X), -self.model.score(X)
+        else:
+            self.model = KMeans(
+                n_clusters=self.n_clusters,
+                init=init if init is not None else 'k-means++',
+                random_state=42,
+                n_init=1 if init is not None else 10,
+                max_iter=300
+            )
+            labels = self.model.fit_predict(X)
+            inertia = self.model.inertia_
+        
+        self.fit_stats = {
+            'warm': init is not None,
+            'seconds': time.perf_counter() - start,
+            'n_iter': int(getattr(self.model, 'n_iter_', getattr(self.model, 'n_steps_', 0))),
+        }
+        return labels, inertia, backend
+    
+    def resolve_backend(self, n_rows):
+        """Backend yang dipakai: 'auto' → 'minibatch' di atas MINIBATCH_THRESHOLD pelanggan"""
+        if self.backend == 'auto':
+            return 'minibatch' if n_rows > MINIBATCH_THRESHOLD else 'full'
+        return self.backend
+    
+    def align_clusters(self, labels, reference=None):
+        """Cocokkan cluster baru ke cluster acuan (jarak centroid, Hungarian)
+        
+        Acuan default = centroid run sebelumnya (self.previous); `reference` = centroid acuan
+        yang sudah diskalakan. Centroid model diurutkan ulang sehingga cluster yang paling
+        dekat dengan cluster acuan memakai ID yang sama. Return label dengan ID baru.
+        """
+        if reference is None:
+            reference = self.scaler.transform(self.previous[['Recency', 'Frequency', 'Monetary']])
+        old = reference
+        new = self.model.cluster_centers_
+        cost = ((new[:, None, :] - old[None, :, :]) ** 2).sum(axis=2)
+        new_ids, old_ids = linear_sum_assignment(cost)
+        
+        mapping = np.empty(len(new), dtype=np.int64)
+        mapping[new_ids] = old_ids
+        centers = np.empty_like(new)
+        centers[old_ids] = new[new_ids]
+        self.model.cluster_centers_ = centers
+        
+        return mapping[labels]
+    
+    def select_k(self, X, k_range=AUTO_K_RANGE):
+        """Pilih jumlah cluster otomatis: semua k dilatih paralel di proses worker
+        
+        Tiap k dinilai dengan silhouette pada sampel bertingkat (maks. SILHOUETTE_SAMPLE
+        titik) dan elbow dari kurva inertia. k dengan silhouette tertinggi dipakai.
+        Return (label, inertia, backend) untuk k terpilih; self.n_clusters & self.model ikut diset.
+        Jika pelanggan terlalu sedikit untuk rentang k, dipakai k = min(k default, pelanggan - 1);
+        jika k itu pun di bawah k terkecil SEGMENT_TIERS, return None (pemanggil menampilkan error).
+        """
+        k_range = [k for k in k_range if k < len(X)]
+        if not k_range:
+            if min(self.n_clusters, len(X) - 1) < min(SEGMENT_TIERS):
+                return None
+            self.n_clusters = min(self.n_clusters, len(X) - 1)
+            st.warning(f"⚠️ Hanya {len(X)} pelanggan, pemilihan k otomatis dilewati (k={self.n_clusters})")
+            return self.fit_clusters(X)
+        
+        fits = Parallel(n_jobs=PARALLEL_JOBS)(delayed(fit_k)(X, k, self.backend) for k in k_range)
+        
+        scores = pd.DataFrame({
+            'k': k_range,
+            'Inertia': [fit['inertia'] for fit in fits],
+            'Silhouette': [fit['silhouette'] for fit in fits],
+        })
+        elbow_k = find_elbow(scores['k'].to_numpy(), scores['Inertia'].to_numpy())
+        best = int(scores['Silhouette'].idxmax())
+        
+        self.n_clusters = k_range[best]
+        self.model = fits[best]['model']
+        self.fit_stats = fits[best]['stats']
+        
+        st.info(f"🔢 Jumlah cluster otomatis: k={self.n_clusters} (silhouette tertinggi), elbow inertia di k={elbow_k}")
+        st.dataframe(scores.round(3), use_container_width=True, hide_index=True)
+        
+        return fits[best]['labels'], fits[best]['inertia'], fits[best]['backend']
     
-    def run_kmeans(self, rfm_df):
-        """Jalankan K-Means Clustering"""
-        X = rfm_df[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].values
+    def fit_minibatch(self, X, batch_size=MINIBATCH_SIZE, epochs=MINIBATCH_EPOCHS, init=None):
+        """Latih MiniBatchKMeans bertahap dari batch matriks RFM terskala (partial_fit)
         
-        self.model = KMeans(
-            n_clusters=self.n_clusters,
-            random_state=42,
-            n_init=10,
-            max_iter=300
-        )
+        Centroid awal = `init` (warm start) atau K-Means penuh (n_init=10) pada sampel acak
+        3 batch, lalu setiap epoch membaca seluruh data per batch dengan urutan acak.
+        """
+        rng = np.random.default_rng(42)
+        if init is None:
+            init_rows = rng.permutation(len(X))[:max(3 * batch_size, self.n_clusters)]
+            init = KMeans(n_clusters=self.n_clusters, random_state=42, n_init=10).fit(X[init_rows]).cluster_centers_
         
-        rfm_df['Cluster'] = self.model.fit_predict(X)
+        model = MiniBatchKMeans(n_clusters=self.n_clusters, init=init, n_init=1, random_state=42, batch_size=batch_size)
         
-        st.success(f"✅ K-Means clustering selesai dengan {self.n_clusters} cluster")
-        st.info(f"📊 Inertia (WCSS): {self.model.inertia_:.2f}")
+        for _ in range(epochs):
+            order = rng.permutation(len(X))
+            for start in range(0, len(X), batch_size):
+                model.partial_fit(X[order[start:start + batch_size]])
         
-        return rfm_df
+        return model
     
     def label_clusters(self, rfm_df):
         """Label setiap cluster berdasarkan karakteristik RFM dengan RFM Score"""
@@ -1082,87 +3154,179 @@ class AntyLaundryKMeans:
         for idx, row in cluster_summary.iterrows():
             st.write(f"**Cluster {row['Cluster']}**: Score={row['RFM_Score']:.2f}, Recency={row['Avg_Recency']:.0f} hari, Freq={row['Avg_Frequency']:.1f}x, Money=Rp{row['Avg_Monetary']:,.0f}, Count={row['Count']}")
         
-        # Labeling berdasarkan RANKING
-        labels = {}
+        # Labeling berdasarkan RANKING: nama segmen per peringkat dari SEGMENT_TIERS (katalog),
+        # atribut & template teks dari katalog segmen (satu baris per cluster)
+        k = len(cluster_summary)
+        segments = SEGMENT_CATALOG.loc[SEGMENT_TIERS[k], ['icon', 'discount', 'description', 'criteria']].reset_index()
+        segments.index = cluster_summary['Cluster'].astype(int).to_numpy()
+        segments['discount'] = segments['discount'].astype(int)
+        segments['priority'] = np.arange(1, k + 1)
         
-        for idx, row in cluster_summary.iterrows():
-            cluster_id = row['Cluster']
-            rank = idx + 1
-            
-            if rank == 1:
-                labels[cluster_id] = {
-                    'name': 'VIP Customer',
-                    'icon': '🏆',
-                    'discount': 10,
-                    'priority': 1,
-                    'description': f'Pelanggan VIP dengan transaksi sangat tinggi dan sangat aktif. RFM Score tertinggi ({row["RFM_Score"]:.2f}/3.0). Rata-rata belanja Rp{row["Avg_Monetary"]:,.0f}, transaksi {row["Avg_Frequency"]:.1f}x, terakhir {row["Avg_Recency"]:.0f} hari lalu.',
-                    'criteria': f'✓ Ranking #1 dari 5 cluster\n✓ RFM Score: {row["RFM_Score"]:.2f} (tertinggi)\n✓ Recency: {row["Avg_Recency"]:.0f} hari (sangat aktif)\n✓ Frequency: {row["Avg_Frequency"]:.1f}x (sangat tinggi)\n✓ Monetary: Rp{row["Avg_Monetary"]:,.0f} (sangat tinggi)'
-                }
-            
-            elif rank == 2:
-                labels[cluster_id] = {
-                    'name': 'Top Spender',
-                    'icon': '💎',
-                    'discount': 10,
-                    'priority': 2,
-                    'description': f'Pelanggan dengan nilai belanja tertinggi. RFM Score tinggi ({row["RFM_Score"]:.2f}/3.0). Rata-rata belanja Rp{row["Avg_Monetary"]:,.0f}, transaksi {row["Avg_Frequency"]:.1f}x.',
-                    'criteria': f'✓ Ranking #2\n✓ RFM Score: {row["RFM_Score"]:.2f}\n✓ Recency: {row["Avg_Recency"]:.0f} hari\n✓ Frequency: {row["Avg_Frequency"]:.1f}x\n✓ Monetary: Rp{row["Avg_Monetary"]:,.0f} (tinggi)'
-                }
-            elif rank == 3:
-                labels[cluster_id] = {
-                    'name': 'High Value Customer',
-                    'icon': '💚',
-                    'discount': 10,
-                    'priority': 3,
-                    'description': f'Pelanggan bernilai tinggi dengan potensi berkembang. RFM Score menengah-tinggi ({row["RFM_Score"]:.2f}/3.0).',
-                    'criteria': f'✓ Ranking #3\n✓ RFM Score: {row["RFM_Score"]:.2f}\n✓ Recency: {row["Avg_Recency"]:.0f} hari\n✓ Frequency: {row["Avg_Frequency"]:.1f}x\n✓ Monetary: Rp{row["Avg_Monetary"]:,.0f}'
-                }
-            
-            elif rank == 4:
-                labels[cluster_id] = {
-                    'name': 'Pelanggan Reguler',
-                    'icon': '⚠️',
-                    'discount': 10,
-                    'priority': 4,
-                    'description': f'Pelanggan dengan transaksi rutin namun nilai sedang. RFM Score menengah ({row["RFM_Score"]:.2f}/3.0).',
-                    'criteria': f'✓ Ranking #4\n✓ RFM Score: {row["RFM_Score"]:.2f}\n✓ Recency: {row["Avg_Recency"]:.0f} hari\n✓ Frequency: {row["Avg_Frequency"]:.1f}x\n✓ Monetary: Rp{row["Avg_Monetary"]:,.0f}'
-                }
-            
-            else:
-                labels[cluster_id] = {
-                    'name': 'Pelanggan Tidak Aktif',
-                    'icon': '😴',
-                    'discount': 10,
-                    'priority': 5,
-                    'description': f'Pelanggan yang sudah lama tidak bertransaksi. RFM Score terendah ({row["RFM_Score"]:.2f}/3.0). Perlu strategi re-engagement.',
-                    'criteria': f'✓ Ranking #5\n✓ RFM Score: {row["RFM_Score"]:.2f}\n✓ Recency: {row["Avg_Recency"]:.0f} hari (tidak aktif)\n✓ Frequency: {row["Avg_Frequency"]:.1f}x (rendah)\n✓ Monetary: Rp{row["Avg_Monetary"]:,.0f}'
-                }
+        values = pd.DataFrame({
+            'rank': segments['priority'],
+            'k': k,
+            'score': cluster_summary['RFM_Score'].to_numpy(),
+            'recency': cluster_summary['Avg_Recency'].to_numpy(),
+            'frequency': cluster_summary['Avg_Frequency'].to_numpy(),
+            'monetary': cluster_summary['Avg_Monetary'].to_numpy(),
+        }, index=segments.index).to_dict('records')
+        for column in ['description', 'criteria']:
+            segments[column] = [template.format(**row) for template, row in zip(segments[column], values)]
         
-        rfm_df['Segment'] = rfm_df['Cluster'].map(lambda x: labels[x]['name'])
-        rfm_df['Icon'] = rfm_df['Cluster'].map(lambda x: labels[x]['icon'])
-        rfm_df['Discount'] = rfm_df['Cluster'].map(lambda x: labels[x]['discount'])
-        rfm_df['Priority'] = rfm_df['Cluster'].map(lambda x: labels[x]['priority'])
-        rfm_df['Description'] = rfm_df['Cluster'].map(lambda x: labels[x]['description'])
-        rfm_df['Criteria'] = rfm_df['Cluster'].map(lambda x: labels[x]['criteria'])
+        labels = segments[['name', 'icon', 'discount', 'priority', 'description', 'criteria']].to_dict('index')
+        
+        # Per pelanggan hanya kode cluster; atribut lain di-join dari `labels` saat dibutuhkan
+        rfm_df['Cluster'] = rfm_df['Cluster'].astype(np.int8)
+        rfm_df['Segment'] = segment_codes(rfm_df['Cluster'], labels)
+        self.labels = labels
         
         return rfm_df, labels
     
-    def get_top_10_customers(self, rfm_df):
-        """Pilih TOP 10 pelanggan untuk diskon"""
-        top_segments = rfm_df[rfm_df['Segment'].isin(['VIP Customer', 'Top Spender'])]
-        top_10 = top_segments.nlargest(10, 'Monetary')
+    def bootstrap_stability(self, rfm_df, n_runs=BOOTSTRAP_RUNS):
+        """Uji stabilitas segmentasi dengan resample bootstrap paralel
+        
+        Setiap resample melatih ulang K-Means dari centroid hasil clustering saat ini (warm
+        start, n_init=1) di proses worker, lalu cluster dicocokkan ke cluster acuan.
+        Return (confidence per pelanggan = porsi resample dengan cluster sama,
+        DataFrame Jaccard rata-rata per cluster).
+        """
+        X = rfm_df[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].to_numpy()
+        reference_labels = rfm_df['Cluster'].to_numpy().astype(np.int64)
+        k = int(reference_labels.max()) + 1
+        centers = np.vstack([
+            X[reference_labels == cluster].mean(axis=0) if (reference_labels == cluster).any() else np.zeros(X.shape[1])
+            for cluster in range(k)
+        ])
+        
+        runs = Parallel(n_jobs=PARALLEL_JOBS)(
+            delayed(fit_bootstrap)(X, reference_labels, centers, seed, self.backend) for seed in range(n_runs)
+        )
         
-        if len(top_10) < 10:
-            remaining = 10 - len(top_10)
-            regular = rfm_df[rfm_df['Segment'] == 'High Value Customer'].nlargest(remaining, 'Monetary')
-            top_10 = pd.concat([top_10, regular])
+        same = np.zeros(len(X))
+        for labels, _ in runs:
+            same += labels == reference_labels
+        jaccard = np.vstack([run_jaccard for _, run_jaccard in runs])
+        
+        clusters = pd.DataFrame({
+            'Cluster': np.arange(k),
+            'Jaccard': jaccard.mean(axis=0),
+            'Jaccard_Min': jaccard.min(axis=0),
+            'Pelanggan': np.bincount(reference_labels, minlength=k),
+        })
+        return pd.Series(same / n_runs, index=rfm_df.index, name='Confidence'), clusters
+    
+    def export_model(self, cluster_labels, **info):
+        """Artefak model (scaler, model, label segmen) untuk ModelRegistry.save"""
+        return dict(
+            info,
+            scaler=self.scaler,
+            model=self.model,
+            labels=cluster_labels,
+            k=self.n_clusters,
+            created=datetime.now(),
+        )
+    
+    def assign_clusters(self, rfm_df, artifact):
+        """Mode assign: tempatkan pelanggan ke segmen model tersimpan tanpa latih ulang
+        
+        Scaler & centroid dari artefak dipakai apa adanya (transform + predict), lalu kolom
+        segmen diisi dari tabel label artefak. Return (rfm_df, cluster_labels).
+        """
+        features = ['Recency', 'Frequency', 'Monetary']
+        self.scaler = artifact['scaler']
+        self.model = artifact['model']
+        self.n_clusters = artifact['k']
+        
+        rfm_scaled = self.scaler.transform(rfm_df[features])
+        rfm_df['Recency_scaled'] = rfm_scaled[:, 0]
+        rfm_df['Frequency_scaled'] = rfm_scaled[:, 1]
+        rfm_df['Monetary_scaled'] = rfm_scaled[:, 2]
+        rfm_df['Cluster'] = self.model.predict(rfm_scaled)
         
-        if len(top_10) < 10:
-            remaining = 10 - len(top_10)
-            others = rfm_df[~rfm_df['Konsumen'].isin(top_10['Konsumen'])].nlargest(remaining, 'Monetary')
-            top_10 = pd.concat([top_10, others])
+        labels = artifact['labels']
+        rfm_df['Cluster'] = rfm_df['Cluster'].astype(np.int8)
+        rfm_df['Segment'] = segment_codes(rfm_df['Cluster'], labels)
+        self.labels = labels
         
-        return top_10.head(10)
+        return rfm_df, labels
+    
+    def get_top_10_customers(self, rfm_df):
+        """Pilih TOP 10 pelanggan untuk diskon"""
+        return select_campaign(rfm_df, self.labels, n=10)
+
+
+# Jumlah figure Plotly yang disimpan per sesi (yang paling lama tidak dipakai dibuang)
+FIGURE_CACHE_SIZE = 8
+
+# Kolom hasil analisis yang menentukan isi chart (nama pelanggan tampil di hover & tabel detail segmen)
+FINGERPRINT_COLUMNS = ['Konsumen', 'Recency', 'Frequency', 'Monetary', 'Segment']
+
+
+def frame_fingerprint(df, columns=None):
+    """Hash isi DataFrame (nilai `columns` atau semua kolom, tanpa index) sebagai kunci cache figure
+
+    Kolom teks (mis. nama pelanggan) di-hash sebagai satu string gabungan, ~6x lebih cepat
+    dari hash per nilai.
+    """
+    df = df if columns is None else df[columns]
+    text = [column for column in df.columns
+            if pd.api.types.is_string_dtype(df[column]) and not isinstance(df[column].dtype, pd.CategoricalDtype)]
+    digest = hashlib.blake2b(digest_size=16)
+    if len(text) < len(df.columns):
+        digest.update(pd.util.hash_pandas_object(df.drop(columns=text), index=False).to_numpy().tobytes())
+    for column in text:
+        digest.update('\x00'.join(df[column].astype(str).tolist()).encode())
+    return digest.hexdigest()
+
+
+def cached_figure(key, build, max_entries=FIGURE_CACHE_SIZE):
+    """Figure dari cache LRU di session_state; `build()` hanya dipanggil jika `key` belum ada
+
+    `key` berisi nama chart, fingerprint hasil analisis dan parameter chart, sehingga rerun
+    yang tidak mengubah hasil analisis (mis. edit pesan WhatsApp) tidak membangun ulang chart.
+    """
+    cache = st.session_state.setdefault('figure_cache', OrderedDict())
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    
+    cache[key] = build()
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
+    return cache[key]
+
+
+# Jumlah baris per halaman tabel pelanggan di detail segmen
+CLUSTER_PAGE_SIZE = 100
+
+
+def cluster_views(rfm_df):
+    """Partisi pelanggan per cluster & rata-rata RFM dalam satu pass (tanpa filter per cluster)
+
+    Return dict: 'stats' (index Cluster; kolom Count, Recency, Frequency, Monetary rata-rata)
+    dan 'positions' (posisi baris tiap cluster, belum diurutkan). Urutan per Monetary
+    dihitung nanti oleh `cluster_page` hanya untuk cluster yang dibuka.
+    """
+    codes = rfm_df['Cluster'].to_numpy()
+    order = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes)
+    clusters = np.flatnonzero(counts)
+    
+    stats = pd.DataFrame({'Count': counts[clusters]}, index=pd.Index(clusters, name='Cluster'))
+    for column in ['Recency', 'Frequency', 'Monetary']:
+        stats[column] = np.bincount(codes, weights=rfm_df[column].to_numpy(dtype=float))[clusters] / stats['Count']
+    
+    positions = dict(zip(clusters, np.split(order, np.cumsum(counts)[clusters[:-1]])))
+    return {'stats': stats, 'positions': positions, 'sorted': {}}
+
+
+def cluster_page(rfm_df, views, cluster, page, page_size=CLUSTER_PAGE_SIZE):
+    """Satu halaman pelanggan cluster, urut Monetary tertinggi (urutan di-cache per cluster)"""
+    if cluster not in views['sorted']:
+        positions = views['positions'][cluster]
+        views['sorted'][cluster] = positions[np.argsort(-rfm_df['Monetary'].to_numpy()[positions], kind='stable')]
+    rows = views['sorted'][cluster][page * page_size:(page + 1) * page_size]
+    return rfm_df.iloc[rows][['Konsumen', 'Recency', 'Frequency', 'Monetary']]
 
 
 def create_cluster_distribution_chart(rfm_df):
@@ -1180,25 +3344,267 @@ def create_cluster_distribution_chart(rfm_df):
     fig.update_traces(textposition='inside', textinfo='percent+label')
     return fig
 
-def create_rfm_3d_scatter(rfm_df):
-    """3D scatter plot RFM"""
-    fig = px.scatter_3d(
-        rfm_df,
-        x='Recency',
-        y='Frequency',
-        z='Monetary',
+def create_rfm_3d_scatter(rfm_df, max_points=SCATTER_POINT_BUDGET, mode='points'):
+    """3D scatter plot RFM (WebGL)
+
+    Mode 'points': jika pelanggan > `max_points`, diambil sampel bertingkat per segmen
+    (segmen kecil seperti VIP tetap utuh hingga SCATTER_MIN_PER_SEGMENT titik).
+    Mode 'density': pelanggan dikelompokkan ke grid SCATTER_BINS³ per segmen, satu
+    titik per bin dengan ukuran sesuai jumlah pelanggan. Koordinat dikirim sebagai
+    float32 (typed array base64 di JSON figure), bukan list angka per titik.
+    """
+    segment = pd.Categorical(rfm_df['Segment'])
+    codes = segment.codes
+    xyz = rfm_df[['Recency', 'Frequency', 'Monetary']].to_numpy(dtype=np.float32)
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    
+    if mode == 'density':
+        low, high = xyz.min(axis=0), xyz.max(axis=0)
+        bins = np.minimum(((xyz - low) / np.maximum(high - low, 1e-9) * SCATTER_BINS).astype(np.int64), SCATTER_BINS - 1)
+        key = ((codes.astype(np.int64) * SCATTER_BINS + bins[:, 0]) * SCATTER_BINS + bins[:, 1]) * SCATTER_BINS + bins[:, 2]
+        cells, inverse, counts = np.unique(key, return_inverse=True, return_counts=True)
+        centers = np.column_stack([np.bincount(inverse, weights=xyz[:, axis]) / counts for axis in range(3)]).astype(np.float32)
+        cell_codes = cells // SCATTER_BINS ** 3
+        sizes = (4 + 26 * np.sqrt(counts / counts.max())).astype(np.float32)
+        
+        for code, name in enumerate(segment.categories):
+            in_segment = cell_codes == code
+            if not in_segment.any():
+                continue
+            fig.add_trace(go.Scatter3d(
+                x=centers[in_segment, 0], y=centers[in_segment, 1], z=centers[in_segment, 2],
+                mode='markers', name=name, customdata=counts[in_segment].astype(np.int32),
+                marker=dict(size=sizes[in_segment], color=colors[code % len(colors)], opacity=0.7),
+                hovertemplate=name + '<br>%{customdata:,} pelanggan<extra></extra>'
+            ))
+        title = f'Visualisasi 3D - Kepadatan RFM ({len(cells):,} bin dari {len(rfm_df):,} pelanggan)'
+    else:
+        sample = np.sort(stratified_sample(codes, max_points, minimum=SCATTER_MIN_PER_SEGMENT))
+        names = rfm_df['Konsumen'].to_numpy()
+        
+        for code, name in enumerate(segment.categories):
+            points = sample[codes[sample] == code]
+            if len(points) == 0:
+                continue
+            fig.add_trace(go.Scatter3d(
+                x=xyz[points, 0], y=xyz[points, 1], z=xyz[points, 2],
+                mode='markers', name=name, text=names[points],
+                marker=dict(size=3, color=colors[code % len(colors)]),
+                hovertemplate='%{text}<br>Recency=%{x:.0f} hari<br>Frequency=%{y:.0f}x<br>Monetary=Rp%{z:,.0f}<extra>' + name + '</extra>'
+            ))
+        title = 'Visualisasi 3D - RFM Analysis'
+        if len(sample) < len(rfm_df):
+            title += f' (sampel {len(sample):,} dari {len(rfm_df):,} pelanggan)'
+    
+    fig.update_layout(
+        title=title,
+        legend_title_text='Segment',
+        scene=dict(xaxis_title='Recency (hari)', yaxis_title='Frequency (transaksi)', zaxis_title='Monetary (Rp)')
+    )
+    return fig
+
+
+def create_segment_trend_chart(series):
+    """Line chart jumlah pelanggan per segmen di setiap akhir bulan"""
+    counts = series.groupby(['Snapshot', 'Segment'], observed=False).size().reset_index(name='Jumlah')
+    
+    fig = px.line(
+        counts,
+        x='Snapshot',
+        y='Jumlah',
         color='Segment',
-        hover_data=['Konsumen'],
-        title='Visualisasi 3D - RFM Analysis',
-        labels={
-            'Recency': 'Recency (hari)',
-            'Frequency': 'Frequency (transaksi)',
-            'Monetary': 'Monetary (Rp)'
-        }
+        markers=True,
+        title='Jumlah Pelanggan per Segmen (Akhir Bulan)',
+        labels={'Snapshot': 'Akhir Bulan', 'Jumlah': 'Jumlah Pelanggan', 'Segment': 'Segmen'}
     )
     return fig
 
 
+# Baris per potongan saat menulis paket data (Parquet row group & blok CSV)
+EXPORT_CHUNK_ROWS = 100000
+
+
+def frame_chunks(df, size=EXPORT_CHUNK_ROWS):
+    """Potongan baris DataFrame berurutan (minimal satu potongan, walau kosong)"""
+    for start in range(0, max(len(df), 1), size):
+        yield df.iloc[start:start + size]
+
+
+def add_bundle_table(bundle, name, df, progress=None):
+    """Tulis df ke zip sebagai `name`.parquet & `name`.csv.gz langsung ke entri zip, per potongan
+
+    Kedua format ditulis lewat Arrow (CSV Arrow ~20x lebih cepat dari DataFrame.to_csv);
+    gzip level 6 (default gzip CLI), level 9 jauh lebih lambat untuk selisih ukuran kecil.
+    """
+    for extension in ('parquet', 'csv.gz'):
+        with bundle.open(f'{name}.{extension}', 'w', force_zip64=True) as member:
+            stream = member if extension == 'parquet' else gzip.GzipFile(fileobj=member, mode='wb', compresslevel=6)
+            schema, writer, done = None, None, 0
+            for chunk in frame_chunks(df):
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pq.ParquetWriter(stream, schema, compression='zstd') if extension == 'parquet' else pacsv.CSVWriter(stream, schema)
+                writer.write_table(table)
+                done += len(chunk)
+                if progress is not None:
+                    progress((extension != 'parquet') / 2 + done / max(len(df), 1) / 2)
+            writer.close()
+            stream.close()
+
+
+def export_bundle(rfm_df, cluster_labels, transactions=None, output=None, progress=None):
+    """Paket data (zip): pelanggan + segmen, ringkasan segmen & transaksi bersih, masing-masing
+    Parquet dan CSV gzip
+
+    Ditulis per potongan ke `output` (default file sementara di disk), jadi saat membangun
+    paket hanya satu potongan yang ada di memori; entri zip disimpan tanpa kompresi ulang
+    karena Parquet & gzip sudah terkompresi. `progress(fraksi)` dipanggil per potongan.
+    Return file di posisi 0. Catatan: st.download_button tetap membaca seluruh file menjadi
+    satu objek bytes di media store Streamlit (tidak di-stream per potongan ke browser),
+    jadi memori saat download = ukuran zip terkompresi.
+    """
+    output = output or tempfile.TemporaryFile()
+    customers = rfm_df[[column for column in rfm_df.columns if not column.endswith('_scaled')]]
+    tables = [
+        ('pelanggan', customers.assign(Discount=segment_attribute(customers, cluster_labels, 'discount'))),
+        ('ringkasan_segmen', segment_summary(rfm_df, cluster_labels)),
+    ]
+    if transactions is not None:
+        tables.append(('transaksi', transactions))
+    total_rows = max(sum(len(df) for _, df in tables), 1)
+    
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        done = 0
+        for name, df in tables:
+            table_progress = None if progress is None else (
+                lambda fraction, offset=done, weight=len(df): progress((offset + fraction * weight) / total_rows))
+            add_bundle_table(bundle, name, df, progress=table_progress)
+            done += len(df)
+    
+    output.seek(0)
+    return output
+
+
+# ============================================================
+# PESAN WHATSAPP (TEMPLATE DIKOMPILASI SEKALI, PER PELANGGAN)
+# ============================================================
+
+# Placeholder template pesan → kolom tabel pelanggan ('no' = nomor urut)
+MESSAGE_FIELDS = {
+    'no': None,
+    'nama': 'Konsumen',
+    'segmen': 'Segment',
+    'diskon': 'Discount',
+    'total': 'Monetary',
+    'frekuensi': 'Frequency',
+    'terakhir': 'Recency',
+}
+
+DEFAULT_CUSTOMER_TEMPLATE = """🎉 Halo *{nama}*!
+
+Terima kasih sudah menjadi pelanggan *{segmen}* ANTY LAUNDRY 💙
+Total belanja Anda: Rp {total:,.0f} ({frekuensi}x transaksi).
+
+Sebagai apresiasi, Anda mendapat DISKON *{diskon}%* untuk transaksi berikutnya 🎁
+
+📅 *Berlaku:* Bulan depan untuk semua layanan
+💳 *Cara pakai:* Tunjukkan pesan ini saat transaksi
+
+🧺 ANTY LAUNDRY
+📍 Tomohon, Sulawesi Utara"""
+
+TOP_10_ITEM_TEMPLATE = """{no}. *{nama}*
+   💎 Segmen: {segmen}
+   🎁 Diskon: *{diskon}%*
+   💰 Total Belanja: Rp {total:,.0f}
+
+"""
+
+
+def compile_message_template(template):
+    """Parse template sekali: daftar (teks, teks ter-encode URL, placeholder, format)
+
+    Placeholder yang tidak dikenal → ValueError. Teks tetap di-encode URL sekali di sini,
+    sehingga link per pelanggan hanya perlu meng-encode nilai placeholder.
+    """
+    compiled = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if field is not None and field not in MESSAGE_FIELDS:
+            raise ValueError(f"Placeholder {{{field}}} tidak dikenal (tersedia: {', '.join(MESSAGE_FIELDS)})")
+        compiled.append((literal, urllib.parse.quote(literal, safe=''), field, spec or ''))
+    return compiled
+
+
+def render_messages(compiled, customers, encode=False):
+    """Isi template terkompilasi untuk semua pelanggan sekaligus (per kolom, bukan per baris)
+
+    Return array object berisi pesan (atau pesan ter-encode URL jika `encode`).
+    """
+    messages = np.full(len(customers), '', dtype=object)
+    for literal, encoded, field, spec in compiled:
+        messages += encoded if encode else literal
+        if field is None:
+            continue
+        values = np.arange(1, len(customers) + 1) if MESSAGE_FIELDS[field] is None else customers[MESSAGE_FIELDS[field]].to_numpy()
+        text = [format(value, spec) for value in values.tolist()] if spec else [str(value) for value in values.tolist()]
+        if encode:
+            encoded_values = {value: urllib.parse.quote(value, safe='') for value in set(text)}
+            text = [encoded_values[value] for value in text]
+        messages += np.array(text, dtype=object)
+    return messages
+
+
+def normalize_phones(phones):
+    """Nomor HP → format internasional tanpa '+' (08xx / 8xx / +62xx → 62xx); tidak valid → kosong"""
+    digits = phones.astype('string').str.replace(r'\D', '', regex=True)
+    digits = digits.str.replace(r'^0', '62', regex=True).str.replace(r'^8', '628', regex=True)
+    return digits.where(digits.str.len().between(9, 15))
+
+
+def customer_phones(df):
+    """Nomor HP terakhir (valid) per pelanggan dari data transaksi bersih; kosong jika tidak ada kolom Telepon"""
+    if df is None or 'Telepon' not in df.columns:
+        return pd.Series(dtype='string', name='Telepon')
+    phones = df[['Tanggal', 'Konsumen']].assign(Telepon=normalize_phones(df['Telepon'])).dropna(subset=['Telepon'])
+    return phones.sort_values('Tanggal', kind='stable').groupby('Konsumen', observed=True)['Telepon'].last()
+
+
+def build_whatsapp_messages(customers, template=DEFAULT_CUSTOMER_TEMPLATE, phones=None):
+    """Pesan & link wa.me per pelanggan (massal) dari satu template
+
+    `customers` = tabel pelanggan dengan kolom Discount (mis. hasil select_campaign),
+    `phones` = Series nomor HP per nama pelanggan (customer_phones). Return DataFrame
+    Konsumen, Segment, Telepon, Pesan, Link. Tanpa nomor HP, link dibuka tanpa penerima
+    (pilih kontak manual di WhatsApp).
+    """
+    compiled = compile_message_template(template)
+    phone = customers['Konsumen'].map(phones) if phones is not None and len(phones) else pd.Series(pd.NA, index=customers.index, dtype='string')
+    messages = render_messages(compiled, customers)
+    encoded = render_messages(compiled, customers, encode=True)
+    
+    return pd.DataFrame({
+        'Konsumen': customers['Konsumen'].to_numpy(),
+        'Segment': customers['Segment'].to_numpy(),
+        'Telepon': phone.to_numpy(),
+        'Pesan': messages,
+        'Link': 'https://wa.me/' + phone.fillna('').to_numpy(dtype=object) + '?text=' + encoded,
+    }, index=customers.index)
+
+
+def export_whatsapp_messages(customers, template=DEFAULT_CUSTOMER_TEMPLATE, phones=None, output=None, progress=None):
+    """File CSV pesan & link WhatsApp per pelanggan, dibuat per potongan (untuk ribuan penerima)"""
+    output = output or BytesIO()
+    for idx, chunk in enumerate(frame_chunks(customers)):
+        messages = build_whatsapp_messages(chunk, template, phones)
+        output.write(messages.to_csv(index=False, header=idx == 0).encode('utf-8'))
+        if progress is not None:
+            progress(min((idx + 1) * EXPORT_CHUNK_ROWS, len(customers)) / max(len(customers), 1))
+    output.seek(0)
+    return output
+
+
 def generate_default_whatsapp_message(top_10):
     """Generate pesan WhatsApp default untuk TOP 10 pelanggan"""
     message = """🎉 *SELAMAT PELANGGAN SETIA ANTY LAUNDRY!* 🎉
@@ -1209,11 +3615,7 @@ Sebagai apresiasi, Anda berhak mendapat DISKON SPESIAL:
 
 """
     
-    for idx, (_, row) in enumerate(top_10.iterrows(), 1):
-        message += f"{idx}. *{row['Konsumen']}*\n"
-        message += f"   💎 Segmen: {row['Segment']}\n"
-        message += f"   🎁 Diskon: *{row['Discount']}%*\n"
-        message += f"   💰 Total Belanja: Rp {row['Monetary']:,.0f}\n\n"
+    message += ''.join(render_messages(compile_message_template(TOP_10_ITEM_TEMPLATE), top_10))
     
     message += """📅 *Berlaku:* Bulan depan untuk semua layanan
 💳 *Cara pakai:* Tunjukkan pesan ini saat transaksi
@@ -1228,30 +3630,175 @@ Terima kasih telah mempercayai ANTY LAUNDRY! 💙
     
     return message
 
-def create_whatsapp_link(message):
-    """Generate link WhatsApp dengan pre-filled message"""
+def create_whatsapp_link(message, phone=None):
+    """Generate link WhatsApp dengan pre-filled message (ke nomor `phone` jika ada)"""
     encoded_message = urllib.parse.quote(message)
-    return f"https://wa.me/?text={encoded_message}"
+    return f"https://wa.me/{phone or ''}?text={encoded_message}"
 
-def export_to_excel(rfm_df, top_10, cluster_summary):
-    """Export hasil ke Excel"""
-    output = BytesIO()
+def segment_summary(rfm_df, cluster_labels):
+    """Ringkasan per segmen: jumlah pelanggan, rata-rata RFM & diskon"""
+    cluster_summary = rfm_df.groupby('Segment', observed=True).agg({
+        'Konsumen': 'count',
+        'Recency': 'mean',
+        'Frequency': 'mean',
+        'Monetary': 'mean'
+    }).reset_index()
+    cluster_summary['Discount'] = cluster_summary['Segment'].map(
+        {label['name']: label['discount'] for label in cluster_labels.values()}
+    ).astype(int)
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        top_10_export = top_10[['Konsumen', 'Segment', 'Recency', 'Frequency', 'Monetary', 'Discount']].copy()
-        top_10_export.columns = ['Nama Pelanggan', 'Segmen', 'Recency (hari)', 'Frequency (x)', 'Total Belanja (Rp)', 'Diskon (%)']
-        top_10_export.to_excel(writer, sheet_name='Top 10 Pelanggan', index=False)
-        
-        all_customers = rfm_df[['Konsumen', 'Segment', 'Recency', 'Frequency', 'Monetary', 'Discount']].copy()
-        all_customers.columns = ['Nama Pelanggan', 'Segmen', 'Recency (hari)', 'Frequency (x)', 'Total Belanja (Rp)', 'Diskon (%)']
-        all_customers.to_excel(writer, sheet_name='Semua Pelanggan', index=False)
-        
-        cluster_summary.to_excel(writer, sheet_name='Ringkasan Cluster', index=False)
+    cluster_summary.columns = ['Segmen', 'Jumlah Pelanggan', 'Avg Recency', 'Avg Frequency', 'Avg Monetary', 'Diskon (%)']
+    return cluster_summary
+
+
+# Baris per potongan saat menulis sheet Excel (hanya satu potongan yang jadi objek Python sekaligus)
+EXCEL_CHUNK_ROWS = 50000
+CUSTOMER_EXPORT_COLUMNS = {
+    'Konsumen': 'Nama Pelanggan',
+    'Segment': 'Segmen',
+    'Recency': 'Recency (hari)',
+    'Frequency': 'Frequency (x)',
+    'Monetary': 'Total Belanja (Rp)',
+    'Discount': 'Diskon (%)',
+}
+
+
+def write_sheet(workbook, title, df, columns=None, progress=None):
+    """Tulis DataFrame ke sheet write-only: header lalu baris langsung dari array kolom per potongan"""
+    columns = columns or {column: column for column in df.columns}
+    sheet = workbook.create_sheet(title)
+    sheet.append(list(columns.values()))
+    
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+        for row in zip(*(chunk[column].tolist() for column in columns)):
+            sheet.append(row)
+        if progress is not None:
+            progress((start + len(chunk)) / len(df))
+
+
+def export_to_excel(rfm_df, top_10, cluster_labels, output=None, progress=None):
+    """Export hasil ke Excel (openpyxl write-only, memori tetap walau pelanggan banyak)
+
+    `progress(fraksi)` dipanggil per potongan sheet Semua Pelanggan.
+    """
+    workbook = Workbook(write_only=True)
+    write_sheet(workbook, 'Top 10 Pelanggan', top_10, CUSTOMER_EXPORT_COLUMNS)
+    all_customers = rfm_df.assign(Discount=segment_attribute(rfm_df, cluster_labels, 'discount'))
+    write_sheet(workbook, 'Semua Pelanggan', all_customers, CUSTOMER_EXPORT_COLUMNS, progress=progress)
+    write_sheet(workbook, 'Ringkasan Cluster', segment_summary(rfm_df, cluster_labels))
     
+    output = output or BytesIO()
+    workbook.save(output)
     output.seek(0)
     return output
 
 
+# Interval (detik) polling status job laporan selama masih ada job yang berjalan
+REPORT_POLL_SECONDS = 2
+REPORT_STATUS = {'antri': '🕒 Antri', 'berjalan': '⚙️ Berjalan', 'selesai': '✅ Selesai', 'gagal': '❌ Gagal'}
+
+
+def read_report(path):
+    """Isi file laporan sebagai bytes untuk st.download_button (seluruh file masuk memori, file langsung ditutup)"""
+    with open(path, 'rb') as report:
+        return report.read()
+
+
+def show_report_jobs(queue, owner, polling=False):
+    """Daftar job laporan milik sesi ini: progres, tombol download & hapus
+
+    Dipanggil sebagai fragment; `polling` = fragment ini dijalankan ulang tiap
+    REPORT_POLL_SECONDS. Begitu tidak ada job yang antri/berjalan, seluruh halaman
+    di-rerun sekali agar fragment dibuat ulang tanpa polling.
+    """
+    if polling and not queue.pending(owner):
+        st.rerun(scope='app')
+    
+    jobs = queue.jobs(owner)
+    if not jobs:
+        st.caption("Belum ada laporan.")
+        return
+    
+    for job in jobs:
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            seconds = (job['finished'] or time.time()) - (job['started'] or job['created'])
+            st.progress(job['progress'], text=f"{REPORT_STATUS[job['status']]} • **{job['title']}** • {seconds:.0f} detik")
+            if job['error']:
+                st.error(f"❌ {job['error']}")
+        with col2:
+            if job['status'] == 'selesai':
+                st.download_button("⬇️ Download", data=lambda path=job['path']: read_report(path), file_name=job['file_name'],
+                                   key=f"report_download_{job['id']}", use_container_width=True)
+        with col3:
+            if job['status'] in ('selesai', 'gagal') and st.button("🗑️ Hapus", key=f"report_remove_{job['id']}", use_container_width=True):
+                queue.remove(job['id'])
+                st.rerun(scope='fragment')
+
+
+def run_clustering(engine, rfm, memory=None, memory_key=None, warm_start=False, artifact=None):
+    """Step 3-6: normalisasi, K-Means, labeling dan TOP 10 dari tabel RFM yang sudah jadi
+
+    Tabel RFM disalin dulu agar tabel per periode yang disimpan di session tidak berubah.
+    Jika `memory` (CentroidMemory) diberikan, centroid run sebelumnya untuk `memory_key`
+    dipakai sebagai warm start (jika `warm_start`) dan centroid baru disimpan kembali.
+    Jika `artifact` (ModelRegistry.load) diberikan, pelanggan hanya di-assign ke model
+    tersebut tanpa latih ulang. Return (rfm, cluster_labels, top_10).
+    """
+    if artifact is not None:
+        st.markdown(f"### 🧠 Step 3-5: Assign Segmen dengan Model v{artifact['version']}")
+        start = time.perf_counter()
+        rfm, cluster_labels = engine.assign_clusters(rfm.copy(), artifact)
+        st.success(f"✅ {len(rfm)} pelanggan ditempatkan ke {artifact['k']} segmen model v{artifact['version']} "
+                   f"dalam {(time.perf_counter() - start) * 1000:.0f} ms (tanpa latih ulang)")
+        
+        st.markdown("### 🏆 Step 6: Memilih TOP 10")
+        top_10 = engine.get_top_10_customers(rfm)
+        st.success(f"✅ {len(top_10)} pelanggan terpilih")
+        return rfm, cluster_labels, top_10
+    
+    if memory is not None and warm_start:
+        engine.previous = memory.get(memory_key)
+    
+    st.markdown("### 🔢 Step 3: Normalisasi Data")
+    rfm = engine.normalize_data(rfm.copy())
+    st.success("✅ Data berhasil dinormalisasi")
+    
+    st.markdown("### 🤖 Step 4: K-Means Clustering")
+    clustered = engine.run_kmeans(rfm)
+    if clustered is None:
+        st.error(f"❌ Hanya {len(rfm)} pelanggan, minimal {min(SEGMENT_TIERS) + 1} pelanggan untuk clustering!")
+        st.stop()
+    rfm = clustered
+    
+    st.markdown("### 🏷️ Step 5: Labeling Cluster")
+    rfm, cluster_labels = engine.label_clusters(rfm)
+    st.success("✅ Cluster berhasil dilabeli")
+    
+    previous = engine.previous
+    if previous is not None and len(previous) == engine.n_clusters:
+        changes = [
+            f"Cluster {row.Cluster}: {row.Segment} → {cluster_labels[row.Cluster]['name']}"
+            for row in previous.itertuples()
+            if row.Cluster in cluster_labels and cluster_labels[row.Cluster]['name'] != row.Segment
+        ]
+        if changes:
+            st.warning("🔀 Segmen berubah dibanding run sebelumnya: " + "; ".join(changes))
+        else:
+            st.info("🔗 ID cluster & segmen sama dengan run sebelumnya")
+    
+    if memory is not None:
+        memory.put(memory_key, engine, cluster_labels)
+        memory.save()
+    
+    st.markdown("### 🏆 Step 6: Memilih TOP 10")
+    top_10 = engine.get_top_10_customers(rfm)
+    st.success(f"✅ {len(top_10)} pelanggan terpilih")
+    
+    return rfm, cluster_labels, top_10
+
+
 def main():
     
     st.markdown("""
@@ -1279,13 +3826,71 @@ def main():
         st.markdown("### ⚙️ Pengaturan Analisis")
         months_back = st.selectbox(
             "📅 Periode Data:",
-            options=[1, 2, 3, 6, 12],
+            options=PERIOD_OPTIONS,
             index=0,
-            help="Pilih berapa bulan terakhir yang akan dianalisis"
+            help="Pilih berapa bulan terakhir yang akan dianalisis (setelah analisis, ganti periode cukup clustering ulang)"
         )
         
         st.info(f"📊 Data akan difilter: **{months_back} bulan terakhir**")
         
+        cluster_backend = CLUSTER_BACKENDS[st.selectbox(
+            "🤖 Mode Clustering:",
+            options=list(CLUSTER_BACKENDS),
+            index=0,
+            help=f"Otomatis: Mini-Batch K-Means jika pelanggan lebih dari {MINIBATCH_THRESHOLD:,}, selain itu K-Means penuh"
+        )]
+        
+        auto_k = st.checkbox(
+            "🔢 Jumlah Cluster Otomatis",
+            value=False,
+            help=f"Coba k = {AUTO_K_RANGE.start}-{AUTO_K_RANGE.stop - 1} secara paralel dan pilih k dengan silhouette tertinggi (default k=5)"
+        )
+        
+        model_registry = ModelRegistry()
+        model_version = st.selectbox(
+            "🧠 Model Segmen:",
+            options=[None] + model_registry.versions()[::-1],
+            format_func=lambda version: "Latih ulang (refit)" if version is None else f"Assign dengan model v{version}",
+            help="Refit melatih ulang scaler & K-Means. Assign menempatkan pelanggan ke segmen model tersimpan tanpa latih ulang"
+        )
+        model_artifact = model_registry.load(model_version) if model_version is not None else None
+        
+        warm_start = st.checkbox(
+            "♻️ Warm Start dari Run Sebelumnya",
+            value=True,
+            help="Pakai centroid run terakhir sebagai titik awal K-Means (lebih cepat) dan pertahankan ID cluster yang sama"
+        )
+        
+        streaming_mode = st.checkbox(
+            "⚡ Mode Streaming (file besar)",
+            value=False,
+            help="Baca file per chunk dan hitung RFM langsung, tanpa memuat seluruh transaksi ke memori"
+        )
+        
+        compact_mode = st.checkbox(
+            "🗜️ Mode Hemat Memori",
+            value=True,
+            help="Simpan data transaksi dengan tipe ringkas (kategori, integer rupiah, tanggal per hari)"
+        )
+        
+        merge_names = st.checkbox(
+            "🧑 Gabungkan Nama Pelanggan Mirip",
+            value=True,
+            help="Nama seperti 'Bu Rina', 'bu rina ' dan 'BU RINA' dihitung sebagai satu pelanggan"
+        )
+        
+        use_store = st.checkbox(
+            "💾 Analisis dari Penyimpanan Lokal",
+            value=False,
+            help="Gunakan riwayat transaksi yang sudah disimpan (tidak perlu upload ulang semua bulan)"
+        )
+        
+        incremental_rfm = use_store and st.checkbox(
+            "⚡ RFM Inkremental (semua riwayat)",
+            value=False,
+            help="Ambil R/F/M dari agregat per pelanggan yang tersimpan, tanpa membaca ulang transaksi (periode diabaikan)"
+        )
+        
         st.markdown("---")
         
         st.markdown("### 📋 Panduan Penggunaan")
@@ -1300,8 +3905,15 @@ def main():
         st.markdown("---")
         
         st.markdown("### ℹ️ Informasi Sistem")
-        st.info("""
-        **Metode:** K-Means (k=5)
+        result_labels = st.session_state.get('cluster_labels')
+        if result_labels:
+            method = f"K-Means (k={len(result_labels)}, hasil analisis terakhir)"
+        elif auto_k:
+            method = f"K-Means (k otomatis {AUTO_K_RANGE.start}-{AUTO_K_RANGE.stop - 1})"
+        else:
+            method = f"K-Means (k={AntyLaundryKMeans().n_clusters})"
+        st.info(f"""
+        **Metode:** {method}
         
         **RFM Analysis:**
         - 📅 Recency: Hari sejak transaksi terakhir
@@ -1314,13 +3926,12 @@ def main():
         st.markdown("---")
         
         st.markdown("### 🎯 Segmen Pelanggan")
-        st.markdown("""
-        🏆 **VIP Customer** → 10%  
-        💎 **Top Spender** → 10%  
-        💚 **High Value Customer** → 10%  
-        👥 **Pelanggan Reguler** → 10%  
-        😴 **Pelanggan Tidak Aktif** → 10%
-        """)
+        # Segmen hasil analisis terakhir, atau seluruh katalog (k otomatis bisa memakai semuanya)
+        shown = [label['name'] for label in result_labels.values()] if result_labels else list(SEGMENT_CATALOG.index)
+        st.markdown("  \n".join(
+            f"{SEGMENT_CATALOG.loc[name, 'icon']} **{name}** → {SEGMENT_CATALOG.loc[name, 'discount']:.0f}%"
+            for name in SEGMENT_CATALOG.index if name in shown
+        ))
         
         st.markdown("---")
         st.caption("© 2025 Anty Laundry v2.1")
@@ -1333,54 +3944,159 @@ def main():
         help="File harus memiliki kolom: Tanggal Ambil, Konsumen, Total Harga"
     )
     
-    if uploaded_file:
+    store = TransactionStore()
+    rfm_state = RFMState()
+    centroid_memory = CentroidMemory()
+    
+    if use_store:
+        store_summary = store.summary()
+        if store_summary.empty:
+            st.warning("⚠️ Penyimpanan lokal masih kosong. Upload file lalu klik \"Simpan ke Penyimpanan Lokal\".")
+        else:
+            st.info(f"💾 Penyimpanan lokal: {store_summary['Baris'].sum()} baris dalam {len(store_summary)} bulan ({store_summary['Bulan'].iloc[0]} s/d {store_summary['Bulan'].iloc[-1]})")
+    
+    if uploaded_file or use_store:
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df_raw = pd.read_csv(uploaded_file)
+            if not uploaded_file:
+                df_raw = None
+            elif streaming_mode:
+                df_raw = None
+                st.success(f"✅ File siap diproses (mode streaming): **{uploaded_file.name}**")
             else:
-                df_raw = pd.read_excel(uploaded_file)
+                df_raw, from_cache = read_upload_cached(uploaded_file)
+                
+                st.success(f"✅ File berhasil dimuat: **{uploaded_file.name}**" + (" (dari cache)" if from_cache else ""))
+                st.info(f"📊 Total baris data: {len(df_raw)}")
             
-            st.success(f"✅ File berhasil dimuat: **{uploaded_file.name}**")
-            st.info(f"📊 Total baris data: {len(df_raw)}")
+            if uploaded_file:
+                with st.expander("👀 Preview Data (10 baris pertama)"):
+                    uploaded_file.seek(0)
+                    st.dataframe(read_preview(uploaded_file, uploaded_file.name, n_rows=10))
             
-            with st.expander("👀 Preview Data (10 baris pertama)"):
-                st.dataframe(df_raw.head(10))
+            if uploaded_file and st.button("💾 Simpan ke Penyimpanan Lokal", use_container_width=True):
+                with st.spinner("⏳ Menyimpan transaksi..."):
+                    engine = AntyLaundryKMeans()
+                    if streaming_mode:
+                        uploaded_file.seek(0)
+                        columns, _ = resolve_upload_columns(uploaded_file, uploaded_file.name)
+                        chunks = iter_file_chunks(uploaded_file, uploaded_file.name, columns=columns)
+                    else:
+                        chunks = [df_raw]
+                    
+                    added, duplicates = 0, 0
+                    col_mapping = None
+                    occurrences = RowOccurrences()
+                    for chunk in chunks:
+                        if col_mapping is None:
+                            col_mapping = engine.resolve_columns(chunk)
+                            if col_mapping is None:
+                                st.stop()
+                        new_rows, chunk_duplicates = store.append(chunk[list(col_mapping)].rename(columns=col_mapping), occurrences, engine.date_formats)
+                        rfm_state.update(new_rows, engine)
+                        added += len(new_rows)
+                        duplicates += chunk_duplicates
+                    
+                    rfm_state.save()
+                    st.success(f"✅ {added} baris baru disimpan, {duplicates} baris duplikat dilewati")
+                    st.info(f"⚡ Agregat RFM inkremental diperbarui ({len(rfm_state.customers)} pelanggan)")
             
             if st.button("🚀 Jalankan Analisis K-Means", type="primary", use_container_width=True):
                 
                 with st.spinner("⏳ Sedang memproses data..."):
                     
-                    engine = AntyLaundryKMeans()
-                    
-                    st.markdown("### 📊 Step 1: Membersihkan & Filter Data")
-                    df_clean = engine.load_and_clean_data(df_raw, months_back=months_back)
+                    engine = AntyLaundryKMeans(backend=cluster_backend, auto_k=auto_k)
                     
-                    if df_clean is None:
-                        st.error("❌ Gagal memproses data!")
-                        st.stop()
+                    rfm_periods = None
                     
-                    st.markdown("### 🔢 Step 2: Menghitung RFM")
-                    rfm = engine.calculate_rfm(df_clean)
+                    if incremental_rfm:
+                        st.markdown("### ⚡ Step 1-2: RFM dari Agregat Inkremental (Semua Riwayat)")
+                        rfm = rfm_state.rfm(resolver=CustomerResolver() if merge_names else None)
+                        df_clean = None
+                        
+                        if rfm.empty:
+                            st.error("❌ Agregat RFM masih kosong! Simpan transaksi ke penyimpanan lokal dulu.")
+                            st.stop()
+                        
+                        data_summary = {
+                            'n_transactions': int(rfm['Frequency'].sum()),
+                            'date_min': rfm_state.customers['First_Visit'].min(),
+                            'date_max': rfm_state.customers['Last_Visit'].max(),
+                        }
+                        st.success(f"✅ RFM dihitung untuk {len(rfm)} pelanggan (dari agregat tersimpan)")
+                    elif streaming_mode and not use_store:
+                        st.markdown("### 📊 Step 1-2: Filter Data & Menghitung RFM (Streaming)")
+                        uploaded_file.seek(0)
+                        columns, _ = resolve_upload_columns(uploaded_file, uploaded_file.name)
+                        
+                        def read_chunks():
+                            uploaded_file.seek(0)
+                            return iter_file_chunks(uploaded_file, uploaded_file.name, columns=columns)
+                        
+                        rfm, data_summary = engine.stream_rfm(
+                            read_chunks,
+                            months_back=months_back,
+                            resolver=CustomerResolver() if merge_names else None
+                        )
+                        df_clean = None
+                        
+                        if rfm is None:
+                            st.error("❌ Gagal memproses data!")
+                            st.stop()
+                    else:
+                        st.markdown("### 📊 Step 1: Membersihkan Data")
+                        df_clean = engine.load_and_clean_data(
+                            df_raw,
+                            months_back=None,
+                            store=store if use_store else None,
+                            resolver=CustomerResolver() if merge_names else None
+                        )
+                        
+                        if df_clean is None:
+                            st.error("❌ Gagal memproses data!")
+                            st.stop()
+                        
+                        st.markdown("### 🔢 Step 2: Menghitung RFM (Semua Periode)")
+                        rfm_periods = engine.calculate_rfm_windows(df_clean)
+                        rfm, data_summary = rfm_periods[months_back]
+                        
+                        if rfm.empty:
+                            st.error(f"❌ Tidak ada transaksi valid pada periode {months_back} bulan!")
+                            st.stop()
+                        
+                        # Dipadatkan setelah RFM periode dihitung: Tanggal resolusi hari akan
+                        # menggeser transaksi di hari batas periode ke luar jendela
+                        if compact_mode:
+                            df_clean, memory_report = engine.compact_data(df_clean)
+                            total = memory_report.loc['TOTAL']
+                            st.success(f"🗜️ Memori data transaksi: {total['Sebelum (KB)'] / 1024:,.1f} MB → {total['Sesudah (KB)'] / 1024:,.1f} MB (hemat {total['Hemat (%)']:.0f}%)")
+                            with st.expander("📋 Laporan Memori per Kolom"):
+                                st.dataframe(memory_report, use_container_width=True)
                     
-                    st.markdown("### 🔢 Step 3: Normalisasi Data")
-                    rfm = engine.normalize_data(rfm)
-                    st.success("✅ Data berhasil dinormalisasi")
-                    
-                    st.markdown("### 🤖 Step 4: K-Means Clustering")
-                    rfm = engine.run_kmeans(rfm)
-                    
-                    st.markdown("### 🏷️ Step 5: Labeling Cluster")
-                    rfm, cluster_labels = engine.label_clusters(rfm)
-                    st.success("✅ Cluster berhasil dilabeli")
+                    rfm, cluster_labels, top_10 = run_clustering(
+                        engine, rfm,
+                        memory=centroid_memory,
+                        memory_key='semua' if incremental_rfm else months_back,
+                        warm_start=warm_start,
+                        artifact=model_artifact
+                    )
                     
-                    st.markdown("### 🏆 Step 6: Memilih TOP 10")
-                    top_10 = engine.get_top_10_customers(rfm)
-                    st.success(f"✅ {len(top_10)} pelanggan terpilih")
+                    if model_artifact is None:
+                        st.session_state['model_artifact'] = engine.export_model(cluster_labels, period=months_back, n_customers=len(rfm))
+                    else:
+                        st.session_state.pop('model_artifact', None)
                     
+                    st.session_state['rfm_periods'] = rfm_periods
+                    st.session_state.pop('segment_history', None)
+                    st.session_state['rfm_months'] = months_back
                     st.session_state['rfm_result'] = rfm
+                    st.session_state['rfm_fingerprint'] = frame_fingerprint(rfm, FINGERPRINT_COLUMNS)
                     st.session_state['top_10'] = top_10
                     st.session_state['cluster_labels'] = cluster_labels
                     st.session_state['df_clean'] = df_clean
+                    # Dari store hanya partisi periode terpanjang yang dibaca; riwayat segmen membaca ulang
+                    st.session_state['df_clean_from_store'] = df_clean is not None and use_store
+                    st.session_state['customer_phones'] = customer_phones(df_clean)
+                    st.session_state['data_summary'] = data_summary
                 
                 st.success("✅ Analisis selesai!")
                 st.balloons()
@@ -1391,12 +4107,46 @@ def main():
             st.exception(e)
             st.stop()
     
+    # Ganti periode setelah analisis: RFM semua periode sudah ada, cukup clustering ulang
+    rfm_periods = st.session_state.get('rfm_periods')
+    if rfm_periods and st.session_state.get('rfm_months') != months_back:
+        rfm, data_summary = rfm_periods[months_back]
+        if rfm.empty:
+            st.warning(f"⚠️ Tidak ada transaksi valid pada periode {months_back} bulan, hasil sebelumnya tetap ditampilkan")
+        else:
+            with st.spinner(f"⏳ Clustering ulang periode {months_back} bulan..."):
+                with st.expander(f"🔄 Detail Clustering Ulang ({months_back} bulan)"):
+                    engine = AntyLaundryKMeans(backend=cluster_backend, auto_k=auto_k)
+                    rfm, cluster_labels, top_10 = run_clustering(
+                        engine, rfm,
+                        memory=centroid_memory,
+                        memory_key=months_back,
+                        warm_start=warm_start,
+                        artifact=model_artifact
+                    )
+                
+                if model_artifact is None:
+                    st.session_state['model_artifact'] = engine.export_model(cluster_labels, period=months_back, n_customers=len(rfm))
+                else:
+                    st.session_state.pop('model_artifact', None)
+                st.session_state['rfm_months'] = months_back
+                st.session_state['rfm_result'] = rfm
+                st.session_state['rfm_fingerprint'] = frame_fingerprint(rfm, FINGERPRINT_COLUMNS)
+                st.session_state['top_10'] = top_10
+                st.session_state['cluster_labels'] = cluster_labels
+                st.session_state['data_summary'] = data_summary
+                st.session_state.pop('wa_message', None)
+            
+            st.success(f"✅ Periode diganti ke {months_back} bulan (tanpa membaca ulang data)")
+    
     if 'rfm_result' in st.session_state:
         
         rfm = st.session_state['rfm_result']
         top_10 = st.session_state['top_10']
         cluster_labels = st.session_state['cluster_labels']
         df_clean = st.session_state['df_clean']
+        data_summary = st.session_state['data_summary']
+        rfm_key = st.session_state.get('rfm_fingerprint') or frame_fingerprint(rfm, FINGERPRINT_COLUMNS)
         
         st.markdown("---")
         
@@ -1451,21 +4201,10 @@ def main():
             )
         
         with col2:
-            cluster_summary = rfm.groupby('Segment').agg({
-                'Konsumen': 'count',
-                'Recency': 'mean',
-                'Frequency': 'mean',
-                'Monetary': 'mean',
-                'Discount': 'first'
-            }).reset_index()
-            
-            cluster_summary.columns = ['Segmen', 'Jumlah Pelanggan', 'Avg Recency', 'Avg Frequency', 'Avg Monetary', 'Diskon (%)']
-            
-            excel_data = export_to_excel(rfm, top_10, cluster_summary)
-            
+            # Laporan dibuat saat tombol diklik (callable), bukan di setiap rerun
             st.download_button(
                 label="📊 Excel",
-                data=excel_data,
+                data=lambda: export_to_excel(rfm, top_10, cluster_labels),
                 file_name=f"Laporan_KMeans_{datetime.now().strftime('%Y%m%d')}.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                 use_container_width=True
@@ -1482,6 +4221,45 @@ def main():
                 use_container_width=True
             )
         
+        st.download_button(
+            label="🗜️ Paket Data Lengkap (Parquet + CSV.gz, zip)",
+            data=lambda: export_bundle(rfm, cluster_labels, df_clean),
+            file_name=f"Data_Segmentasi_{datetime.now().strftime('%Y%m%d')}.zip",
+            mime="application/zip",
+            help="Semua pelanggan & segmen, ringkasan segmen" + (" dan transaksi bersih" if df_clean is not None else "")
+                 + ". Paket dibuat per potongan di disk, lalu zip (terkompresi) dimuat utuh ke memori server untuk diunduh.",
+            use_container_width=True
+        )
+        
+        # ============================================================
+        # LAPORAN BESAR DI LATAR BELAKANG (TIDAK MEMBLOKIR HALAMAN)
+        # ============================================================
+        with st.expander("⏳ **Laporan di Latar Belakang** (untuk data pelanggan besar)", expanded=False):
+            
+            st.caption(f"Laporan dibuat oleh {REPORT_WORKERS} worker di latar belakang; halaman tetap bisa dipakai "
+                       "dan file hasil muncul di bawah saat selesai.")
+            
+            queue = get_report_queue()
+            owner = st.session_state.setdefault('report_owner', uuid.uuid4().hex)
+            today = datetime.now().strftime('%Y%m%d')
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("📊 Buat Laporan Excel", use_container_width=True):
+                    queue.submit('Laporan Excel', f"Laporan_KMeans_{today}.xlsx",
+                                 lambda output, progress: export_to_excel(rfm, top_10, cluster_labels, output=output, progress=progress),
+                                 owner=owner)
+            with col2:
+                if st.button("🗜️ Buat Paket Data (zip)", use_container_width=True):
+                    queue.submit('Paket Data', f"Data_Segmentasi_{today}.zip",
+                                 lambda output, progress: export_bundle(rfm, cluster_labels, df_clean, output=output, progress=progress),
+                                 owner=owner)
+            
+            # Polling hanya selama ada job yang berjalan; job yang disubmit di bagian lain halaman
+            # memanggil st.rerun() agar keputusan ini dibuat ulang
+            polling = queue.pending(owner)
+            st.fragment(run_every=REPORT_POLL_SECONDS if polling else None)(show_report_jobs)(queue, owner, polling=polling)
+        
         # Info ringkas
         st.info(f"📱 {len(st.session_state['wa_message'])} karakter • 👥 10 penerima • 💰 Estimasi diskon: Rp {sum([row['Monetary'] * row['Discount'] / 100 for _, row in top_10.iterrows()]):,.0f}")
         
@@ -1504,6 +4282,101 @@ def main():
                 st.success("✅ Pesan berhasil diupdate!")
                 st.rerun()
         
+        # ============================================================
+        # KAMPANYE DISKON: TOP-N + KUOTA PER SEGMEN
+        # ============================================================
+        with st.expander("🎯 **Kampanye Diskon (Top-N & Kuota per Segmen)**", expanded=False):
+            
+            st.caption("Segmen berkuota mendapat jumlah slot sesuai kuota. Sisa slot diisi VIP/Top Spender dulu, "
+                       "lalu High Value Customer, lalu pelanggan lain, masing-masing yang terbaik menurut kunci ranking.")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                campaign_size = st.number_input("Jumlah penerima (N)", min_value=1, max_value=len(rfm), value=min(CAMPAIGN_SIZE, len(rfm)), step=10)
+            with col2:
+                rank_by = st.selectbox("Ranking berdasarkan", list(RANKING_KEYS), format_func=RANKING_KEYS.get)
+            
+            segments = sorted(cluster_labels.values(), key=lambda label: label['priority'])
+            quota_table = st.data_editor(
+                pd.DataFrame({'Segmen': [label['name'] for label in segments], 'Kuota': 0}),
+                column_config={'Kuota': st.column_config.NumberColumn("Kuota (0 = tanpa kuota)", min_value=0, step=1)},
+                disabled=['Segmen'],
+                hide_index=True,
+                use_container_width=True,
+                key="campaign_quotas"
+            )
+            quotas = dict(zip(quota_table['Segmen'], quota_table['Kuota'].fillna(0).astype(int)))
+            
+            if sum(quotas.values()) > campaign_size:
+                st.warning(f"⚠️ Total kuota ({sum(quotas.values())}) melebihi N ({campaign_size}), kuota diperkecil proporsional menjadi total {campaign_size}")
+            
+            start = time.perf_counter()
+            campaign = select_campaign(rfm, cluster_labels, n=int(campaign_size), quotas=quotas, rank_by=rank_by)
+            st.success(f"✅ {len(campaign):,} penerima dipilih dari {len(rfm):,} pelanggan dalam {(time.perf_counter() - start) * 1000:.0f} ms • "
+                       f"💰 Estimasi diskon: Rp {(campaign['Monetary'] * campaign['Discount'] / 100).sum():,.0f}")
+            
+            st.dataframe(campaign['Segment'].value_counts(sort=False).rename('Penerima').reset_index().rename(columns={'Segment': 'Segmen'}),
+                         use_container_width=True, hide_index=True)
+            st.dataframe(campaign[['Konsumen', 'Segment', 'Recency', 'Frequency', 'Monetary', 'Discount']].head(100),
+                         use_container_width=True, hide_index=True)
+            
+            st.download_button(
+                label=f"📄 Download {len(campaign):,} Penerima (CSV)",
+                data=campaign[['Konsumen', 'Segment', 'Recency', 'Frequency', 'Monetary', 'Discount']].to_csv(index=False),
+                file_name=f"Kampanye_{rank_by}_{datetime.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+            
+            st.markdown("**💬 Pesan WhatsApp per Penerima**")
+            template = st.text_area(
+                "Template pesan",
+                value=DEFAULT_CUSTOMER_TEMPLATE,
+                height=260,
+                help="Placeholder: " + ", ".join(f"{{{field}}}" for field in MESSAGE_FIELDS) + " (format angka mis. {total:,.0f})",
+                key="campaign_template"
+            )
+            phones = st.session_state.get('customer_phones')
+            
+            try:
+                preview = build_whatsapp_messages(campaign.head(20), template, phones)
+            except (ValueError, KeyError) as error:
+                st.error(f"❌ Template tidak valid: {error}")
+            else:
+                if phones is None or phones.empty:
+                    st.info("ℹ️ Kolom nomor HP tidak ditemukan di data, link WhatsApp dibuka tanpa penerima.")
+                else:
+                    st.caption(f"📱 {int(campaign['Konsumen'].map(phones).notna().sum()):,} dari {len(campaign):,} penerima punya nomor HP")
+                
+                st.dataframe(
+                    preview[['Konsumen', 'Segment', 'Telepon', 'Link']],
+                    column_config={'Link': st.column_config.LinkColumn("Kirim", display_text="💬 Buka WhatsApp")},
+                    use_container_width=True,
+                    hide_index=True
+                )
+                
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.download_button(
+                        label=f"💬 Download {len(campaign):,} Pesan (CSV)",
+                        data=lambda: export_whatsapp_messages(campaign, template, phones),
+                        file_name=f"Pesan_WA_{datetime.now().strftime('%Y%m%d')}.csv",
+                        mime="text/csv",
+                        use_container_width=True
+                    )
+                with col2:
+                    if st.button("⏳ Buat di Latar Belakang", use_container_width=True, key="whatsapp_job"):
+                        get_report_queue().submit(
+                            f"Pesan WhatsApp ({len(campaign):,} penerima)", f"Pesan_WA_{datetime.now().strftime('%Y%m%d')}.csv",
+                            lambda output, progress: export_whatsapp_messages(campaign, template, phones, output=output, progress=progress),
+                            owner=st.session_state.setdefault('report_owner', uuid.uuid4().hex)
+                        )
+                        st.session_state['whatsapp_job_submitted'] = True
+                        # Daftar job (dan polling progresnya) dirender lebih atas di halaman: rerun agar ikut terlihat
+                        st.rerun()
+                    if st.session_state.pop('whatsapp_job_submitted', False):
+                        st.success("✅ Job dibuat, lihat bagian ⏳ Laporan di Latar Belakang")
+        
         st.markdown("---")
         st.markdown("---")
         
@@ -1526,16 +4399,25 @@ def main():
                 st.metric("Total Pelanggan", len(rfm))
             
             with col2:
-                st.metric("Total Transaksi", len(df_clean))
+                st.metric("Total Transaksi", data_summary['n_transactions'])
             
             with col3:
-                period = f"{df_clean['Tanggal'].min().strftime('%d/%m')} - {df_clean['Tanggal'].max().strftime('%d/%m/%Y')}"
+                period = f"{data_summary['date_min'].strftime('%d/%m')} - {data_summary['date_max'].strftime('%d/%m/%Y')}"
                 st.metric("Periode Data", period)
             
             with col4:
                 vip_count = len(rfm[rfm['Segment'] == 'VIP Customer'])
                 st.metric("VIP Customer", vip_count, delta="🏆")
             
+            if 'model_artifact' in st.session_state:
+                next_version = (ModelRegistry().versions() or [0])[-1] + 1
+                if st.button(f"💾 Simpan Model Ini sebagai v{next_version}", use_container_width=True):
+                    st.session_state['saved_model_version'] = ModelRegistry().save(st.session_state.pop('model_artifact'))
+                    st.rerun()
+            
+            if 'saved_model_version' in st.session_state:
+                st.success(f"✅ Model v{st.session_state.pop('saved_model_version')} disimpan (scaler, centroid & label segmen). Pilih di sidebar untuk mode assign.")
+            
             st.markdown("---")
             
             st.markdown("### 📊 Distribusi Segmen")
@@ -1543,22 +4425,38 @@ def main():
             col1, col2 = st.columns(2)
             
             with col1:
-                st.plotly_chart(create_cluster_distribution_chart(rfm), use_container_width=True)
+                st.plotly_chart(cached_figure(('distribution', rfm_key), lambda: create_cluster_distribution_chart(rfm)), use_container_width=True)
             
             with col2:
-                st.plotly_chart(create_rfm_3d_scatter(rfm), use_container_width=True)
+                scatter_mode = st.radio("Tampilan 3D", list(SCATTER_MODES), format_func=SCATTER_MODES.get, horizontal=True)
+                scatter_points = st.select_slider(
+                    "Batas titik", options=sorted({5000, 10000, 20000, 50000, 100000, SCATTER_POINT_BUDGET}), value=SCATTER_POINT_BUDGET,
+                    disabled=scatter_mode == 'density' or len(rfm) <= 5000,
+                    help="Jumlah maksimum titik yang dikirim ke browser; sampel diambil per segmen"
+                )
+                scatter = cached_figure(
+                    ('scatter_3d', rfm_key, scatter_mode, scatter_points),
+                    lambda: create_rfm_3d_scatter(rfm, max_points=scatter_points, mode=scatter_mode)
+                )
+                st.plotly_chart(scatter, use_container_width=True)
             
             st.markdown("---")
             
-            st.markdown("### 🎯 Detail 5 Segmentasi Pelanggan")
+            st.markdown(f"### 🎯 Detail {len(cluster_labels)} Segmentasi Pelanggan")
             
             st.info("📌 **Penjelasan:** Setiap segmen memiliki karakteristik RFM berbeda. Klik untuk lihat detail pelanggan & strategi.")
             
-            for cluster_id in sorted(rfm['Cluster'].unique()):
-                cluster_data = rfm[rfm['Cluster'] == cluster_id]
+            if st.session_state.get('cluster_views', (None,))[0] != rfm_key:
+                st.session_state['cluster_views'] = (rfm_key, cluster_views(rfm))
+            views = st.session_state['cluster_views'][1]
+            
+            for cluster_id, stats in views['stats'].iterrows():
                 label_info = cluster_labels[cluster_id]
                 
-                with st.expander(f"{label_info['icon']} **{label_info['name']}** ({len(cluster_data)} pelanggan) - Diskon {label_info['discount']}%"):
+                with st.expander(f"{label_info['icon']} **{label_info['name']}** ({int(stats['Count'])} pelanggan) - Diskon {label_info['discount']}%",
+                                 key=f"cluster_detail_{cluster_id}", on_change="rerun") as detail:
+                    if not detail.open:
+                        continue
                     
                     st.markdown("**📝 Deskripsi Segmen:**")
                     st.info(label_info['description'])
@@ -1571,22 +4469,120 @@ def main():
                     col1, col2, col3, col4 = st.columns(4)
                     
                     with col1:
-                        st.metric("Avg Recency", f"{cluster_data['Recency'].mean():.0f} hari")
+                        st.metric("Avg Recency", f"{stats['Recency']:.0f} hari")
                     
                     with col2:
-                        st.metric("Avg Frequency", f"{cluster_data['Frequency'].mean():.1f}x")
+                        st.metric("Avg Frequency", f"{stats['Frequency']:.1f}x")
                     
                     with col3:
-                        st.metric("Avg Monetary", f"Rp {cluster_data['Monetary'].mean():,.0f}")
+                        st.metric("Avg Monetary", f"Rp {stats['Monetary']:,.0f}")
                     
                     with col4:
                         st.metric("Diskon", f"{label_info['discount']}%")
                     
                     st.markdown("**👥 Daftar Pelanggan:**")
+                    n_pages = -(-int(stats['Count']) // CLUSTER_PAGE_SIZE)
+                    page = st.number_input(f"Halaman (dari {n_pages})", min_value=1, max_value=n_pages, value=1,
+                                           key=f"cluster_page_{cluster_id}") if n_pages > 1 else 1
                     st.dataframe(
-                        cluster_data[['Konsumen', 'Recency', 'Frequency', 'Monetary']].sort_values('Monetary', ascending=False),
+                        cluster_page(rfm, views, cluster_id, page - 1),
                         use_container_width=True
                     )
+        
+        # ============================================================
+        # RIWAYAT & MIGRASI SEGMEN BULANAN
+        # ============================================================
+        with st.expander(f"📈 **Riwayat & Migrasi Segmen ({SNAPSHOT_MONTHS} Akhir Bulan)**", expanded=False):
+            
+            if df_clean is None:
+                st.info("ℹ️ Riwayat segmen membutuhkan data transaksi, tidak tersedia di mode streaming / RFM inkremental.")
+            elif st.button("📈 Hitung Riwayat Segmen", use_container_width=True):
+                with st.spinner("⏳ Menghitung RFM & segmen tiap akhir bulan..."):
+                    history_df = df_clean
+                    if st.session_state.get('df_clean_from_store'):
+                        # Analisis hanya memuat partisi periode terpanjang; riwayat butuh SNAPSHOT_MONTHS bulan
+                        with st.expander(f"💾 Detail Data Riwayat ({SNAPSHOT_MONTHS} bulan dari penyimpanan lokal)"):
+                            history_df = AntyLaundryKMeans().load_and_clean_data(
+                                None,
+                                months_back=None,
+                                store=store,
+                                resolver=CustomerResolver() if merge_names else None,
+                                store_months=SNAPSHOT_MONTHS
+                            )
+                    series = None
+                    if history_df is not None:
+                        series, _ = AntyLaundryKMeans(backend=cluster_backend, auto_k=auto_k).segment_history(history_df)
+                    if series is not None:
+                        st.session_state['segment_history'] = series
+                        st.session_state['segment_history_fingerprint'] = frame_fingerprint(series)
+            
+            if 'segment_history' in st.session_state:
+                series = st.session_state['segment_history']
+                engine = AntyLaundryKMeans()
+                
+                history_key = st.session_state.get('segment_history_fingerprint') or frame_fingerprint(series)
+                st.plotly_chart(cached_figure(('segment_trend', history_key), lambda: create_segment_trend_chart(series)), use_container_width=True)
+                
+                snapshots = list(pd.DatetimeIndex(series['Snapshot'].unique()).sort_values())
+                choice = st.selectbox(
+                    "📅 Migrasi ke bulan:",
+                    options=['Semua bulan'] + snapshots[1:],
+                    format_func=lambda x: x if isinstance(x, str) else x.strftime('%m/%Y'),
+                    index=len(snapshots) - 1
+                )
+                migration = engine.segment_migration(series, None if isinstance(choice, str) else choice)
+                
+                st.markdown("**🔀 Matriks Migrasi Segmen** (baris: bulan sebelumnya → kolom: bulan ini)")
+                st.dataframe(migration, use_container_width=True)
+                
+                st.markdown("**📊 Persentase per Baris**")
+                st.dataframe(
+                    (migration.div(migration.sum(axis=1).replace(0, np.nan), axis=0) * 100).round(1),
+                    use_container_width=True
+                )
+                
+                drifted = migration.loc['VIP Customer', 'Pelanggan Tidak Aktif'] if 'VIP Customer' in migration.index else 0
+                st.metric("VIP → Pelanggan Tidak Aktif", int(drifted), delta="perlu di-reaktivasi" if drifted else None, delta_color="inverse")
+        
+        # ============================================================
+        # UJI STABILITAS SEGMEN (BOOTSTRAP)
+        # ============================================================
+        with st.expander("🎲 **Uji Stabilitas Segmen (Bootstrap)**", expanded=False):
+            
+            st.caption("Clustering diulang pada sampel acak pelanggan (dengan pengembalian) di beberapa proses sekaligus. "
+                       "Segmen yang stabil tetap sama walaupun datanya sedikit berubah.")
+            
+            n_runs = st.number_input("Jumlah resample", min_value=5, max_value=200, value=BOOTSTRAP_RUNS, step=5)
+            if st.button("🎲 Jalankan Uji Stabilitas", use_container_width=True):
+                with st.spinner(f"⏳ Menjalankan {n_runs} resample bootstrap..."):
+                    start = time.perf_counter()
+                    confidence, stability = AntyLaundryKMeans(backend=cluster_backend).bootstrap_stability(rfm, n_runs=int(n_runs))
+                    st.session_state['stability'] = (confidence, stability, time.perf_counter() - start)
+            
+            if 'stability' in st.session_state:
+                confidence, stability, seconds = st.session_state['stability']
+                
+                if len(confidence) != len(rfm) or not confidence.index.equals(rfm.index):
+                    st.info("ℹ️ Hasil uji stabilitas berasal dari analisis sebelumnya, jalankan ulang.")
+                else:
+                    st.success(f"✅ Selesai dalam {seconds:.1f} detik")
+                    
+                    stability = stability.assign(
+                        Segmen=stability['Cluster'].map(lambda cluster: cluster_labels[cluster]['name'] if cluster in cluster_labels else '-'),
+                        Status=np.where(stability['Jaccard'] >= STABLE_JACCARD, '✅ Stabil', '⚠️ Kurang stabil')
+                    )
+                    st.markdown("**📊 Stabilitas per Segmen** (rata-rata Jaccard antar resample, 1 = selalu sama)")
+                    st.dataframe(stability[['Segmen', 'Pelanggan', 'Jaccard', 'Jaccard_Min', 'Status']].round(3), use_container_width=True, hide_index=True)
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.metric("Rata-rata Keyakinan Segmen", f"{confidence.mean() * 100:.1f}%")
+                    with col2:
+                        st.metric("Pelanggan Ragu (< 80%)", int((confidence < 0.8).sum()))
+                    
+                    st.markdown("**🏆 Keyakinan Segmen TOP 10**")
+                    top_confidence = top_10[['Konsumen', 'Segment']].assign(Keyakinan=(confidence.reindex(top_10.index) * 100).round(0).astype(int).astype(str) + '%')
+                    st.dataframe(top_confidence, use_container_width=True, hide_index=True)
     
     st.markdown("---")
     st.markdown("""
@@ -0,0 +1,583 @@
+"""Benchmark performa Anty Laundry
+
+Jalankan: python benchmark.py [nama_benchmark ...]
+Tanpa argumen semua benchmark dijalankan.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from io import BytesIO
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# app.py memanggil fungsi Streamlit saat di-import (mode "bare"), pesannya tidak perlu
+logging.disable(logging.WARNING)
+import app  # noqa: E402
+
+
+def best_time(fn, repeat=3):
+    """Waktu eksekusi terbaik (detik) dari beberapa percobaan"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_dates(n_rows=1000000):
+    """Parsing tanggal: pd.to_datetime tanpa format vs parse_dates (format dideteksi sekali)"""
+    rng = np.random.default_rng(42)
+    base = pd.Timestamp('2024-01-01')
+    stamps = base + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n_rows), unit='min')
+    
+    cases = {
+        'dd/mm/yyyy': stamps.strftime('%d/%m/%Y'),
+        'dd/mm/yyyy hh:mm': stamps.strftime('%d/%m/%Y %H:%M'),
+    }
+    
+    print(f"\n=== Parsing tanggal ({n_rows:,} baris) ===")
+    for name, values in cases.items():
+        column = pd.Series(values)
+        expected = pd.to_datetime(column, format='%d/%m/%Y' if ' ' not in values[0] else '%d/%m/%Y %H:%M')
+        
+        old_time, old_result = best_time(lambda: pd.to_datetime(column, errors='coerce'))
+        
+        new_time, (new_result, stats) = best_time(lambda: app.parse_dates(column))
+        
+        old_wrong = int((old_result != expected).sum())
+        new_wrong = int((new_result != expected).sum())
+        print(f"{name:<20} lama: {old_time:.3f}s (salah baca {old_wrong:,})  "
+              f"baru: {new_time:.3f}s (salah baca {new_wrong:,}, format {stats['format']})  "
+              f"speedup {old_time / new_time:.1f}x")
+
+
+def legacy_rfm(df, reference_date):
+    """Implementasi calculate_rfm lama (groupby + lambda per pelanggan), sebagai pembanding"""
+    rfm = df.groupby('Konsumen', observed=True).agg({
+        'Tanggal': lambda x: (reference_date - x.max()).days,
+        'No_Invoice': 'nunique',
+        'Total_Harga': 'sum'
+    }).reset_index()
+    rfm.columns = ['Konsumen', 'Recency', 'Frequency', 'Monetary']
+    return rfm
+
+
+def make_transactions(n_rows, rows_per_customer=20, seed=42):
+    """Data transaksi sintetis (kolom standar, mode hemat memori)"""
+    rng = np.random.default_rng(seed)
+    n_customers = max(n_rows // rows_per_customer, 1)
+    customer_names = pd.Index([f"Pelanggan {i}" for i in range(n_customers)])
+    return pd.DataFrame({
+        'Konsumen': pd.Categorical.from_codes(rng.integers(0, n_customers, n_rows), customer_names),
+        'No_Invoice': pd.Categorical.from_codes(np.arange(n_rows) // 2, pd.Index([f"INV{i}" for i in range((n_rows + 1) // 2)])),
+        'Tanggal': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n_rows), unit='D')).astype('datetime64[s]'),
+        'Total_Harga': rng.integers(5, 100, n_rows).astype(np.int32) * 1000,
+    })
+
+
+def bench_rfm(sizes=(100000, 1000000, 10000000)):
+    """RFM: groupby + lambda (lama) vs kernel sort-and-reduce (R/F/M + 4 fitur perilaku)"""
+    print("\n=== Kernel RFM ===")
+    for n_rows in sizes:
+        df = make_transactions(n_rows)
+        reference_date = df['Tanggal'].max()
+        
+        old_time, old_result = best_time(lambda: legacy_rfm(df, reference_date), repeat=1)
+        new_time, new_result = best_time(lambda: app.rfm_kernel(df, reference_date), repeat=1)
+        
+        same = (old_result[['Recency', 'Frequency', 'Monetary']].to_numpy() ==
+                new_result[['Recency', 'Frequency', 'Monetary']].to_numpy()).all()
+        print(f"{n_rows:>12,} baris ({df['Konsumen'].nunique():,} pelanggan)  "
+              f"lama: {old_time:.2f}s  baru: {new_time:.2f}s  speedup {old_time / new_time:.1f}x  "
+              f"hasil sama: {same}")
+        del df, old_result, new_result
+
+
+def bench_windows(n_rows=1000000):
+    """RFM semua pilihan periode: filter + kernel per periode vs rfm_windows sekali urut"""
+    df = make_transactions(n_rows)
+    reference_date = df['Tanggal'].max()
+    cutoffs = {months: reference_date - pd.Timedelta(days=30 * months) for months in app.PERIOD_OPTIONS}
+    
+    print(f"\n=== RFM multi-periode ({n_rows:,} baris, periode {app.PERIOD_OPTIONS}) ===")
+    old_time, old_result = best_time(lambda: {months: app.rfm_kernel(df[df['Tanggal'] > cutoff], reference_date)
+                                              for months, cutoff in cutoffs.items()})
+    new_time, new_result = best_time(lambda: app.rfm_windows(df, reference_date, cutoffs))
+    
+    same = all(old_result[months].equals(new_result[months]) for months in cutoffs)
+    print(f"per periode: {old_time:.2f}s  sekaligus: {new_time:.2f}s  speedup {old_time / new_time:.1f}x  hasil sama: {same}")
+
+
+def bench_snapshots(n_rows=1000000):
+    """RFM 24 akhir bulan: rfm_kernel per snapshot vs rfm_snapshots (agregasi kumulatif)"""
+    df = make_transactions(n_rows)
+    df['Tanggal'] = df['Tanggal'] - pd.to_timedelta(np.random.default_rng(7).integers(0, 365, n_rows), unit='D')
+    month_ends = pd.date_range(end=df['Tanggal'].max(), periods=app.SNAPSHOT_MONTHS, freq='ME')
+    
+    def run_old():
+        return [app.rfm_kernel(df[df['Tanggal'] <= month_end], month_end) for month_end in month_ends]
+    
+    print(f"\n=== Snapshot RFM bulanan ({n_rows:,} baris, {len(month_ends)} akhir bulan) ===")
+    single_time, _ = best_time(lambda: app.rfm_kernel(df, df['Tanggal'].max()))
+    old_time, old_result = best_time(run_old, repeat=1)
+    new_time, new_result = best_time(lambda: app.rfm_snapshots(df, month_ends))
+    
+    same = all(
+        (old[['Recency', 'Frequency', 'Monetary']].to_numpy() ==
+         new_result.loc[new_result['Snapshot'] == month_end, ['Recency', 'Frequency', 'Monetary']].to_numpy()).all()
+        for old, month_end in zip(old_result, month_ends)
+    )
+    print(f"1x rfm_kernel: {single_time:.2f}s  24x rfm_kernel: {old_time:.2f}s  rfm_snapshots: {new_time:.2f}s  "
+          f"({new_time / single_time:.1f}x satu run)  hasil sama: {same}")
+
+
+def make_rfm(n_customers, seed=42):
+    """Tabel RFM sintetis (skala & kemencengan mirip data kasir)"""
+    rng = np.random.default_rng(seed)
+    frequency = rng.geometric(0.25, n_customers)
+    return pd.DataFrame({
+        'Konsumen': np.arange(n_customers).astype(str),
+        'Recency': rng.integers(0, 365, n_customers),
+        'Frequency': frequency,
+        'Monetary': frequency * rng.lognormal(11, 0.6, n_customers),
+    })
+
+
+def bench_kmeans(sizes=(50000, 200000, 500000)):
+    """Clustering: K-Means penuh (n_init=10) vs Mini-Batch (partial_fit), waktu & inertia"""
+    from sklearn.metrics import adjusted_rand_score
+    
+    print("\n=== K-Means penuh vs Mini-Batch ===")
+    for n_customers in sizes:
+        rfm = app.AntyLaundryKMeans().normalize_data(make_rfm(n_customers))
+        
+        full = app.AntyLaundryKMeans(backend='full')
+        full_time, full_result = best_time(lambda: full.run_kmeans(rfm.copy())['Cluster'].to_numpy(), repeat=1)
+        full_inertia = full.model.inertia_
+        
+        mini = app.AntyLaundryKMeans(backend='minibatch')
+        mini_time, mini_result = best_time(lambda: mini.run_kmeans(rfm.copy())['Cluster'].to_numpy(), repeat=1)
+        X = rfm[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].to_numpy()
+        mini_inertia = -mini.model.score(X)
+        
+        print(f"{n_customers:>9,} pelanggan  penuh: {full_time:.2f}s (inertia {full_inertia:,.0f})  "
+              f"mini-batch: {mini_time:.2f}s (inertia {mini_inertia:,.0f}, +{(mini_inertia / full_inertia - 1) * 100:.1f}%)  "
+              f"speedup {full_time / mini_time:.1f}x  ARI {adjusted_rand_score(full_result, mini_result):.3f}")
+
+
+def bench_auto_k(n_customers=200000):
+    """Pemilihan k otomatis: satu fit k=5 vs sweep k paralel (proses worker) vs sweep serial"""
+    
+    rfm = app.AntyLaundryKMeans().normalize_data(make_rfm(n_customers))
+    X = rfm[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].to_numpy()
+    
+    print(f"\n=== Auto-k ({n_customers:,} pelanggan, k={list(app.AUTO_K_RANGE)}, {os.cpu_count()} CPU) ===")
+    single_time, _ = best_time(lambda: app.AntyLaundryKMeans().fit_clusters(X), repeat=1)
+    
+    for jobs in (1, app.PARALLEL_JOBS):
+        app.PARALLEL_JOBS = jobs
+        engine = app.AntyLaundryKMeans(auto_k=True)
+        sweep_time, _ = best_time(lambda: engine.select_k(X), repeat=1)
+        print(f"n_jobs={jobs:>2}  sweep: {sweep_time:.2f}s ({sweep_time / single_time:.1f}x satu fit {single_time:.2f}s)  k terpilih: {engine.n_clusters}")
+
+
+def bench_warm_start(n_customers=200000):
+    """K-Means cold start (k-means++, n_init=10) vs warm start dari centroid run sebelumnya"""
+    print(f"\n=== Warm start K-Means ({n_customers:,} pelanggan) ===")
+    previous_engine = app.AntyLaundryKMeans(backend='full')
+    rfm_previous = previous_engine.normalize_data(make_rfm(n_customers, seed=1))
+    previous_engine.run_kmeans(rfm_previous)
+    memory = app.CentroidMemory(path=os.path.join(tempfile.mkdtemp(), 'centroids.parquet'))
+    memory.put('bulan lalu', previous_engine, {})
+    
+    # Data bulan ini: pelanggan & nilai sedikit berbeda dari run sebelumnya
+    rfm = make_rfm(n_customers, seed=2)
+    for warm in (False, True):
+        engine = app.AntyLaundryKMeans(backend='full')
+        engine.previous = memory.get('bulan lalu') if warm else None
+        engine.normalize_data(rfm.copy())
+        X = engine.scaler.transform(rfm[['Recency', 'Frequency', 'Monetary']])
+        _, inertia, _ = engine.fit_clusters(X)
+        stats = engine.fit_stats
+        print(f"{'warm' if warm else 'cold'} start: {stats['seconds']:.2f}s, {stats['n_iter']} iterasi, inertia {inertia:,.0f}")
+
+
+def bench_assign(n_customers=200000):
+    """Refit (scaler + K-Means + label) vs assign dengan artefak model tersimpan"""
+    print(f"\n=== Refit vs assign model tersimpan ({n_customers:,} pelanggan) ===")
+    registry = app.ModelRegistry(path=tempfile.mkdtemp())
+    
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm, labels = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers, seed=1))))
+    version = registry.save(engine.export_model(labels))
+    
+    new_rfm = make_rfm(n_customers, seed=2)
+    
+    def refit():
+        engine = app.AntyLaundryKMeans(backend='full')
+        return engine.label_clusters(engine.run_kmeans(engine.normalize_data(new_rfm.copy())))
+    
+    refit_time, _ = best_time(refit, repeat=1)
+    artifact = registry.load(version)
+    assign_time, _ = best_time(lambda: app.AntyLaundryKMeans().assign_clusters(new_rfm.copy(), artifact))
+    load_time, _ = best_time(lambda: registry.load(version))
+    print(f"refit: {refit_time:.2f}s  assign v{version}: {assign_time * 1000:.0f} ms (+ muat artefak {load_time * 1000:.0f} ms)  "
+          f"speedup {refit_time / assign_time:.0f}x")
+
+
+def bench_bootstrap(n_customers=100000, n_runs=20):
+    """Uji stabilitas bootstrap: serial vs paralel (warm start dari centroid acuan) vs refit dingin"""
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm = engine.run_kmeans(engine.normalize_data(make_rfm(n_customers)))
+    X = rfm[['Recency_scaled', 'Frequency_scaled', 'Monetary_scaled']].to_numpy()
+    
+    print(f"\n=== Bootstrap stabilitas ({n_customers:,} pelanggan, {n_runs} resample, {os.cpu_count()} CPU) ===")
+    rng = np.random.default_rng(0)
+    cold_time, _ = best_time(lambda: app.AntyLaundryKMeans(backend='full').fit_clusters(X[rng.integers(0, len(X), len(X))]), repeat=1)
+    print(f"refit dingin (n_init=10) per resample: {cold_time:.2f}s → {n_runs} resample ≈ {cold_time * n_runs:.1f}s")
+    
+    for jobs in (1, -1):
+        app.PARALLEL_JOBS = jobs
+        run_time, (confidence, clusters) = best_time(lambda: engine.bootstrap_stability(rfm, n_runs=n_runs), repeat=1)
+        print(f"n_jobs={jobs:>2} warm start: {run_time:.2f}s  keyakinan rata-rata {confidence.mean():.3f}  "
+              f"Jaccard {np.round(clusters['Jaccard'].to_numpy(), 3).tolist()}")
+
+
+def legacy_labels(rfm_df, cluster_labels):
+    """Labeling lama: enam kolom per pelanggan lewat map lambda per baris"""
+    for column, key in [('Segment', 'name'), ('Icon', 'icon'), ('Discount', 'discount'), ('Priority', 'priority'),
+                        ('Description', 'description'), ('Criteria', 'criteria')]:
+        rfm_df[column] = rfm_df['Cluster'].map(lambda x: cluster_labels[x][key])
+    return rfm_df
+
+
+def bench_labels(n_customers=500000):
+    """Labeling segmen: enam map lambda per baris vs kode cluster kategorikal + katalog"""
+    print(f"\n=== Labeling segmen ({n_customers:,} pelanggan) ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm = engine.run_kmeans(engine.normalize_data(make_rfm(n_customers)))
+    _, labels = engine.label_clusters(rfm.copy())
+    base = rfm[['Konsumen', 'Cluster']]
+    
+    legacy_time, legacy = best_time(lambda: legacy_labels(base.copy(), labels))
+    new_time, new = best_time(lambda: engine.label_clusters(base.join(rfm[['Recency', 'Frequency', 'Monetary']]))[0])
+    legacy_mb = legacy.drop(columns=base.columns).memory_usage(deep=True).sum() / 1e6
+    new_mb = new[['Segment']].memory_usage(deep=True).sum() / 1e6
+    same = (legacy['Segment'].to_numpy() == new['Segment'].astype(str).to_numpy()).all() and \
+        (legacy['Discount'].to_numpy() == app.segment_attribute(new, labels, 'discount').to_numpy()).all()
+    print(f"lambda map: {legacy_time:.2f}s ({legacy_mb:.0f} MB kolom label)  "
+          f"kategorikal: {new_time:.2f}s ({new_mb:.1f} MB)  speedup {legacy_time / new_time:.1f}x  sama: {same}")
+
+
+def legacy_top_n(rfm_df, n):
+    """TOP-N lama: nlargest berulang + anti-join isin + concat"""
+    top = rfm_df[rfm_df['Segment'].isin(['VIP Customer', 'Top Spender'])].nlargest(n, 'Monetary')
+    if len(top) < n:
+        top = pd.concat([top, rfm_df[rfm_df['Segment'] == 'High Value Customer'].nlargest(n - len(top), 'Monetary')])
+    if len(top) < n:
+        top = pd.concat([top, rfm_df[~rfm_df['Konsumen'].isin(top['Konsumen'])].nlargest(n - len(top), 'Monetary')])
+    return top.head(n)
+
+
+def bench_campaign(n_customers=500000, n=5000):
+    """Pemilihan kampanye top-N: nlargest berulang vs partial selection (argpartition)"""
+    print(f"\n=== Kampanye top-{n:,} dari {n_customers:,} pelanggan ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm, labels = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers))))
+    
+    legacy_time, legacy = best_time(lambda: legacy_top_n(rfm, n))
+    new_time, new = best_time(lambda: app.select_campaign(rfm, labels, n=n))
+    print(f"nlargest + isin + concat: {legacy_time * 1000:.0f} ms  argpartition: {new_time * 1000:.0f} ms  "
+          f"speedup {legacy_time / new_time:.1f}x  sama: {legacy.index.equals(new.index)}")
+    
+    quotas = {'Pelanggan Tidak Aktif': n // 10, 'Pelanggan Reguler': n // 5}
+    for rank_by in app.RANKING_KEYS:
+        run_time, campaign = best_time(lambda: app.select_campaign(rfm, labels, n=n, quotas=quotas, rank_by=rank_by))
+        print(f"kuota {quotas}, ranking {rank_by}: {run_time * 1000:.0f} ms ({len(campaign):,} penerima)")
+
+
+def bench_scatter(sizes=(50000, 500000)):
+    """Scatter 3D: px.scatter_3d semua titik vs sampel per segmen / bin kepadatan (waktu & ukuran JSON figure)"""
+    print("\n=== Scatter 3D RFM (waktu bangun + serialisasi, ukuran payload JSON) ===")
+    for n_customers in sizes:
+        engine = app.AntyLaundryKMeans(backend='full')
+        rfm, _ = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers))))
+        
+        def legacy():
+            return px.scatter_3d(rfm, x='Recency', y='Frequency', z='Monetary', color='Segment', hover_data=['Konsumen']).to_json()
+        
+        results = [('semua titik (lama)', *best_time(legacy, repeat=1))]
+        for mode in app.SCATTER_MODES:
+            results.append((mode, *best_time(lambda: app.create_rfm_3d_scatter(rfm, mode=mode).to_json(), repeat=1)))
+        print(f"{n_customers:,} pelanggan: " + "  ".join(f"{name}: {run_time:.2f}s {len(payload) / 1e3:,.0f} KB" for name, run_time, payload in results))
+
+
+def bench_cluster_views(n_customers=500000):
+    """Detail segmen: filter + mean + sort penuh per cluster tiap rerun vs satu pass + halaman cluster yang dibuka"""
+    print(f"\n=== Detail per segmen ({n_customers:,} pelanggan) ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm = engine.run_kmeans(engine.normalize_data(make_rfm(n_customers)))
+    
+    def legacy():
+        for cluster_id in sorted(rfm['Cluster'].unique()):
+            cluster_data = rfm[rfm['Cluster'] == cluster_id]
+            _ = cluster_data['Recency'].mean(), cluster_data['Frequency'].mean(), cluster_data['Monetary'].mean()
+            cluster_data[['Konsumen', 'Recency', 'Frequency', 'Monetary']].sort_values('Monetary', ascending=False)
+    
+    legacy_time, _ = best_time(legacy)
+    views_time, views = best_time(lambda: app.cluster_views(rfm))
+    cluster = int(views['stats']['Count'].idxmax())
+    open_time, _ = best_time(lambda: app.cluster_page(rfm, app.cluster_views(rfm), cluster, 0))
+    print(f"per rerun lama: {legacy_time * 1000:.0f} ms (+ kirim {n_customers:,} baris)  "
+          f"satu pass per hasil: {views_time * 1000:.0f} ms  buka cluster terbesar: {(open_time - views_time) * 1000:.0f} ms "
+          f"(+ kirim {app.CLUSTER_PAGE_SIZE} baris)")
+
+
+def legacy_excel(rfm_df, top_10, cluster_summary):
+    """Export Excel lama: ExcelWriter openpyxl + to_excel, workbook penuh di memori"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        top_10.rename(columns=app.CUSTOMER_EXPORT_COLUMNS)[list(app.CUSTOMER_EXPORT_COLUMNS.values())].to_excel(
+            writer, sheet_name='Top 10 Pelanggan', index=False)
+        rfm_df.rename(columns=app.CUSTOMER_EXPORT_COLUMNS)[list(app.CUSTOMER_EXPORT_COLUMNS.values())].to_excel(
+            writer, sheet_name='Semua Pelanggan', index=False)
+        cluster_summary.to_excel(writer, sheet_name='Ringkasan Cluster', index=False)
+    output.seek(0)
+    return output
+
+
+def peak_memory(func):
+    """Puncak alokasi memori Python (MB) selama func() berjalan"""
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def peak_rss(func):
+    """Puncak RSS tambahan (MB) selama func() berjalan, diukur di proses anak (fork)
+
+    Berbeda dengan tracemalloc, ikut menghitung buffer Arrow (kolom teks pandas) & numpy.
+    """
+    def child(conn):
+        with open('/proc/self/statm') as statm:
+            start = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        func()
+        conn.send(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - start)
+    
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.get_context('fork').Process(target=child, args=(sender,))
+    process.start()
+    peak = receiver.recv()
+    process.join()
+    return peak / 1e6
+
+
+def bench_excel(n_customers=200000):
+    """Laporan Excel: ExcelWriter + to_excel vs openpyxl write-only per potongan (waktu & puncak memori)"""
+    print(f"\n=== Laporan Excel ({n_customers:,} pelanggan) ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm, labels = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers))))
+    top_10 = engine.get_top_10_customers(rfm)
+    
+    def legacy():
+        return legacy_excel(rfm.assign(Discount=app.segment_attribute(rfm, labels, 'discount')), top_10,
+                            app.segment_summary(rfm, labels))
+    
+    for name, func in [('ExcelWriter (lama)', legacy), ('write-only', lambda: app.export_to_excel(rfm, top_10, labels))]:
+        run_time, output = best_time(func, repeat=1)
+        print(f"{name}: {run_time:.2f}s  puncak memori {peak_memory(func):.0f} MB  file {len(output.getvalue()) / 1e6:.1f} MB")
+
+
+def bench_bundle(n_customers=200000, n_rows=2000000):
+    """Paket data zip (Parquet + CSV.gz) per potongan ke file sementara: waktu, puncak memori penulisan & ukuran
+
+    Ukuran zip = memori yang dipakai st.download_button saat paket diunduh (dibaca utuh ke media store).
+    """
+    print(f"\n=== Paket data zip ({n_customers:,} pelanggan, {n_rows:,} transaksi) ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm, labels = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers))))
+    transactions = make_transactions(n_rows)
+    
+    run_time, output = best_time(lambda: app.export_bundle(rfm, labels, transactions), repeat=1)
+    sizes = {info.filename: info.file_size / 1e6 for info in zipfile.ZipFile(output).infolist()}
+    print(f"{run_time:.2f}s  puncak memori penulisan {peak_memory(lambda: app.export_bundle(rfm, labels, transactions).close()):.0f} MB  "
+          f"zip {sum(sizes.values()):.1f} MB: " + ", ".join(f"{name} {size:.1f} MB" for name, size in sizes.items()))
+    in_memory = rfm.memory_usage(deep=True).sum() / 1e6 + transactions.memory_usage(deep=True).sum() / 1e6
+    print(f"(data di memori: {in_memory:.0f} MB; saat diunduh zip {sum(sizes.values()):.1f} MB dimuat utuh ke media store)")
+
+
+def legacy_whatsapp(customers):
+    """Pesan lama: iterrows + f-string + quote per pesan"""
+    rows = []
+    for _, row in customers.iterrows():
+        message = f"Halo Kak {row['Konsumen']} 👋\n\n"
+        message += f"Terima kasih sudah jadi pelanggan {row['Segment']} Anty Laundry 🙏\n"
+        message += f"Khusus untuk Kakak, ada diskon {row['Discount']}% untuk order berikutnya.\n"
+        message += f"Total belanja Kakak: Rp {row['Monetary']:,.0f} ({row['Frequency']}x order)\n"
+        rows.append((row['Konsumen'], message, f"https://wa.me/?text={quote(message)}"))
+    return pd.DataFrame(rows, columns=['Konsumen', 'Pesan', 'Link'])
+
+
+def bench_whatsapp(n_customers=50000):
+    """Pesan WhatsApp massal: iterrows + quote per pesan vs template dikompilasi sekali"""
+    print(f"\n=== Pesan WhatsApp ({n_customers:,} penerima) ===")
+    engine = app.AntyLaundryKMeans(backend='full')
+    rfm, labels = engine.label_clusters(engine.run_kmeans(engine.normalize_data(make_rfm(n_customers))))
+    campaign = app.select_campaign(rfm, labels, n=n_customers)
+    template = ("Halo Kak {nama} 👋\n\nTerima kasih sudah jadi pelanggan {segmen} Anty Laundry 🙏\n"
+                "Khusus untuk Kakak, ada diskon {diskon}% untuk order berikutnya.\n"
+                "Total belanja Kakak: Rp {total:,.0f} ({frekuensi}x order)\n")
+    
+    legacy_time, legacy = best_time(lambda: legacy_whatsapp(campaign), repeat=1)
+    compiled_time, compiled = best_time(lambda: app.build_whatsapp_messages(campaign, template))
+    assert legacy['Link'].tolist() == compiled['Link'].tolist()
+    print(f"iterrows (lama): {legacy_time:.2f}s  template dikompilasi: {compiled_time:.2f}s  "
+          f"({legacy_time / compiled_time:.0f}x, {n_customers / compiled_time:,.0f} pesan/s)")
+
+
+def baseline_clean(raw, months_back):
+    """load_and_clean_data versi awal (sebelum optimasi): to_datetime tanpa format, filter per langkah
+
+    `raw` = DataFrame hasil pd.read_csv export (nama kolom asli). `months_back=None` = tanpa filter periode.
+    """
+    df = raw.copy().rename(columns=STREAM_COLUMNS)
+    df['Tanggal'] = pd.to_datetime(df['Tanggal'], errors='coerce')
+    df = df.dropna(subset=['Tanggal'])
+    if months_back is not None:
+        df = df[df['Tanggal'] > df['Tanggal'].max() - pd.Timedelta(days=30 * months_back)]
+    df['Total_Harga'] = pd.to_numeric(df['Total_Harga'], errors='coerce')
+    df = df[df['Total_Harga'] > 0]
+    df['Konsumen'] = df['Konsumen'].astype(str).str.strip()
+    return df.dropna(subset=['Total_Harga', 'Konsumen'])
+
+
+def baseline_rfm(raw, months_back):
+    """Jalur awal (sebelum optimasi): seluruh export di memori, bersihkan, lalu groupby RFM penuh"""
+    df = baseline_clean(raw, months_back)
+    return legacy_rfm(df, df['Tanggal'].max())
+
+
+STREAM_COLUMNS = {'Tanggal Ambil': 'Tanggal', 'Konsumen': 'Konsumen', 'Total Harga': 'Total_Harga', 'No Nota': 'No_Invoice'}
+
+
+def bench_stream(n_rows=1000000, months_back=12):
+    """Mode streaming vs jalur awal (baca CSV utuh + load_and_clean_data awal + groupby): waktu & puncak RSS"""
+    print(f"\n=== Streaming RFM ({n_rows:,} baris, periode {months_back} bulan) ===")
+    raw = make_transactions(n_rows).astype(str).rename(columns={target: col for col, target in STREAM_COLUMNS.items()})
+    engine = app.AntyLaundryKMeans()
+    
+    with tempfile.TemporaryDirectory() as path:
+        csv_path = os.path.join(path, 'export.csv')
+        raw.to_csv(csv_path, index=False)
+        del raw
+        
+        def baseline():
+            return baseline_rfm(pd.read_csv(csv_path), months_back)
+        
+        def stream():
+            return engine.stream_rfm(lambda: app.iter_file_chunks(csv_path, csv_path), months_back=months_back)[0]
+        
+        baseline_time, expected = best_time(baseline, repeat=1)
+        stream_time, rfm = best_time(stream, repeat=1)
+        same = (expected.sort_values('Konsumen')[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy() ==
+                rfm[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy()).all()
+        print(f"awal (file utuh + groupby): {baseline_time:.2f}s  puncak RSS {peak_rss(baseline):.0f} MB")
+        print(f"streaming per pelanggan: {stream_time:.2f}s  puncak RSS {peak_rss(stream):.0f} MB  "
+              f"({len(rfm):,} pelanggan, hasil sama: {same})")
+
+
+def bench_rfm_state(state_sizes=(200000, 2000000), batch_rows=10000):
+    """Agregat RFM inkremental: update + save satu batch kecil vs hitung ulang penuh jalur awal
+
+    Pembanding = baseline_rfm atas seluruh riwayat + batch (export sudah di memori, waktu baca
+    file tidak ikut dihitung).
+    """
+    print(f"\n=== RFMState: update + save batch {batch_rows:,} baris ===")
+    batch_df = make_transactions(batch_rows, seed=7)
+    
+    for n_rows in state_sizes:
+        history = make_transactions(n_rows)
+        raw = pd.concat([history, batch_df]).astype(str).rename(columns={target: col for col, target in STREAM_COLUMNS.items()})
+        baseline_time, expected = best_time(lambda: baseline_rfm(raw, None), repeat=1)
+        
+        with tempfile.TemporaryDirectory() as path:
+            state = app.RFMState(path=path)
+            state.update(history)
+            state.save()
+            
+            state = app.RFMState(path=path)
+            state.customers  # muat run (seperti halaman yang sudah terbuka)
+            state._load_runs('invoice_keys')
+            start = time.perf_counter()
+            state.update(batch_df)
+            state.save()
+            new_time = time.perf_counter() - start
+            
+            incremental = app.RFMState(path=path).rfm().sort_values('Konsumen')
+            same = (expected.sort_values('Konsumen')[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy() ==
+                    incremental[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy()).all()
+            print(f"riwayat {n_rows:>10,} baris ({len(incremental):,} pelanggan): hitung ulang penuh {baseline_time:.3f}s  "
+                  f"update + save {new_time:.3f}s  hasil sama: {same}")
+    
+    # Export tanpa kolom nota (di penyimpanan No_Invoice = None): Frequency = jumlah baris, sama dengan hitung ulang penuh
+    df = make_transactions(5 * batch_rows).drop(columns='No_Invoice')
+    with tempfile.TemporaryDirectory() as path:
+        state = app.RFMState(path=path)
+        for start in range(0, len(df), batch_rows):
+            state.update(df.iloc[start:start + batch_rows].assign(No_Invoice=None))
+        reference_date = df['Tanggal'].max()
+        full = app.rfm_kernel(df, reference_date)
+        full = full.assign(Konsumen=full['Konsumen'].astype(str)).sort_values('Konsumen')
+        incremental = state.rfm(reference_date).sort_values('Konsumen')
+        same = (full[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy() ==
+                incremental[['Konsumen', 'Recency', 'Frequency', 'Monetary']].to_numpy()).all()
+        print(f"tanpa kolom nota ({len(df):,} baris, {len(full):,} pelanggan): hasil sama dengan hitung ulang penuh: {same}")
+
+
+BENCHMARKS = {
+    'dates': bench_dates,
+    'rfm': bench_rfm,
+    'windows': bench_windows,
+    'stream': bench_stream,
+    'snapshots': bench_snapshots,
+    'rfmstate': bench_rfm_state,
+    'kmeans': bench_kmeans,
+    'autok': bench_auto_k,
+    'warmstart': bench_warm_start,
+    'assign': bench_assign,
+    'bootstrap': bench_bootstrap,
+    'labels': bench_labels,
+    'campaign': bench_campaign,
+    'scatter': bench_scatter,
+    'clusterviews': bench_cluster_views,
+    'excel': bench_excel,
+    'bundle': bench_bundle,
+    'whatsapp': bench_whatsapp,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('names', nargs='*', choices=[[]] + list(BENCHMARKS), help="Benchmark yang dijalankan")
+    args = parser.parse_args()
+    
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()